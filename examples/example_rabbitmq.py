@@ -1,6 +1,5 @@
 import asyncio
 import datetime
-import hashlib
 import json
 import logging
 import os
@@ -10,7 +9,10 @@ from typing import Optional
 
 from voltronsecurity import helpers
 from voltronsecurity.voltron_rabbitmq import VoltronRabbitMQQueue
+from voltronsecurity.voltron_retry import VoltronRetryPolicy
+from voltronsecurity.voltron_fingerprint import VoltronFingerprint
 from voltronsecurity.voltron_postgres import VoltronDB, VoltronPostgres
+from voltronsecurity.voltron_severity import VoltronSeverityEngine
 from voltronsecurity.voltron_base import (
     VoltronBaseProcessResponse,
     VoltronBaseQueryInterface,
@@ -35,6 +37,21 @@ DST_DB_PASSWORD = os.getenv("DST_DB_PASSWORD")
 DST_DB_NAME = os.getenv("DST_DB_NAME")
 DST_DB_TABLE = os.getenv("DST_DB_TABLE")
 
+# The API doesn't return finding ids, so each log entry is fingerprinted.
+# Pass fields=["source", "destination", "port"] to merge repeats of the same connection instead.
+FINDING_ID = VoltronFingerprint(namespace="TotallyLegitSiteNetConns")
+
+# Severity upgrades are declared once and applied to each batch of findings
+SEVERITY_ENGINE = VoltronSeverityEngine(
+    [
+        {
+            "name": "rdp-connection",
+            "when": {"toolName": "TotallyLegitSiteNetConns", "toolFindingJson.port": 3389},
+            "upgrade": "HIGH",
+        }
+    ]
+)
+
 sample_messages = [
     {
         "handlerName": "TotallyLegitSiteQueryHandler",
@@ -70,32 +87,20 @@ class TotallyLegitNetConnFinding(VoltronFinding):
             "resourceType": "host",
             "resourceId": payload["source"],
             # We're generating our own finding id, because the API doesn't give you one
-            "toolFindingId": self._get_finding_id(payload),
+            "toolFindingId": FINDING_ID(payload),
             "toolFindingSummary": "Suspicious network connection from {} to {}".format(
                 payload["source"], payload["destination"]
             ),
             "toolFindingJson": json.dumps(payload),
             "toolFindingURL": "NotSet",
             "toolFindingSeverity": "NotSet",
-            # We can create our own function to change severity here, although the preference would be to perform the upgrade elsewhere
-            "voltronSeverity": self._get_finding_severity(payload),
+            # SEVERITY_ENGINE sets the real value for the whole batch in process_results
+            "voltronSeverity": "NotSet",
             "extractDate": helpers.get_time(),
             "findingDate": datetime.datetime.fromtimestamp(payload["time"]).isoformat(),
         }
         return results
 
-    def _get_finding_id(self, payload: dict) -> str:
-        json_data = json.dumps(payload, sort_keys=True)
-        sha256_hash = hashlib.sha256(json_data.encode()).hexdigest()
-        return sha256_hash
-
-    def _get_finding_severity(self, payload: dict) -> str:
-        response = "NotSet"
-        if payload["port"] == 3389:
-            logger.warning("Upgrading severity of finding.\n{}".format(payload))
-            response = "High"
-        return response
-
 
 class TotallyLegitSiteQueryHandler(VoltronBaseQueryInterface):
     """Example Query Handler for getting responses from https://interview.totallylegitsite.com"""
@@ -144,6 +149,7 @@ class TotallyLegitSiteQueryHandler(VoltronBaseQueryInterface):
         finding_list = []
         for entry in results["data"].get("logs", []):
             finding_list.append(TotallyLegitNetConnFinding(entry))
+        SEVERITY_ENGINE.apply(finding_list)
         results = {
             "success": True,
             "message": "",
@@ -195,19 +201,24 @@ class TotallyLegitSiteQueueHandler(VoltronRabbitMQQueue):
                 logger.error(e)
                 response["message"] = "Error : {}".format(e)
         if response["success"]:
-            # Super important. You must acknowledge the message or it will return to the queue
-            ch.basic_ack(delivery_tag=method.delivery_tag)
             logger.info(response)
         else:
             logger.error(response)
+        # The queue has a retry policy, so it acks successes and retries failures itself.
+        # Without one, process_message is the raw pika callback and must call ch.basic_ack.
+        return response
 
 
 if __name__ == "__main__":
     logger.setLevel(logging.ERROR)
 
     logger.error("Creating Handlers\n")
-    srcq_handler = TotallyLegitSiteQueueHandler(SRC_QUEUE_NAME, SRC_QUEUE_HOST, {})
-    dstq_handler = TotallyLegitSiteQueueHandler(DST_QUEUE_NAME, DST_QUEUE_HOST, {})
+    srcq_handler = TotallyLegitSiteQueueHandler(
+        SRC_QUEUE_NAME, SRC_QUEUE_HOST, {}, retry_policy=VoltronRetryPolicy()
+    )
+    dstq_handler = TotallyLegitSiteQueueHandler(
+        DST_QUEUE_NAME, DST_QUEUE_HOST, {}, retry_policy=VoltronRetryPolicy()
+    )
 
     query_handler = TotallyLegitSiteQueryHandler()
 
@@ -1,4 +1,5 @@
 import datetime
+import importlib
 
 UNKNOWN_DATE = datetime.datetime.strptime(
     "20/04/1969 16:20:00", "%d/%m/%Y %H:%M:%S"
@@ -7,3 +8,18 @@ UNKNOWN_DATE = datetime.datetime.strptime(
 
 def get_time():
     return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+def import_optional(module_name, extra):
+    """Import a dependency that ships with one of the package extras.
+    Raises an ImportError naming the extra to install when it is missing:
+    requests = import_optional("requests", "snyk")
+    """
+    try:
+        return importlib.import_module(module_name)
+    except ImportError as e:
+        raise ImportError(
+            "{} is required for this feature. Install it with: pip install voltronsecurity[{}]".format(
+                module_name, extra
+            )
+        ) from e
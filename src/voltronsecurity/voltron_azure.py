@@ -6,27 +6,50 @@ from voltronsecurity.voltron_base import (
 import logging
 import json
 import asyncio
+import datetime
 import os
 import time
 
-from typing import Optional
+from typing import Optional, TYPE_CHECKING
 
 from azure.servicebus.aio import ServiceBusClient
 from azure.servicebus import ServiceBusMessage
-from azure.identity.aio import DefaultAzureCredential
+from azure.servicebus.exceptions import MessageSizeExceededError
+
+from voltronsecurity.helpers import import_optional
+from voltronsecurity.voltron_retry import (
+    ATTEMPT_HEADER,
+    VoltronRetryPolicy,
+    get_attempt,
+)
+from voltronsecurity.voltron_tracing import restore_context, trace_headers
+
+if TYPE_CHECKING:
+    from azure.identity.aio import DefaultAzureCredential
 
-FORMAT = "[%(filename)s:%(lineno)s - %(funcName)s() ] %(message)s"
-logging.basicConfig(format=FORMAT)
 logger = logging.getLogger("voltron")
 
 
+def __getattr__(name):
+    # azure-identity pulls in msal and cryptography. Only load it for callers
+    # that actually use DefaultAzureCredential (SAS/connection-string workers don't).
+    if name == "DefaultAzureCredential":
+        return import_optional("azure.identity.aio", "azure").DefaultAzureCredential
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
 class VoltronAzureServiceBusQueue(VoltronBaseMessageInterface):
     def __init__(
-        self, queue_name: str, namespace: str, credential: DefaultAzureCredential
+        self,
+        queue_name: str,
+        namespace: str,
+        credential: "DefaultAzureCredential",
+        retry_policy: Optional[VoltronRetryPolicy] = None,
     ):
         self.queue_name = queue_name
         self.namespace = namespace
         self.creds = credential
+        self.retry_policy = retry_policy
 
     def get_client(
         self, namespace: Optional[str] = None, creds: Optional[str] = None
@@ -57,15 +80,67 @@ class VoltronAzureServiceBusQueue(VoltronBaseMessageInterface):
                 )
                 for msg in received:
                     logger.debug(str(msg))
-                    resp = await self.process_message(json.loads(str(msg)))
+                    resp = await self.process_message(
+                        restore_context(json.loads(str(msg)), msg.application_properties)
+                    )
                     results.append(resp)
                     if resp["success"]:
                         await receiver.complete_message(msg)
+                    elif self.retry_policy is not None:
+                        await self.retry_message(
+                            client, receiver, msg, resp["message"], queue
+                        )
                     else:
                         continue
         await self.creds.close()
         return results
 
+    async def retry_message(
+        self,
+        client: ServiceBusClient,
+        receiver,
+        msg,
+        reason: str,
+        queue: Optional[str] = None,
+    ):
+        """Schedule a copy of a failed message after the policy delay and complete the original,
+        or dead-letter it once the policy runs out of attempts.
+        """
+        if queue is None:
+            queue = self.queue_name
+        attempt = get_attempt(msg.application_properties)
+        if not self.retry_policy.should_retry(attempt):
+            logger.warning("Attempt {} failed. Dead-lettering message.".format(attempt))
+            await receiver.dead_letter_message(
+                msg, reason="MaxAttemptsExceeded", error_description=reason[:1024]
+            )
+            return
+        delay = self.retry_policy.delay_for(attempt)
+        # Received properties may have byte keys; normalise them so the bumped attempt
+        # replaces the old counter instead of sitting next to it
+        properties = {
+            (k.decode() if isinstance(k, bytes) else k): v
+            for k, v in (msg.application_properties or {}).items()
+        }
+        properties[ATTEMPT_HEADER] = attempt + 1
+        retry = ServiceBusMessage(
+            body=str(msg),
+            content_type=msg.content_type or "application/json",
+            correlation_id=msg.correlation_id,
+            subject=msg.subject,
+            application_properties=properties,
+        )
+        enqueue_time = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+            seconds=delay
+        )
+        logger.warning(
+            "Attempt {} failed. Retrying in {}s.".format(attempt, delay)
+        )
+        sender = client.get_queue_sender(queue_name=queue)
+        async with sender:
+            await sender.schedule_messages(retry, enqueue_time)
+        await receiver.complete_message(msg)
+
     async def process_message(
         self, message: VoltronMessagePayload
     ) -> VoltronBaseProcessResponse:
@@ -98,6 +173,17 @@ class VoltronAzureServiceBusQueue(VoltronBaseMessageInterface):
         )
         return message
 
+    def _to_servicebus(self, message: VoltronMessagePayload) -> ServiceBusMessage:
+        servicebus_message = self.generate_message(
+            message["handlerName"],
+            message["handlerConfig"],
+            message["handlerData"],
+            message["messageSource"],
+            message["startTime"],
+        )
+        servicebus_message.application_properties = trace_headers(message) or None
+        return servicebus_message
+
     async def send_message(
         self,
         message: VoltronMessagePayload,
@@ -108,14 +194,7 @@ class VoltronAzureServiceBusQueue(VoltronBaseMessageInterface):
             queue = self.queue_name
         if client is None:
             client = self.get_client()
-        servicebus_message = self.generate_message(
-            message["handlerName"],
-            message["handlerConfig"],
-            message["handlerData"],
-            message["messageSource"],
-            message["startTime"],
-        )
-        message_list = [servicebus_message]
+        message_list = [self._to_servicebus(message)]
         async with client:
             sender = client.get_queue_sender(queue_name=queue)
             async with sender:
@@ -129,3 +208,101 @@ class VoltronAzureServiceBusQueue(VoltronBaseMessageInterface):
                     response = {"success": False, "message": str(e)}
 
         return response
+
+    async def _pack_batches(self, sender, messages: list, failures: list) -> list:
+        """Pack (index, ServiceBusMessage) pairs into as few size-limited batches as possible.
+        Returns [(ServiceBusMessageBatch, [indexes])].
+        """
+        batches = []
+        batch = await sender.create_message_batch()
+        indexes = []
+        for index, servicebus_message in messages:
+            try:
+                batch.add_message(servicebus_message)
+                indexes.append(index)
+                continue
+            except MessageSizeExceededError:
+                if not indexes:
+                    failures.append({"index": index, "message": "Message exceeds batch size limit"})
+                    continue
+            batches.append((batch, indexes))
+            batch = await sender.create_message_batch()
+            indexes = []
+            try:
+                batch.add_message(servicebus_message)
+                indexes.append(index)
+            except MessageSizeExceededError:
+                failures.append({"index": index, "message": "Message exceeds batch size limit"})
+        if indexes:
+            batches.append((batch, indexes))
+        return batches
+
+    async def send_messages(
+        self,
+        messages: list[VoltronMessagePayload],
+        client: Optional[ServiceBusClient] = None,
+        queue: Optional[str] = None,
+        max_concurrency: int = 4,
+    ) -> VoltronBaseProcessResponse:
+        """Send many messages over one client connection.
+        Messages are packed into ServiceBusMessageBatch objects up to the queue's size limit, and
+        batches are sent concurrently on max_concurrency senders. A failed batch reports every
+        message in it; data["failures"] lists {"index", "message"} for each failed message.
+        """
+        if queue is None:
+            queue = self.queue_name
+        if client is None:
+            client = self.get_client()
+
+        failures = []
+        prepared = []
+        for index, message in enumerate(messages):
+            try:
+                prepared.append((index, self._to_servicebus(message)))
+            except Exception as e:
+                failures.append({"index": index, "message": str(e)})
+
+        sent = set()
+        async with client:
+            senders = [
+                client.get_queue_sender(queue_name=queue)
+                for _ in range(max(1, max_concurrency))
+            ]
+            try:
+                batches = await self._pack_batches(senders[0], prepared, failures)
+                pending = list(reversed(batches))
+
+                async def send_batches(sender):
+                    while pending:
+                        batch, indexes = pending.pop()
+                        try:
+                            await sender.send_messages(batch)
+                        except Exception as e:
+                            logger.error(
+                                "Failed to send batch of {} messages: {}".format(len(indexes), e)
+                            )
+                            failures.extend({"index": x, "message": str(e)} for x in indexes)
+                            continue
+                        sent.update(indexes)
+
+                await asyncio.gather(*[send_batches(x) for x in senders[: len(batches)]])
+            except Exception as e:
+                logger.error(e)
+                # Batches already delivered must not be reported, or callers would resend them
+                done = sent | {x["index"] for x in failures}
+                failures.extend(
+                    {"index": x, "message": str(e)} for x, _ in prepared if x not in done
+                )
+            finally:
+                for sender in senders:
+                    await sender.close()
+
+        failures.sort(key=lambda x: x["index"])
+        response = {
+            "success": len(failures) == 0,
+            "message": "Sent {} of {} messages".format(
+                len(messages) - len(failures), len(messages)
+            ),
+            "data": {"failures": failures},
+        }
+        return response
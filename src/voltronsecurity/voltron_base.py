@@ -1,10 +1,9 @@
 import datetime
+import inspect
 import json
 import logging
 import typing
 
-FORMAT = "[%(filename)s:%(lineno)s - %(funcName)s() ] %(message)s"
-logging.basicConfig(format=FORMAT)
 logger = logging.getLogger("voltron")
 
 UNKNOWN_DATE = datetime.datetime.strptime(
@@ -76,6 +75,27 @@ class VoltronBaseMessageInterface:
         """Override in child class to send the message"""
         pass
 
+    async def send_messages(
+        self, messages: list[VoltronMessagePayload], *args, **kwargs
+    ) -> VoltronBaseProcessResponse:
+        """Send several messages one at a time. Override in child class to send them in bulk.
+        data["failures"] lists the index and error of every message that was not sent.
+        """
+        failures = []
+        for index, message in enumerate(messages):
+            response = self.send_message(message, *args, **kwargs)
+            if inspect.isawaitable(response):
+                response = await response
+            if not response["success"]:
+                failures.append({"index": index, "message": response["message"]})
+        return {
+            "success": len(failures) == 0,
+            "message": "Sent {} of {} messages".format(
+                len(messages) - len(failures), len(messages)
+            ),
+            "data": {"failures": failures},
+        }
+
 
 class VoltronBaseQueryInterface:
     def run_query(
@@ -0,0 +1,111 @@
+import hashlib
+import json
+
+from typing import Iterable, Optional
+
+BLOB_REF_KEY = "$voltronBlob"
+
+
+def encode_json(value) -> str:
+    """Canonical JSON encoding used for blob hashing"""
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def blob_hash(value) -> str:
+    return hashlib.blake2b(encode_json(value).encode(), digest_size=20).hexdigest()
+
+
+def load_finding_json(value):
+    """Decode a toolFindingJson value exactly once. Text is parsed; values the driver has
+    already decoded (psycopg2 returns JSONB as Python objects) are returned as they are.
+    """
+    if isinstance(value, (str, bytes)):
+        return json.loads(value)
+    return value
+
+
+def finding_document(value):
+    """The document in a findingOutput toolFindingJson value.
+    findingOutput encodes toolFindingJson, and findings such as VoltronWizFinding already hold
+    encoded text there, so an object or array encoded one level down is unwrapped.
+    Any other string document is kept as it is.
+    """
+    document = load_finding_json(value)
+    if isinstance(document, str):
+        try:
+            inner = json.loads(document)
+        except ValueError:
+            return document
+        if isinstance(inner, (dict, list)):
+            return inner
+    return document
+
+
+def is_blob_ref(value) -> bool:
+    return isinstance(value, dict) and len(value) == 1 and BLOB_REF_KEY in value
+
+
+def split_document(
+    document: dict, paths: Optional[Iterable[str]] = None, min_bytes: int = 256
+) -> tuple[dict, dict]:
+    """Move sub-documents out of a finding document into content-addressed blobs.
+    paths lists dotted keys to move (e.g. "entitySnapshot"). Without paths, every top-level
+    dict or list value that encodes to at least min_bytes is moved.
+    Returns (document with {"$voltronBlob": hash} references, {hash: sub-document}).
+    """
+    if not isinstance(document, dict):
+        return document, {}
+    document = dict(document)
+    blobs = {}
+
+    if paths is None:
+        for key, value in document.items():
+            if isinstance(value, (dict, list)) and len(encode_json(value)) >= min_bytes:
+                digest = blob_hash(value)
+                blobs[digest] = value
+                document[key] = {BLOB_REF_KEY: digest}
+        return document, blobs
+
+    for path in paths:
+        keys = path.split(".")
+        parent = document
+        for key in keys[:-1]:
+            child = parent.get(key)
+            if not isinstance(child, dict):
+                parent = None
+                break
+            # Copy on the way down so the caller's document is left untouched
+            parent[key] = dict(child)
+            parent = parent[key]
+        if parent is None or not isinstance(parent.get(keys[-1]), (dict, list)):
+            continue
+        value = parent[keys[-1]]
+        digest = blob_hash(value)
+        blobs[digest] = value
+        parent[keys[-1]] = {BLOB_REF_KEY: digest}
+    return document, blobs
+
+
+def find_blob_refs(document) -> set[str]:
+    """Every blob hash referenced anywhere in a document"""
+    refs = set()
+    if is_blob_ref(document):
+        refs.add(document[BLOB_REF_KEY])
+    elif isinstance(document, dict):
+        for value in document.values():
+            refs.update(find_blob_refs(value))
+    elif isinstance(document, list):
+        for value in document:
+            refs.update(find_blob_refs(value))
+    return refs
+
+
+def join_document(document, blobs: dict):
+    """Replace blob references with their sub-documents"""
+    if is_blob_ref(document):
+        return join_document(blobs[document[BLOB_REF_KEY]], blobs)
+    if isinstance(document, dict):
+        return {key: join_document(value, blobs) for key, value in document.items()}
+    if isinstance(document, list):
+        return [join_document(value, blobs) for value in document]
+    return document
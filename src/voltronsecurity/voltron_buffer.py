@@ -0,0 +1,177 @@
+import asyncio
+import inspect
+import logging
+import threading
+import time
+
+from typing import Callable, Optional
+
+logger = logging.getLogger("voltron")
+
+
+def row_bytes(row: tuple) -> int:
+    """Rough size of a findingOutput row: the length of its string fields"""
+    return sum(len(x) for x in row if isinstance(x, str))
+
+
+class VoltronFindingBuffer:
+    """Write-behind buffer between queue consumers and VoltronPostgres.
+    Rows from many messages are collected and written in one transaction once max_rows,
+    max_bytes or max_age (seconds since the oldest buffered row) is reached. Each add()
+    carries the ack/nack callbacks of its message; acks only run after the flush holding that
+    message has committed, and nacks run if the flush fails, so the broker redelivers.
+
+    With a blocking pika consumer, call maybe_flush() from connection.call_later so a quiet
+    queue still flushes, and make sure prefetch allows at least max_rows worth of unacked messages.
+    Callbacks may be coroutine functions when using aadd()/aflush(). Async flushes are
+    serialized, because every write goes through the same database connection; don't mix
+    the sync and async methods on one buffer.
+    """
+
+    def __init__(
+        self,
+        db,
+        table: str,
+        max_rows: int = 5000,
+        max_bytes: int = 8 * 1024 * 1024,
+        max_age: float = 5.0,
+        onConflict: str = "DO NOTHING",
+        key_index: Optional[int] = 3,
+    ):
+        self.db = db
+        self.table = table
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.onConflict = onConflict
+        self.key_index = key_index
+        self.flushes = 0
+        self.rows_written = 0
+        self._lock = threading.RLock()
+        self._async_lock = None
+        self._reset()
+
+    def _reset(self):
+        self.rows = []
+        self.acks = []
+        self.nacks = []
+        self.bytes = 0
+        self.oldest = None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _append(self, rows, ack, nack):
+        if self.oldest is None:
+            self.oldest = time.monotonic()
+        self.rows.extend(rows)
+        self.bytes += sum(row_bytes(x) for x in rows)
+        if ack is not None:
+            self.acks.append(ack)
+        if nack is not None:
+            self.nacks.append(nack)
+
+    def due(self) -> bool:
+        if not self.rows and not self.acks:
+            return False
+        if len(self.rows) >= self.max_rows or self.bytes >= self.max_bytes:
+            return True
+        return (
+            self.oldest is not None and time.monotonic() - self.oldest >= self.max_age
+        )
+
+    def _dedupe(self, rows):
+        """Keep the last row for each key, so one INSERT never updates a row twice"""
+        if self.key_index is None:
+            return rows
+        latest = {}
+        for row in rows:
+            latest[row[self.key_index]] = row
+        return list(latest.values())
+
+    def _take(self):
+        batch = (self._dedupe(self.rows), self.acks, self.nacks)
+        self._reset()
+        return batch
+
+    def _write(self, rows) -> bool:
+        try:
+            self.db.write_batch(self.table, rows, onConflict=self.onConflict)
+        except Exception as e:
+            logger.error("Flush of {} rows failed: {}".format(len(rows), e))
+            return False
+        self.flushes += 1
+        self.rows_written += len(rows)
+        return True
+
+    def add(
+        self,
+        rows: list[tuple],
+        ack: Optional[Callable] = None,
+        nack: Optional[Callable] = None,
+    ) -> bool:
+        """Buffer the rows of one message. Returns True if this triggered a successful flush."""
+        with self._lock:
+            self._append(rows, ack, nack)
+            if self.due():
+                return self.flush()
+        return False
+
+    def maybe_flush(self) -> bool:
+        with self._lock:
+            if self.due():
+                return self.flush()
+        return False
+
+    def flush(self) -> bool:
+        """Write everything buffered, then ack (or nack on failure) the messages it came from"""
+        with self._lock:
+            rows, acks, nacks = self._take()
+            success = self._write(rows)
+            for callback in acks if success else nacks:
+                try:
+                    callback()
+                except Exception as e:
+                    logger.error(e)
+            return success
+
+    async def aadd(
+        self,
+        rows: list[tuple],
+        ack: Optional[Callable] = None,
+        nack: Optional[Callable] = None,
+    ) -> bool:
+        """add() for asyncio consumers. The write runs in a thread and callbacks may be coroutines."""
+        with self._lock:
+            self._append(rows, ack, nack)
+        return await self.amaybe_flush()
+
+    def _flush_lock(self) -> asyncio.Lock:
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        return self._async_lock
+
+    async def amaybe_flush(self) -> bool:
+        async with self._flush_lock():
+            if self.due():
+                return await self._aflush()
+        return False
+
+    async def aflush(self) -> bool:
+        async with self._flush_lock():
+            return await self._aflush()
+
+    async def _aflush(self) -> bool:
+        """Caller holds the flush lock, so only one transaction is open on the connection"""
+        with self._lock:
+            rows, acks, nacks = self._take()
+        loop = asyncio.get_running_loop()
+        success = await loop.run_in_executor(None, self._write, rows)
+        for callback in acks if success else nacks:
+            try:
+                result = callback()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.error(e)
+        return success
@@ -0,0 +1,107 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from typing import Optional
+
+logger = logging.getLogger("voltron")
+
+
+class VoltronDecorationCache:
+    """SQLite cache for per-issue decoration lookups (e.g. snykFinding.decorate_issue).
+    Entries are keyed by issue id and the issue's update marker, so an issue that changed
+    upstream misses the cache. Entries older than ttl seconds are ignored and removed, and the
+    least recently used entries are evicted once the cache holds more than max_entries.
+    Safe to share between threads.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: float = 7 * 24 * 3600,
+        max_entries: int = 500000,
+        evict_every: int = 1000,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.evict_every = evict_every
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS decorations (
+                issue_id TEXT PRIMARY KEY,
+                marker TEXT,
+                payload TEXT,
+                created REAL,
+                accessed REAL
+            )
+            """
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS decorations_accessed ON decorations (accessed)"
+        )
+        self.conn.commit()
+
+    def get(self, issue_id: str, marker: str = "") -> Optional[dict]:
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT payload FROM decorations WHERE issue_id = ? AND marker = ? AND created > ?",
+                (str(issue_id), marker, now - self.ttl),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute(
+                "UPDATE decorations SET accessed = ? WHERE issue_id = ?",
+                (now, str(issue_id)),
+            )
+            self.conn.commit()
+        return json.loads(row[0])
+
+    def set(self, issue_id: str, marker: str, decoration: dict):
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO decorations VALUES (?, ?, ?, ?, ?)",
+                (str(issue_id), marker, json.dumps(decoration), now, now),
+            )
+            self.conn.commit()
+            self._writes += 1
+            if self._writes % self.evict_every == 0:
+                self._evict(now)
+
+    def evict(self):
+        with self._lock:
+            self._evict(time.time())
+
+    def _evict(self, now: float):
+        expired = self.conn.execute(
+            "DELETE FROM decorations WHERE created <= ?", (now - self.ttl,)
+        ).rowcount
+        count = self.conn.execute("SELECT COUNT(*) FROM decorations").fetchone()[0]
+        overflow = 0
+        if count > self.max_entries:
+            overflow = self.conn.execute(
+                "DELETE FROM decorations WHERE issue_id IN (SELECT issue_id FROM decorations ORDER BY accessed LIMIT ?)",
+                (count - self.max_entries,),
+            ).rowcount
+        self.conn.commit()
+        logger.debug({"step": "cacheEvict", "expired": expired, "evicted": overflow})
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM decorations").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
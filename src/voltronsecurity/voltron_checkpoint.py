@@ -0,0 +1,92 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from typing import Optional
+
+from voltronsecurity import helpers
+
+logger = logging.getLogger("voltron")
+
+
+def crawl_identity(
+    name: str, params: Optional[dict] = None, run_id: Optional[str] = None
+) -> str:
+    """Stable id for a paginated crawl: the query name plus a hash of its parameters.
+    Leave page cursors and page sizes out of params.
+    run_id scopes the checkpoint to one inventory run, so a redelivered message resumes the
+    crawl while the next run starts again from the first page.
+    """
+    identity = name
+    if params:
+        encoded = json.dumps(params, sort_keys=True, separators=(",", ":"))
+        identity = "{}:{}".format(name, hashlib.sha256(encoded.encode()).hexdigest()[:16])
+    if run_id is not None:
+        identity = "{}/{}".format(run_id, identity)
+    return identity
+
+
+class VoltronCheckpointStore:
+    """Persists the cursor of an in-progress crawl so a restarted worker can resume it.
+    Paginators save the cursor of the next page once the consumer has finished with the
+    current one, and clear it when the crawl completes. Checkpoints are keyed by run id
+    (see crawl_identity), so pages skipped by a resume belong to the same run.
+    """
+
+    def load(self, crawl_id: str) -> Optional[dict]:
+        """Override in child class. Return {"cursor": ..., "updated": ...} or None."""
+        pass
+
+    def save(self, crawl_id: str, cursor: str):
+        """Override in child class"""
+        pass
+
+    def clear(self, crawl_id: str):
+        """Override in child class"""
+        pass
+
+
+class VoltronFileCheckpointStore(VoltronCheckpointStore):
+    """Checkpoints in a local JSON file. Each save rewrites the file atomically."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path, "r", encoding="utf8") as infile:
+                return json.load(infile)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            logger.warning("Unreadable checkpoint file {}. Ignoring it.".format(self.path))
+            return {}
+
+    def _write(self, checkpoints: dict):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".voltron-checkpoint")
+        with os.fdopen(fd, "w", encoding="utf8") as outfile:
+            json.dump(checkpoints, outfile)
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        os.replace(temp_path, self.path)
+
+    def load(self, crawl_id):
+        with self._lock:
+            return self._read().get(crawl_id)
+
+    def save(self, crawl_id, cursor):
+        with self._lock:
+            checkpoints = self._read()
+            checkpoints[crawl_id] = {"cursor": cursor, "updated": helpers.get_time()}
+            self._write(checkpoints)
+
+    def clear(self, crawl_id):
+        with self._lock:
+            checkpoints = self._read()
+            if checkpoints.pop(crawl_id, None) is not None:
+                self._write(checkpoints)
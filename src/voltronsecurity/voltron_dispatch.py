@@ -0,0 +1,206 @@
+import asyncio
+import inspect
+import logging
+import weakref
+
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Iterable, Optional
+
+from voltronsecurity.voltron_base import (
+    VoltronBaseProcessResponse,
+    VoltronBaseQueryInterface,
+    VoltronMessagePayload,
+)
+
+logger = logging.getLogger("voltron")
+
+
+class VoltronHandlerRegistration:
+    """A query handler plus the limits the dispatcher enforces for it"""
+
+    def __init__(
+        self,
+        handler: VoltronBaseQueryInterface,
+        max_concurrency: int = 1,
+        timeout: Optional[float] = None,
+    ):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.handler = handler
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+
+
+class VoltronHandlerRegistry:
+    """Maps a message handlerName to the VoltronBaseQueryInterface that serves it:
+    registry = VoltronHandlerRegistry()
+    registry.register("TotallyLegitSiteQueryHandler", TotallyLegitSiteQueryHandler(), max_concurrency=4, timeout=60)
+    """
+
+    def __init__(self):
+        self.handlers = {}
+
+    def register(
+        self,
+        handler_name: str,
+        handler: VoltronBaseQueryInterface,
+        max_concurrency: int = 1,
+        timeout: Optional[float] = None,
+    ) -> VoltronHandlerRegistration:
+        if handler_name in self.handlers:
+            raise ValueError("Handler {} is already registered".format(handler_name))
+        registration = VoltronHandlerRegistration(handler, max_concurrency, timeout)
+        self.handlers[handler_name] = registration
+        return registration
+
+    def unregister(self, handler_name: str):
+        self.handlers.pop(handler_name, None)
+
+    def get(self, handler_name: str) -> Optional[VoltronHandlerRegistration]:
+        return self.handlers.get(handler_name)
+
+    def handler_names(self) -> list[str]:
+        return list(self.handlers.keys())
+
+    def __contains__(self, handler_name: str) -> bool:
+        return handler_name in self.handlers
+
+
+class VoltronDispatcher:
+    """Routes messages to registered query handlers.
+    Each handler gets its own concurrency limit, so a slow handler type only ties up its own slots.
+    Synchronous run_query/process_results implementations run in a thread pool sized to the
+    sum of the registered limits; coroutine implementations are awaited directly.
+    A timed out synchronous call can't be interrupted. Its caller gets the timeout response
+    right away, but the handler's slot stays taken until the thread returns, so hung calls
+    only ever block their own handler type and never the threads of the others.
+    """
+
+    def __init__(
+        self, registry: VoltronHandlerRegistry, executor: Optional[Executor] = None
+    ):
+        self.registry = registry
+        self.executor = executor
+        # Semaphores bind to the loop that first waits on them, so keep one set per loop
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def get_executor(self) -> Executor:
+        if self.executor is None:
+            workers = sum(x.max_concurrency for x in self.registry.handlers.values())
+            self.executor = ThreadPoolExecutor(
+                max_workers=max(workers, 1), thread_name_prefix="voltron-dispatch"
+            )
+        return self.executor
+
+    def _get_semaphore(
+        self, handler_name: str, registration: VoltronHandlerRegistration
+    ) -> asyncio.Semaphore:
+        semaphores = self._semaphores.setdefault(asyncio.get_running_loop(), {})
+        semaphore = semaphores.get(handler_name)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(registration.max_concurrency)
+            semaphores[handler_name] = semaphore
+        return semaphore
+
+    async def _call(self, method, argument, running: list):
+        if inspect.iscoroutinefunction(method):
+            return await method(argument)
+        future = self.get_executor().submit(method, argument)
+        running.append(future)
+        return await asyncio.wrap_future(future)
+
+    async def _run_handler(
+        self,
+        handler: VoltronBaseQueryInterface,
+        message: VoltronMessagePayload,
+        running: list,
+    ) -> VoltronBaseProcessResponse:
+        results = await self._call(handler.run_query, message, running)
+        if not results.get("success", False):
+            return results
+        return await self._call(handler.process_results, results, running)
+
+    def _release_when_done(self, semaphore: asyncio.Semaphore, running: list) -> bool:
+        """Release semaphore once the abandoned thread of a timed out call returns.
+        Returns False if no thread is still running and the caller should release it now.
+        """
+        pending = [x for x in running if not x.done()]
+        if not pending:
+            return False
+        loop = asyncio.get_running_loop()
+
+        def release(_):
+            try:
+                loop.call_soon_threadsafe(semaphore.release)
+            except RuntimeError:
+                # The loop is gone, and its semaphores with it
+                pass
+
+        pending[-1].add_done_callback(release)
+        return True
+
+    async def dispatch(
+        self, message: VoltronMessagePayload
+    ) -> VoltronBaseProcessResponse:
+        """Run the handler registered for message["handlerName"] and return its processed results"""
+        handler_name = message.get("handlerName")
+        registration = self.registry.get(handler_name)
+        if registration is None:
+            logger.warning("No handler registered for {}".format(handler_name))
+            return {
+                "success": False,
+                "message": "No handler registered for {}".format(handler_name),
+                "data": {},
+            }
+
+        semaphore = self._get_semaphore(handler_name, registration)
+        await semaphore.acquire()
+        running = []
+        held = False
+        try:
+            response = await asyncio.wait_for(
+                self._run_handler(registration.handler, message, running),
+                registration.timeout,
+            )
+        except asyncio.TimeoutError:
+            logger.error(
+                "{} timed out after {}s".format(handler_name, registration.timeout)
+            )
+            held = self._release_when_done(semaphore, running)
+            # The handler never saw the timeout; let pipeline stages record it against the run
+            track_failure = getattr(registration.handler, "track_failure", None)
+            if track_failure is not None:
+                track_failure(
+                    message,
+                    "Handler {} timed out after {}s".format(handler_name, registration.timeout),
+                )
+            response = {
+                "success": False,
+                "message": "Handler {} timed out after {}s".format(
+                    handler_name, registration.timeout
+                ),
+                "data": {},
+            }
+        except Exception as e:
+            logger.error(e)
+            response = {"success": False, "message": str(e), "data": {}}
+        finally:
+            if not held:
+                semaphore.release()
+        return response
+
+    async def dispatch_many(
+        self, messages: Iterable[VoltronMessagePayload]
+    ) -> list[VoltronBaseProcessResponse]:
+        """Dispatch a batch of messages concurrently. Responses are returned in message order."""
+        return list(await asyncio.gather(*[self.dispatch(x) for x in messages]))
+
+    async def process_message(
+        self, message: VoltronMessagePayload
+    ) -> VoltronBaseProcessResponse:
+        """Same as dispatch. Lets a dispatcher stand in for an async queue's process_message."""
+        return await self.dispatch(message)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import math
+
+from typing import Iterable, Optional
+
+_MISSING = object()
+
+
+def _normalize(value):
+    """Integral floats become ints, so 3 and 3.0 get the same fingerprint.
+    nan and inf become strings.
+    """
+    if isinstance(value, float):
+        if math.isnan(value) or math.isinf(value):
+            return str(value)
+        if value.is_integer():
+            return int(value)
+        return value
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def canonical_json(value, normalize_numbers: bool = True) -> bytes:
+    """Encoding used for fingerprints: sorted keys, no whitespace, utf8.
+    Anything json can't encode (datetimes, UUIDs) is encoded with str().
+    """
+    if normalize_numbers:
+        value = _normalize(value)
+    return json.dumps(
+        value,
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        allow_nan=False,
+        default=str,
+    ).encode("utf8")
+
+
+def _get_path(payload, path: list):
+    for key in path:
+        if not isinstance(payload, dict) or key not in payload:
+            return _MISSING
+        payload = payload[key]
+    return payload
+
+
+class VoltronFingerprint:
+    """Stable ids for findings from tools that don't provide one.
+    fields lists the dotted keys that identify a finding (e.g. ["source", "destination", "port"]);
+    everything else, such as timestamps, is ignored. Without fields, the whole payload is used
+    minus the keys in exclude. namespace (e.g. the toolName) keeps identical payloads from
+    different tools apart. Ids are blake2b hex digests of the canonical encoding.
+    """
+
+    def __init__(
+        self,
+        fields: Optional[Iterable[str]] = None,
+        exclude: Optional[Iterable[str]] = None,
+        namespace: str = "",
+        digest_size: int = 16,
+        normalize_numbers: bool = True,
+    ):
+        if fields is not None and exclude is not None:
+            raise ValueError("Use either fields or exclude, not both")
+        self.fields = None
+        if fields is not None:
+            self.fields = [(x, x.split(".")) for x in fields]
+        self.exclude = frozenset(exclude or [])
+        self.normalize_numbers = normalize_numbers
+        self._base = hashlib.blake2b(digest_size=digest_size)
+        self._base.update(namespace.encode("utf8") + b"\0")
+
+    def select(self, payload: dict) -> dict:
+        """The part of the payload that goes into the fingerprint"""
+        if self.fields is not None:
+            selected = {}
+            for name, path in self.fields:
+                value = _get_path(payload, path)
+                if value is not _MISSING:
+                    selected[name] = value
+            return selected
+        if self.exclude:
+            return {k: v for k, v in payload.items() if k not in self.exclude}
+        return payload
+
+    def __call__(self, payload: dict) -> str:
+        hasher = self._base.copy()
+        hasher.update(canonical_json(self.select(payload), self.normalize_numbers))
+        return hasher.hexdigest()
+
+    def many(self, payloads: Iterable[dict]) -> list[str]:
+        """Fingerprint a batch of payloads, in order"""
+        base = self._base
+        normalize_numbers = self.normalize_numbers
+        results = []
+        for payload in payloads:
+            hasher = base.copy()
+            hasher.update(canonical_json(self.select(payload), normalize_numbers))
+            results.append(hasher.hexdigest())
+        return results
+
+
+def fingerprint(
+    payload: dict,
+    fields: Optional[Iterable[str]] = None,
+    exclude: Optional[Iterable[str]] = None,
+    namespace: str = "",
+    digest_size: int = 16,
+) -> str:
+    """One-off form of VoltronFingerprint. Build a VoltronFingerprint once for repeated use."""
+    return VoltronFingerprint(fields, exclude, namespace, digest_size)(payload)
@@ -0,0 +1,279 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+import queue as queue_module
+
+from typing import Optional
+
+from voltronsecurity.voltron_base import (
+    VoltronBaseProcessResponse,
+    VoltronMessagePayload,
+    VoltronBaseMessageInterface,
+)
+from voltronsecurity.voltron_retry import (
+    ERROR_HEADER,
+    VoltronRetryPolicy,
+    dead_letter_queue_name,
+)
+from voltronsecurity.voltron_tracing import restore_context, trace_headers
+
+logger = logging.getLogger("voltron")
+
+
+class VoltronMemoryBroker:
+    """Holds named asyncio queues for VoltronMemoryQueue. One broker per event loop."""
+
+    def __init__(self):
+        self.queues = {}
+
+    def get_queue(self, queue_name: str) -> asyncio.Queue:
+        if queue_name not in self.queues:
+            self.queues[queue_name] = asyncio.Queue()
+        return self.queues[queue_name]
+
+
+class VoltronMultiprocessBroker:
+    """Holds named multiprocessing queues for VoltronMultiprocessQueue.
+    Create it before starting worker processes and pass it to them. Every queue gets a
+    dead-letter queue alongside it.
+    """
+
+    def __init__(self, queue_names: list[str], context=None):
+        if context is None:
+            context = multiprocessing.get_context()
+        names = list(queue_names) + [dead_letter_queue_name(x) for x in queue_names]
+        self.queues = {name: context.Queue() for name in names}
+
+    def get_queue(self, queue_name: str):
+        return self.queues[queue_name]
+
+
+class _VoltronLocalQueue(VoltronBaseMessageInterface):
+    """Shared send/receive/ack logic for the in-process queues.
+    Messages travel as JSON, like they do on a real broker, wrapped in an envelope that carries
+    the delivery count and headers. A message is acked when process_message returns success,
+    otherwise it is put back on the queue with its delivery count incremented. After
+    retry_policy.max_attempts deliveries it goes to the queue's dead-letter queue instead
+    (see voltron_retry.dead_letter_queue_name). Redelivery is immediate; the policy's
+    delays only apply to the broker-backed queues.
+    """
+
+    def __init__(
+        self,
+        queue_name: str,
+        broker=None,
+        retry_policy: Optional[VoltronRetryPolicy] = None,
+    ):
+        self.queue_name = queue_name
+        self.broker = broker
+        if retry_policy is None:
+            retry_policy = VoltronRetryPolicy()
+        self.retry_policy = retry_policy
+
+    def get_client(self, broker=None):
+        if broker is None:
+            broker = self.broker
+        return broker
+
+    def generate_message(
+        self,
+        handlerName: str,
+        handlerConfig: dict,
+        handlerData: dict,
+        messageSource: str,
+        startTime: int,
+    ) -> VoltronMessagePayload:
+        body = {
+            "handlerName": handlerName,
+            "handlerConfig": handlerConfig,
+            "handlerData": handlerData,
+            "messageSource": messageSource,
+            "startTime": startTime,
+        }
+        message = json.dumps(body)
+        return message
+
+    async def _put(self, local_queue, envelope: dict):
+        """Override in child class to put the envelope on local_queue"""
+        pass
+
+    async def _get(self, local_queue, timeout: float) -> Optional[dict]:
+        """Override in child class. Return None if nothing arrives within timeout."""
+        pass
+
+    async def process_message(
+        self, message: VoltronMessagePayload
+    ) -> VoltronBaseProcessResponse:
+        """Override this in child class to perform an action based on the message received."""
+        logger.debug("Processed Message : {}".format(message))
+        response = {
+            "success": True,
+            "message": "Default Message Processor. No action taken. Message deleted.",
+            "data": message,
+        }
+        return response
+
+    async def send_message(
+        self,
+        message: VoltronMessagePayload,
+        client=None,
+        queue: Optional[str] = None,
+        headers: Optional[dict] = None,
+    ) -> VoltronBaseProcessResponse:
+        if client is None:
+            client = self.get_client()
+        if queue is None:
+            queue = self.queue_name
+        formatted = self.generate_message(
+            message["handlerName"],
+            message["handlerConfig"],
+            message["handlerData"],
+            message["messageSource"],
+            message["startTime"],
+        )
+        envelope = {
+            "body": formatted,
+            "deliveryCount": 0,
+            "headers": dict(trace_headers(message), **(headers or {})),
+        }
+        try:
+            await self._put(client.get_queue(queue), envelope)
+            response = {"success": True, "message": "Sent message."}
+        except Exception as e:
+            response = {"success": False, "message": str(e)}
+        return response
+
+    async def receive_envelopes(
+        self, local_queue, max_message_count: int, max_wait_time: float
+    ) -> list[dict]:
+        """Wait up to max_wait_time for the first message, then take whatever else is ready"""
+        envelopes = []
+        envelope = await self._get(local_queue, max_wait_time)
+        while envelope is not None:
+            envelopes.append(envelope)
+            if len(envelopes) >= max_message_count:
+                break
+            envelope = await self._get(local_queue, 0)
+        return envelopes
+
+    async def handle_messages(
+        self,
+        client=None,
+        queue: Optional[str] = None,
+        max_message_count: int = 1,
+        max_wait_time: float = 5,
+    ) -> list[VoltronBaseProcessResponse]:
+        """Receive up to max_message_count messages and process them.
+        Successful messages are acked; failed ones are redelivered.
+        """
+        if client is None:
+            client = self.get_client()
+        if queue is None:
+            queue = self.queue_name
+        local_queue = client.get_queue(queue)
+        results = []
+        for envelope in await self.receive_envelopes(
+            local_queue, max_message_count, max_wait_time
+        ):
+            envelope["deliveryCount"] += 1
+            try:
+                resp = await self.process_message(
+                    restore_context(json.loads(envelope["body"]), envelope["headers"])
+                )
+            except Exception as e:
+                logger.error(e)
+                resp = {"success": False, "message": str(e), "data": {}}
+            results.append(resp)
+            if not resp["success"]:
+                await self.reject_message(
+                    client, queue, local_queue, envelope, resp.get("message", "")
+                )
+        return results
+
+    async def reject_message(
+        self, client, queue: str, local_queue, envelope: dict, reason: str
+    ):
+        """Put a failed message back on its queue, or dead-letter it once it has used up
+        retry_policy.max_attempts deliveries
+        """
+        if self.retry_policy.should_retry(envelope["deliveryCount"]):
+            await self._put(local_queue, envelope)
+            return
+        logger.error(
+            "Dead-lettering message from {} after {} deliveries: {}".format(
+                queue, envelope["deliveryCount"], reason
+            )
+        )
+        envelope["headers"] = dict(envelope["headers"], **{ERROR_HEADER: str(reason)[:1000]})
+        await self._put(client.get_queue(dead_letter_queue_name(queue)), envelope)
+
+
+class VoltronMemoryQueue(_VoltronLocalQueue):
+    """asyncio queue backend for tests and single-node deployments.
+    Queues live on a VoltronMemoryBroker, so handlers created with the same broker and
+    queue_name share messages the same way they would on RabbitMQ or Service Bus.
+    """
+
+    def __init__(
+        self,
+        queue_name: str,
+        broker: Optional[VoltronMemoryBroker] = None,
+        retry_policy: Optional[VoltronRetryPolicy] = None,
+    ):
+        if broker is None:
+            broker = VoltronMemoryBroker()
+        super().__init__(queue_name, broker, retry_policy)
+
+    def qsize(self, queue: Optional[str] = None) -> int:
+        if queue is None:
+            queue = self.queue_name
+        return self.broker.get_queue(queue).qsize()
+
+    async def _put(self, local_queue, envelope):
+        await local_queue.put(envelope)
+
+    async def _get(self, local_queue, timeout):
+        if timeout <= 0:
+            try:
+                return local_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return None
+        try:
+            return await asyncio.wait_for(local_queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class VoltronMultiprocessQueue(_VoltronLocalQueue):
+    """multiprocessing queue backend, for spreading handlers over local worker processes.
+    Unacked messages live in the consuming process, so a crashed worker loses them.
+    """
+
+    def __init__(
+        self,
+        queue_name: str,
+        broker: VoltronMultiprocessBroker,
+        retry_policy: Optional[VoltronRetryPolicy] = None,
+    ):
+        super().__init__(queue_name, broker, retry_policy)
+
+    def qsize(self, queue: Optional[str] = None) -> int:
+        if queue is None:
+            queue = self.queue_name
+        return self.broker.get_queue(queue).qsize()
+
+    async def _put(self, local_queue, envelope):
+        local_queue.put(envelope)
+
+    async def _get(self, local_queue, timeout):
+        if timeout <= 0:
+            try:
+                return local_queue.get_nowait()
+            except queue_module.Empty:
+                return None
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(None, local_queue.get, True, timeout)
+        except queue_module.Empty:
+            return None
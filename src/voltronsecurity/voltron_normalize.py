@@ -0,0 +1,86 @@
+import collections
+import itertools
+import logging
+import os
+
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Iterable, Iterator, Optional, Type
+
+from voltronsecurity.voltron_base import VoltronFinding
+
+logger = logging.getLogger("voltron")
+
+
+def chunk_payloads(payloads: Iterable[dict], chunk_size: int) -> Iterator[list]:
+    """Split an iterable of payloads into lists of at most chunk_size entries"""
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    iterator = iter(payloads)
+    chunk = list(itertools.islice(iterator, chunk_size))
+    while chunk:
+        yield chunk
+        chunk = list(itertools.islice(iterator, chunk_size))
+
+
+def normalize_chunk(finding_class: Type[VoltronFinding], chunk: list) -> list[tuple]:
+    """Convert a list of raw payloads into findingOutput rows.
+    Runs inside the worker process, so only the row tuples are pickled back to the parent.
+    """
+    return [tuple(finding_class(payload).findingOutput().values()) for payload in chunk]
+
+
+def normalize_payloads(
+    finding_class: Type[VoltronFinding],
+    payloads: Iterable[dict],
+    chunk_size: int = 500,
+    max_workers: Optional[int] = None,
+    executor: Optional[Executor] = None,
+) -> Iterator[tuple]:
+    """Yield findingOutput rows for every payload, in input order.
+    Payloads are chunked and converted in a ProcessPoolExecutor. At most two chunks per worker
+    are in flight, so a lazy payload iterable is never fully materialized.
+    finding_class must be importable at module level so it can be pickled.
+    Pass max_workers=0 to convert in the current process.
+    Rows can be handed straight to VoltronPostgres.write_to_table.
+    """
+    if max_workers == 0:
+        for chunk in chunk_payloads(payloads, chunk_size):
+            yield from normalize_chunk(finding_class, chunk)
+        return
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    owns_executor = executor is None
+    if owns_executor:
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+
+    pending = collections.deque()
+    try:
+        for chunk in chunk_payloads(payloads, chunk_size):
+            pending.append(executor.submit(normalize_chunk, finding_class, chunk))
+            if len(pending) >= max_workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        if owns_executor:
+            executor.shutdown(wait=True)
+
+
+def normalize_pages(
+    finding_class: Type[VoltronFinding],
+    pages: Iterable[list],
+    chunk_size: int = 500,
+    max_workers: Optional[int] = None,
+    executor: Optional[Executor] = None,
+) -> Iterator[tuple]:
+    """Same as normalize_payloads, for an iterable of pages (lists of payloads)"""
+    return normalize_payloads(
+        finding_class,
+        itertools.chain.from_iterable(pages),
+        chunk_size=chunk_size,
+        max_workers=max_workers,
+        executor=executor,
+    )
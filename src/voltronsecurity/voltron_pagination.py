@@ -0,0 +1,107 @@
+import collections
+import threading
+import urllib.parse
+
+from typing import Optional
+
+
+class VoltronPageSizer:
+    """Chooses the page size for a paginated API from what recent pages cost.
+    Errors (timeouts, 502/503) halve the page size. Pages slower than target_latency, or
+    bigger than max_bytes, shrink it proportionally. Pages well under target grow it by
+    growth_factor. The size always stays within [minimum, maximum] and is a multiple of step,
+    for APIs that only accept some sizes (Snyk REST wants a multiple of 10).
+    Safe to share between threads.
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        minimum: int,
+        maximum: int,
+        target_latency: float = 5.0,
+        max_bytes: Optional[int] = None,
+        growth_factor: float = 1.5,
+        window: int = 20,
+        step: int = 1,
+    ):
+        if not minimum <= initial <= maximum:
+            raise ValueError("initial page size must be between minimum and maximum")
+        if step < 1 or any(x % step for x in (initial, minimum, maximum)):
+            raise ValueError("initial, minimum and maximum must be multiples of step")
+        self.step = step
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.max_bytes = max_bytes
+        self.growth_factor = growth_factor
+        self.pages = 0
+        self.errors = 0
+        self.recent = collections.deque(maxlen=window)
+        self.sizes = collections.Counter()
+        self._size = initial
+        self._lock = threading.Lock()
+
+    @property
+    def page_size(self) -> int:
+        return self._size
+
+    def _clamp(self, size: float) -> int:
+        # Round down: a shrink must never round back up to the size that failed
+        size = int(size) // self.step * self.step
+        return max(self.minimum, min(self.maximum, size))
+
+    def record(
+        self, latency: float, nbytes: int = 0, error: bool = False, page_size=None
+    ) -> int:
+        """Record one request and return the page size to use next"""
+        with self._lock:
+            if page_size is None:
+                page_size = self._size
+            self.recent.append((latency, nbytes, error))
+            if error:
+                self.errors += 1
+                self._size = self._clamp(page_size / 2)
+                return self._size
+
+            self.pages += 1
+            self.sizes[page_size] += 1
+            ratio = 1.0
+            if latency > 0:
+                ratio = min(ratio, self.target_latency / latency)
+            if self.max_bytes and nbytes > self.max_bytes:
+                ratio = min(ratio, self.max_bytes / nbytes)
+            if ratio < 0.8:
+                self._size = self._clamp(page_size * max(ratio, 0.5))
+            elif latency < self.target_latency / 2 and self.error_rate() == 0:
+                self._size = self._clamp(page_size * self.growth_factor)
+            return self._size
+
+    def error_rate(self) -> float:
+        if not self.recent:
+            return 0.0
+        return sum(1 for x in self.recent if x[2]) / len(self.recent)
+
+    def report(self) -> dict:
+        with self._lock:
+            ok = [x for x in self.recent if not x[2]]
+            return {
+                "pageSize": self._size,
+                "minimum": self.minimum,
+                "maximum": self.maximum,
+                "step": self.step,
+                "pages": self.pages,
+                "errors": self.errors,
+                "errorRate": self.error_rate(),
+                "avgLatency": sum(x[0] for x in ok) / len(ok) if ok else None,
+                "avgBytes": sum(x[1] for x in ok) / len(ok) if ok else None,
+                "sizesUsed": dict(self.sizes),
+            }
+
+
+def set_query_param(url: str, name: str, value) -> str:
+    """Replace (or add) one query string parameter of a relative or absolute url"""
+    parts = urllib.parse.urlsplit(url)
+    query = [x for x in urllib.parse.parse_qsl(parts.query, keep_blank_values=True) if x[0] != name]
+    query.append((name, str(value)))
+    return urllib.parse.urlunsplit(parts._replace(query=urllib.parse.urlencode(query)))
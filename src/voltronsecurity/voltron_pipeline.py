@@ -0,0 +1,472 @@
+import asyncio
+import contextvars
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+
+from typing import Callable, Iterable, Optional
+
+from voltronsecurity.voltron_base import (
+    VoltronBaseMessageInterface,
+    VoltronBaseProcessResponse,
+    VoltronBaseQueryInterface,
+    VoltronMessagePayload,
+)
+from voltronsecurity.voltron_tracing import VoltronTracer, span
+
+logger = logging.getLogger("voltron")
+
+RUN_ID_KEY = "voltronRunId"
+
+
+class VoltronRunTracker:
+    """Counts outstanding messages per pipeline run.
+    A run starts with one outstanding message (the trigger). Every stage adds its children
+    before publishing them and then completes itself, so the count only reaches zero once the
+    last leaf is done. on_complete(run_id) is called exactly once per run.
+    Stages also record a failure for each message they could not process, keyed by
+    message_key, and clear it when a redelivery of the message succeeds. failures(run_id) is
+    what is still failed; pass it to VoltronDB.finish_sync so a partial crawl resolves nothing.
+    This tracker is in-process only; use VoltronPostgresRunTracker when stages run in separate workers.
+    """
+
+    def __init__(self, on_complete: Optional[Callable[[str], None]] = None):
+        self.on_complete = on_complete
+        self.runs = {}
+        self._lock = threading.Lock()
+
+    def start_run(self, run_id: str, outstanding: int = 1):
+        with self._lock:
+            self.runs[run_id] = {"outstanding": outstanding, "completed": None, "failures": {}}
+
+    def add_children(self, run_id: str, count: int) -> int:
+        with self._lock:
+            run = self.runs[run_id]
+            run["outstanding"] += count
+            return run["outstanding"]
+
+    def complete_child(self, run_id: str, count: int = 1) -> bool:
+        """Mark count messages as done. Returns True for the call that finished the run."""
+        with self._lock:
+            run = self.runs[run_id]
+            if run["completed"] is not None:
+                return False
+            run["outstanding"] -= count
+            finished = run["outstanding"] <= 0
+            if finished:
+                run["completed"] = time.time()
+        if finished:
+            self._run_finished(run_id)
+        return finished
+
+    def outstanding(self, run_id: str) -> int:
+        return self.runs[run_id]["outstanding"]
+
+    def is_complete(self, run_id: str) -> bool:
+        return self.runs[run_id]["completed"] is not None
+
+    def record_failure(self, run_id: str, key: str, stage: str, message: str):
+        with self._lock:
+            self.runs[run_id]["failures"][key] = {"key": key, "stage": stage, "message": message}
+
+    def clear_failure(self, run_id: str, key: str):
+        with self._lock:
+            run = self.runs.get(run_id)
+            if run is not None:
+                run["failures"].pop(key, None)
+
+    def failures(self, run_id: str) -> list[dict]:
+        with self._lock:
+            return list(self.runs[run_id]["failures"].values())
+
+    def _run_finished(self, run_id: str):
+        logger.info({"step": "runComplete", "runId": run_id})
+        if self.on_complete is not None:
+            self.on_complete(run_id)
+
+
+def message_key(message: VoltronMessagePayload) -> str:
+    """Identifies the work a message asks for, so a redelivery has the same key"""
+    document = json.dumps(
+        [message["handlerName"], message["handlerData"]], sort_keys=True, default=str
+    )
+    return hashlib.blake2b(document.encode(), digest_size=16).hexdigest()
+
+
+def child_message(
+    parent: VoltronMessagePayload, handler_name: str, handler_data: dict, source: str
+) -> VoltronMessagePayload:
+    """Build a child message that keeps the parent's handlerConfig (and run id) and startTime"""
+    return {
+        "handlerName": handler_name,
+        "handlerConfig": dict(parent["handlerConfig"]),
+        "handlerData": handler_data,
+        "messageSource": source,
+        "startTime": parent["startTime"],
+    }
+
+
+async def start_run(
+    tracker: VoltronRunTracker,
+    queue: VoltronBaseMessageInterface,
+    handler_name: str,
+    handler_config: Optional[dict] = None,
+    handler_data: Optional[dict] = None,
+    run_id: Optional[str] = None,
+    tracer: Optional[VoltronTracer] = None,
+) -> str:
+    """Register a new run and publish its trigger message. Returns the run id.
+    With a tracer, the trigger message starts the run's trace.
+    """
+    if run_id is None:
+        run_id = str(uuid.uuid4())
+    config = dict(handler_config or {})
+    config[RUN_ID_KEY] = run_id
+    tracker.start_run(run_id)
+    message = {
+        "handlerName": handler_name,
+        "handlerConfig": config,
+        "handlerData": handler_data or {},
+        "messageSource": "voltron_pipeline",
+        "startTime": int(time.time()),
+    }
+    with span(
+        tracer,
+        "start_run",
+        attributes={"voltron.handler": handler_name, "voltron.run_id": run_id},
+        kind="producer",
+    ):
+        if tracer is not None:
+            tracer.inject(message)
+        response = await queue.send_messages([message])
+    if not response["success"]:
+        raise RuntimeError("Failed to start run {}: {}".format(run_id, response))
+    return run_id
+
+
+class VoltronPipelineStage(VoltronBaseQueryInterface):
+    """One step of a fan-out pipeline.
+    run_query calls expand() to build the children of a message. process_results publishes them
+    in bulk to next_queue and updates the run tracker. Stages can be registered with a
+    VoltronDispatcher or driven directly with process().
+    Leaf stages leave next_queue as None and do their work in expand(), returning no children.
+    With a VoltronTracer, run_query, process_results and the publish are recorded as spans of the
+    trace carried by the message, and children carry the publish span's trace context.
+    """
+
+    child_handler_name = None
+
+    def __init__(
+        self,
+        tracker: VoltronRunTracker,
+        next_queue: Optional[VoltronBaseMessageInterface] = None,
+        child_handler_name: Optional[str] = None,
+        tracer: Optional[VoltronTracer] = None,
+    ):
+        self.tracker = tracker
+        self.next_queue = next_queue
+        if child_handler_name is not None:
+            self.child_handler_name = child_handler_name
+        self.tracer = tracer
+
+    def _span_attributes(self, message: VoltronMessagePayload) -> dict:
+        return {
+            "voltron.stage": self.__class__.__name__,
+            "voltron.handler": message["handlerName"],
+            "voltron.run_id": message["handlerConfig"].get(RUN_ID_KEY, ""),
+        }
+
+    def expand(self, message: VoltronMessagePayload) -> Iterable[dict]:
+        """Override in child class. Return the handlerData of each child message."""
+        return []
+
+    def run_query(
+        self, query_message: VoltronMessagePayload
+    ) -> VoltronBaseProcessResponse:
+        with span(
+            self.tracer,
+            "run_query",
+            attributes=self._span_attributes(query_message),
+            message=query_message,
+        ) as current:
+            try:
+                children = [
+                    child_message(
+                        query_message,
+                        self.child_handler_name,
+                        data,
+                        self.__class__.__name__,
+                    )
+                    for data in self.expand(query_message)
+                ]
+            except Exception as e:
+                self.track_failure(query_message, "{}: {}".format(type(e).__name__, e))
+                raise
+            if current is not None:
+                current.set_attribute("voltron.children", len(children))
+        return {
+            "success": True,
+            "message": "Expanded into {} children".format(len(children)),
+            "data": {"message": query_message, "children": children},
+        }
+
+    async def process_results(
+        self, results: VoltronBaseProcessResponse
+    ) -> VoltronBaseProcessResponse:
+        message = results["data"]["message"]
+        with span(
+            self.tracer,
+            "process_results",
+            attributes=self._span_attributes(message),
+            message=message,
+        ) as current:
+            try:
+                response = await self._publish(message, results["data"]["children"])
+            except Exception as e:
+                self.track_failure(message, "{}: {}".format(type(e).__name__, e))
+                raise
+            if current is not None and not response["success"]:
+                current.set_status(False, response["message"])
+        self.track_failure(message, None if response["success"] else response["message"])
+        return response
+
+    async def _publish(
+        self, message: VoltronMessagePayload, children: list
+    ) -> VoltronBaseProcessResponse:
+        run_id = message["handlerConfig"].get(RUN_ID_KEY)
+
+        if children:
+            if self.next_queue is None:
+                raise ValueError(
+                    "{} produced children but has no next_queue".format(
+                        self.__class__.__name__
+                    )
+                )
+            if run_id is not None:
+                self.tracker.add_children(run_id, len(children))
+            with span(
+                self.tracer,
+                "publish",
+                attributes={
+                    "voltron.handler": self.child_handler_name,
+                    "voltron.children": len(children),
+                },
+                kind="producer",
+            ) as current:
+                if current is not None:
+                    for child in children:
+                        self.tracer.inject(child)
+                response = await self.next_queue.send_messages(children)
+                if current is not None and not response["success"]:
+                    current.set_status(False, response["message"])
+            if not response["success"]:
+                # Unsent children will never complete; take them back out of the count.
+                # The parent stays outstanding, so this can't finish the run early.
+                if run_id is not None:
+                    self.tracker.complete_child(
+                        run_id, len(response["data"]["failures"])
+                    )
+                return {
+                    "success": False,
+                    "message": response["message"],
+                    "data": response["data"],
+                }
+
+        finished = False
+        if run_id is not None:
+            finished = self.tracker.complete_child(run_id)
+        return {
+            "success": True,
+            "message": "Published {} children".format(len(children)),
+            "data": {"runId": run_id, "children": len(children), "runComplete": finished},
+        }
+
+    def track_failure(self, message: VoltronMessagePayload, reason: Optional[str]):
+        """Record reason against the message's run, or clear its failure when reason is None.
+        run_query and process_results call it themselves, so every caller (process, a
+        VoltronDispatcher) records failures; callers only report failures the stage can't see.
+        """
+        run_id = message["handlerConfig"].get(RUN_ID_KEY)
+        if run_id is None:
+            return
+        key = message_key(message)
+        if reason is None:
+            self.tracker.clear_failure(run_id, key)
+        else:
+            self.tracker.record_failure(run_id, key, self.__class__.__name__, reason)
+
+    async def process(
+        self, message: VoltronMessagePayload
+    ) -> VoltronBaseProcessResponse:
+        """Expand the message in a worker thread, then publish its children.
+        A failure (e.g. a collector fetch that raised) is recorded in the run tracker until a
+        redelivery of the same message succeeds.
+        """
+        loop = asyncio.get_running_loop()
+        with span(
+            self.tracer,
+            "process",
+            attributes=self._span_attributes(message),
+            message=message,
+            kind="consumer",
+        ):
+            # Executor threads don't inherit context; copy it so run_query nests under process
+            context = contextvars.copy_context()
+            results = await loop.run_in_executor(None, context.run, self.run_query, message)
+            return await self.process_results(results)
+
+
+def batch_payloads(payloads: list, batch_size: int) -> list[list]:
+    return [payloads[x : x + batch_size] for x in range(0, len(payloads), batch_size)]
+
+
+class SnykOrgsStage(VoltronPipelineStage):
+    """inventory-snyk-orgs: one child per org"""
+
+    child_handler_name = "inventory-snyk-projects"
+
+    def __init__(
+        self, collector, tracker, next_queue=None, child_handler_name=None, tracer=None
+    ):
+        super().__init__(tracker, next_queue, child_handler_name, tracer)
+        self.collector = collector
+
+    def expand(self, message):
+        return [{"orgId": org_id} for org_id in self.collector.orgs]
+
+
+class SnykProjectsStage(VoltronPipelineStage):
+    """inventory-snyk-projects: one child per project in handlerData["orgId"]"""
+
+    child_handler_name = "inventory-snyk-findings"
+
+    def __init__(
+        self, collector, tracker, next_queue=None, child_handler_name=None, tracer=None
+    ):
+        super().__init__(tracker, next_queue, child_handler_name, tracer)
+        self.collector = collector
+
+    def expand(self, message):
+        org_id = message["handlerData"]["orgId"]
+        projects = self.collector.get_projects(org_id)
+        return [{"orgId": org_id, "project": project} for project in projects]
+
+
+class SnykFindingsStage(VoltronPipelineStage):
+    """inventory-snyk-findings: fetch and decorate a project's issues, publish them in batches"""
+
+    child_handler_name = "persist-snyk-findings"
+
+    def __init__(
+        self,
+        collector,
+        tracker,
+        next_queue=None,
+        child_handler_name=None,
+        batch_size: int = 100,
+        tracer=None,
+    ):
+        super().__init__(tracker, next_queue, child_handler_name, tracer)
+        self.collector = collector
+        self.batch_size = batch_size
+
+    def expand(self, message):
+        org_id = message["handlerData"]["orgId"]
+        project_data = message["handlerData"]["project"]
+        org = self.collector.orgData[org_id]
+        project = self.collector.gen_project_data([project_data], org_id)[
+            project_data["id"]
+        ]
+        issues = self.collector.get_all_code_issues(org, project, as_dict=True)
+        payloads = [issue.__dict__ for issue in issues]
+        return [{"findings": x} for x in batch_payloads(payloads, self.batch_size)]
+
+
+class WizProjectsStage(VoltronPipelineStage):
+    """inventory-wiz-tenant: one child per Wiz project"""
+
+    child_handler_name = "inventory-wiz-findings"
+
+    def __init__(
+        self, collector, tracker, next_queue=None, child_handler_name=None, tracer=None
+    ):
+        super().__init__(tracker, next_queue, child_handler_name, tracer)
+        self.collector = collector
+
+    def expand(self, message):
+        return [{"projectId": project["id"]} for project in self.collector.get_projects()]
+
+
+class WizFindingsStage(VoltronPipelineStage):
+    """inventory-wiz-findings: fetch a project's issues, publish them in batches"""
+
+    child_handler_name = "persist-wiz-findings"
+
+    def __init__(
+        self,
+        collector,
+        tracker,
+        next_queue=None,
+        child_handler_name=None,
+        batch_size: int = 500,
+        tracer=None,
+    ):
+        super().__init__(tracker, next_queue, child_handler_name, tracer)
+        self.collector = collector
+        self.batch_size = batch_size
+
+    def expand(self, message):
+        issues = self.collector.get_all_issues(message["handlerData"]["projectId"])
+        return [{"findings": x} for x in batch_payloads(issues, self.batch_size)]
+
+
+class VoltronPersistStage(VoltronPipelineStage):
+    """persist-*-findings: leaf stage that writes handlerData["findings"] to a table.
+    With sync, the ids of the findings are also staged under the message's run id, so
+    VoltronDB.finish_sync can resolve the ones the run no longer saw (e.g. from on_complete).
+    """
+
+    def __init__(
+        self,
+        finding_class: type,
+        db,
+        table: str,
+        tracker: VoltronRunTracker,
+        onConflict: str = "DO NOTHING",
+        severity_engine=None,
+        tracer=None,
+        sync: bool = False,
+    ):
+        super().__init__(tracker, tracer=tracer)
+        self.finding_class = finding_class
+        self.db = db
+        self.table = table
+        self.onConflict = onConflict
+        self.severity_engine = severity_engine
+        self.sync = sync
+
+    def expand(self, message):
+        rows = [
+            tuple(self.finding_class(payload).findingOutput().values())
+            for payload in message["handlerData"]["findings"]
+        ]
+        if self.severity_engine is not None:
+            # The fired rule is written into each row's toolFindingJson
+            rows, _ = self.severity_engine.apply_rows(rows)
+        run_id = message["handlerConfig"].get(RUN_ID_KEY)
+        if self.sync and run_id is not None:
+            # Staged before writing: a staged id that never got written is harmless to
+            # finish_sync, a written one that was never staged would be resolved.
+            # Column 3 of a findingOutput row is toolFindingId.
+            self.db.stage_run_findings(run_id, [row[3] for row in rows])
+        with span(
+            self.tracer,
+            "persist",
+            attributes={"voltron.table": self.table, "voltron.rows": len(rows)},
+            kind="client",
+        ):
+            self.db.write_to_table(self.table, rows, onConflict=self.onConflict)
+        return []
@@ -1,12 +1,197 @@
 import psycopg2
+import psycopg2.extras
+import json
 import logging
 import os
+import uuid
+
+from typing import Optional
+
+from voltronsecurity import voltron_blobs
 
-FORMAT = "[%(filename)s:%(lineno)s - %(funcName)s() ] %(message)s"
-logging.basicConfig(format=FORMAT)
 logger = logging.getLogger("voltron")
 logger.setLevel(os.environ.get("APP_LOGLEVEL", logging.DEBUG))
 
+FINDING_COLUMNS = (
+    "toolName",
+    "resourceType",
+    "resourceId",
+    "toolFindingId",
+    "toolFindingSummary",
+    "toolFindingJson",
+    "toolFindingURL",
+    "toolFindingSeverity",
+    "voltronSeverity",
+    "extractDate",
+    "findingDate",
+)
+
+
+class VoltronStoredFinding:
+    """A VOLTRON_FINDINGS row read back from the database.
+    Has the same attributes and findingOutput() as a VoltronFinding, without re-running
+    processPayload. toolFindingJson is None when the query skipped it.
+    """
+
+    __slots__ = FINDING_COLUMNS
+
+    def __init__(self, row):
+        for column, value in zip(FINDING_COLUMNS, row):
+            setattr(self, column, value)
+
+    def __repr__(self):
+        return "VoltronStoredFinding({}, {})".format(self.toolName, self.toolFindingId)
+
+    def findingOutput(self) -> dict:
+        output = {x: getattr(self, x) for x in FINDING_COLUMNS}
+        output["toolFindingJson"] = json.dumps(self.toolFindingJson)
+        for column in ("extractDate", "findingDate"):
+            if hasattr(output[column], "isoformat"):
+                output[column] = output[column].isoformat()
+        return output
+
+
+# Shared by create_summary_tables and create_sync_tables, which may run in either order
+STATUS_COLUMN = "ADD COLUMN IF NOT EXISTS findingStatus TEXT NOT NULL DEFAULT 'OPEN'"
+
+# Used by the summary trigger: the changed rows of one statement, counted +1 or -1.
+# Resolved findings are left out, so resolving one is an update that only subtracts.
+SUMMARY_ROWS = """
+    SELECT COALESCE(toolName, 'UNKNOWN') AS toolName,
+        COALESCE(resourceType, 'UNKNOWN') AS resourceType,
+        COALESCE(voltronSeverity, 'UNKNOWN') AS voltronSeverity,
+        {1} AS delta
+    FROM {0} WHERE findingStatus <> 'RESOLVED'
+"""
+
+SUMMARY_DELTA = """
+    WITH delta AS ({delta}),
+    tool_counts AS (
+        INSERT INTO {tool} AS summary
+        SELECT toolName, voltronSeverity, SUM(delta) FROM delta
+        GROUP BY 1, 2 HAVING SUM(delta) <> 0 ORDER BY 1, 2
+        ON CONFLICT (toolName, voltronSeverity) DO UPDATE
+        SET findingCount = summary.findingCount + EXCLUDED.findingCount
+    )
+    INSERT INTO {resource} AS summary
+    SELECT toolName, resourceType, voltronSeverity, SUM(delta) FROM delta
+    GROUP BY 1, 2, 3 HAVING SUM(delta) <> 0 ORDER BY 1, 2, 3
+    ON CONFLICT (toolName, resourceType, voltronSeverity) DO UPDATE
+    SET findingCount = summary.findingCount + EXCLUDED.findingCount;
+"""
+
+def summary_names(table: str) -> tuple[str, str, str]:
+    """(tool summary table, resource summary table, trigger function) of a findings table.
+    Each findings table gets its own, so two tables never share counts. VOLTRON_FINDINGS keeps
+    the original VOLTRON_SUMMARY_* names.
+    """
+    if table.upper() == "VOLTRON_FINDINGS":
+        return "VOLTRON_SUMMARY_TOOL", "VOLTRON_SUMMARY_RESOURCE", "voltron_summarize_findings"
+    return (
+        "{}_SUMMARY_TOOL".format(table),
+        "{}_SUMMARY_RESOURCE".format(table),
+        "{}_summarize".format(table).lower(),
+    )
+
+
+# Used by finish_sync. Marks the staged findings of a run as seen, and counts them by the
+# state they were in before: never seen by a sync (new), resolved (reopened), or open.
+SYNC_SEEN = """
+    WITH previous AS (
+        SELECT toolFindingId, findingStatus, lastSeenRun FROM {table}
+        WHERE ({where}) AND toolFindingId IN (
+            SELECT toolFindingId FROM VOLTRON_RUN_FINDINGS WHERE runId = %s
+        )
+        FOR UPDATE
+    ),
+    seen AS (
+        UPDATE {table} SET findingStatus = 'OPEN', lastSeenRun = %s,
+            syncScope = COALESCE(%s, {table}.syncScope),
+            lastSeenDate = (now() AT TIME ZONE 'UTC'), resolvedDate = NULL
+        FROM previous WHERE {table}.toolFindingId = previous.toolFindingId
+        RETURNING previous.findingStatus AS previousStatus, previous.lastSeenRun AS previousRun
+    )
+    SELECT COUNT(*) FILTER (WHERE previousRun IS NULL),
+        COUNT(*) FILTER (WHERE previousRun IS NOT NULL AND previousStatus = 'RESOLVED'),
+        COUNT(*) FILTER (WHERE previousRun IS NOT NULL AND previousStatus <> 'RESOLVED')
+    FROM seen
+"""
+
+# Stage failures recorded by VoltronPostgresRunTracker; finish_sync refuses runs that have any
+RUN_FAILURES_TABLE = """
+    CREATE TABLE IF NOT EXISTS VOLTRON_RUN_FAILURES (
+        run_id TEXT,
+        failureKey TEXT,
+        stage TEXT,
+        message TEXT,
+        failedDate TIMESTAMP WITHOUT TIME ZONE DEFAULT (now() at time zone 'utc'),
+        PRIMARY KEY (run_id, failureKey)
+    )
+"""
+
+# Anti-join: open findings in scope that the run did not stage
+SYNC_RESOLVE = """
+    UPDATE {table} SET findingStatus = 'RESOLVED', resolvedDate = (now() AT TIME ZONE 'UTC')
+    WHERE ({where}) AND findingStatus = 'OPEN'
+    AND NOT EXISTS (
+        SELECT 1 FROM VOLTRON_RUN_FINDINGS staged
+        WHERE staged.runId = %s AND staged.toolFindingId = {table}.toolFindingId
+    )
+"""
+
+
+def _any_of(value):
+    if isinstance(value, (list, tuple, set)):
+        return list(value)
+    return [value]
+
+
+def finding_filters(
+    tool=None,
+    resource_type=None,
+    resource_id=None,
+    severity=None,
+    tool_severity=None,
+    since=None,
+    until=None,
+    date_column: str = "findingDate",
+    status=None,
+    scope=None,
+) -> tuple[str, list]:
+    """Build the WHERE clause shared by every findings read and export.
+    tool, resource_type, resource_id, severity (voltronSeverity), tool_severity, status
+    (findingStatus) and scope (syncScope, see VoltronDB.create_sync_tables) accept a value or a
+    list of values.
+    since (inclusive) and until (exclusive) bound date_column.
+    Returns (sql, params); sql is "TRUE" when no filter is set.
+    """
+    if date_column not in ("findingDate", "extractDate"):
+        raise ValueError("date_column must be findingDate or extractDate")
+
+    clauses = []
+    params = []
+    for column, value in (
+        ("toolName", tool),
+        ("resourceType", resource_type),
+        ("resourceId", resource_id),
+        ("voltronSeverity", severity),
+        ("toolFindingSeverity", tool_severity),
+        ("findingStatus", status),
+        ("syncScope", scope),
+    ):
+        if value is not None:
+            clauses.append("{} = ANY(%s)".format(column))
+            params.append(_any_of(value))
+    if since is not None:
+        clauses.append("{} >= %s".format(date_column))
+        params.append(since)
+    if until is not None:
+        clauses.append("{} < %s".format(date_column))
+        params.append(until)
+    if not clauses:
+        return "TRUE", params
+    return " AND ".join(clauses), params
+
 
 class VoltronPostgres:
     def __init__(self, host, user, password, port, db):
@@ -32,6 +217,39 @@ class VoltronPostgres:
             pg_handler.commit()
             cursor.close()
 
+    def write_batch(
+        self,
+        t_name,
+        t_rows,
+        pg_handler=None,
+        onConflict="DO NOTHING",
+        page_size=1000,
+        commit=True,
+    ):
+        """Same as write_to_table, but sends page_size rows per INSERT with execute_values.
+        Rows in one call must not repeat a conflict key when onConflict is DO UPDATE.
+        Rolls back and re-raises on failure, leaving the connection usable.
+        Pass commit=False to leave the transaction open for further writes.
+        """
+        if pg_handler is None:
+            pg_handler = self.pg_handler
+
+        if len(t_rows) == 0:
+            logger.info("Received 0 rows to write")
+            return
+        logger.info("Writing {} rows to {}".format(len(t_rows), t_name))
+        cursor = pg_handler.cursor()
+        statement = "INSERT INTO {} VALUES %s ON CONFLICT {}".format(t_name, onConflict)
+        try:
+            psycopg2.extras.execute_values(cursor, statement, t_rows, page_size=page_size)
+            if commit:
+                pg_handler.commit()
+        except Exception:
+            pg_handler.rollback()
+            raise
+        finally:
+            cursor.close()
+
     def execute_statement(self, statement, pg_handler=None):
         if pg_handler is None:
             pg_handler = self.pg_handler
@@ -43,6 +261,11 @@ class VoltronPostgres:
 
 
 class VoltronDB(VoltronPostgres):
+    def __init__(self, host, user, password, port, db, max_known_blobs=1000000):
+        super().__init__(host, user, password, port, db)
+        self.known_blobs = set()
+        self.max_known_blobs = max_known_blobs
+
     def create_tables(self, pg_handler=None):
         if pg_handler is None:
             pg_handler = self.pg_handler
@@ -81,7 +304,677 @@ class VoltronDB(VoltronPostgres):
                 findingDate TIMESTAMP WITHOUT TIME ZONE
             )
             """,
+            """
+            CREATE INDEX IF NOT EXISTS voltron_findings_tool_date
+                ON VOLTRON_FINDINGS (toolName, findingDate)
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS voltron_findings_severity
+                ON VOLTRON_FINDINGS (voltronSeverity)
+            """,
         ]
 
         for statement in table_statements:
             self.execute_statement(statement)
+
+    def create_summary_tables(self, table="VOLTRON_FINDINGS", pg_handler=None):
+        """Severity-by-tool and severity-by-resource counts for dashboards.
+        Statement-level triggers on the findings table fold each write batch into the counts,
+        so an upsert of N rows costs one aggregate over those N rows, not a table scan.
+        Run refresh_summaries once after creating them on a populated table.
+        Counts only cover findings that are not RESOLVED (see create_sync_tables), so the
+        findingStatus column is added here too. EXECUTE PROCEDURE keeps PostgreSQL 10 support;
+        on 10, adding the column rewrites the table once.
+        The summary tables and trigger function are named after table (see summary_names).
+        """
+        if pg_handler is None:
+            pg_handler = self.pg_handler
+
+        tool_table, resource_table, function = summary_names(table)
+
+        def delta(rows):
+            return SUMMARY_DELTA.format(delta=rows, tool=tool_table, resource=resource_table)
+
+        table_statements = [
+            "ALTER TABLE {} {}".format(table, STATUS_COLUMN),
+            """
+            CREATE TABLE IF NOT EXISTS {} (
+                toolName TEXT,
+                voltronSeverity TEXT,
+                findingCount BIGINT,
+                PRIMARY KEY (toolName, voltronSeverity)
+            )
+            """.format(tool_table),
+            """
+            CREATE TABLE IF NOT EXISTS {} (
+                toolName TEXT,
+                resourceType TEXT,
+                voltronSeverity TEXT,
+                findingCount BIGINT,
+                PRIMARY KEY (toolName, resourceType, voltronSeverity)
+            )
+            """.format(resource_table),
+            """
+            CREATE OR REPLACE FUNCTION {function}() RETURNS TRIGGER AS $$
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    {insert}
+                ELSIF TG_OP = 'DELETE' THEN
+                    {delete}
+                ELSE
+                    {update}
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+            """.format(
+                function=function,
+                insert=delta(SUMMARY_ROWS.format("new_rows", 1)),
+                delete=delta(SUMMARY_ROWS.format("old_rows", -1)),
+                update=delta(
+                    "{} UNION ALL {}".format(
+                        SUMMARY_ROWS.format("new_rows", 1), SUMMARY_ROWS.format("old_rows", -1)
+                    )
+                ),
+            ),
+        ]
+        # A trigger with transition tables can only handle one kind of event
+        for event, tables in (
+            ("INSERT", "NEW TABLE AS new_rows"),
+            ("UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows"),
+            ("DELETE", "OLD TABLE AS old_rows"),
+        ):
+            trigger = "{}_summary_{}".format(table, event).lower()
+            table_statements.append("DROP TRIGGER IF EXISTS {} ON {}".format(trigger, table))
+            table_statements.append(
+                """
+                CREATE TRIGGER {} AFTER {} ON {}
+                REFERENCING {}
+                FOR EACH STATEMENT EXECUTE PROCEDURE {}()
+                """.format(trigger, event, table, tables, function)
+            )
+
+        for statement in table_statements:
+            self.execute_statement(statement, pg_handler)
+
+    def refresh_summaries(self, table="VOLTRON_FINDINGS", pg_handler=None):
+        """Rebuild the summary tables from a full scan, in one transaction.
+        Only needed to backfill, or on a schedule to correct drift; readers keep seeing the
+        old counts until it commits.
+        """
+        if pg_handler is None:
+            pg_handler = self.pg_handler
+
+        tool_table, resource_table, _ = summary_names(table)
+        cursor = pg_handler.cursor()
+        try:
+            cursor.execute(
+                "LOCK TABLE {}, {} IN EXCLUSIVE MODE".format(tool_table, resource_table)
+            )
+            cursor.execute("DELETE FROM {}".format(tool_table))
+            cursor.execute(
+                """
+                INSERT INTO {}
+                SELECT COALESCE(toolName, 'UNKNOWN'), COALESCE(voltronSeverity, 'UNKNOWN'), COUNT(*)
+                FROM {} WHERE findingStatus <> 'RESOLVED' GROUP BY 1, 2
+                """.format(tool_table, table)
+            )
+            cursor.execute("DELETE FROM {}".format(resource_table))
+            cursor.execute(
+                """
+                INSERT INTO {}
+                SELECT COALESCE(toolName, 'UNKNOWN'), COALESCE(resourceType, 'UNKNOWN'),
+                    COALESCE(voltronSeverity, 'UNKNOWN'), COUNT(*)
+                FROM {} WHERE findingStatus <> 'RESOLVED' GROUP BY 1, 2, 3
+                """.format(resource_table, table)
+            )
+            pg_handler.commit()
+        except Exception:
+            pg_handler.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def get_summary(self, by="tool", table="VOLTRON_FINDINGS", pg_handler=None) -> list[dict]:
+        """Read precomputed counts of table. by is "tool" or "resource"."""
+        if pg_handler is None:
+            pg_handler = self.pg_handler
+
+        tool_table, resource_table, _ = summary_names(table)
+        if by == "tool":
+            columns = ["toolName", "voltronSeverity", "findingCount"]
+            table = tool_table
+        elif by == "resource":
+            columns = ["toolName", "resourceType", "voltronSeverity", "findingCount"]
+            table = resource_table
+        else:
+            raise ValueError("by must be tool or resource")
+
+        cursor = pg_handler.cursor()
+        cursor.execute(
+            "SELECT {} FROM {} WHERE findingCount > 0 ORDER BY {}".format(
+                ", ".join(columns), table, ", ".join(columns[:-1])
+            )
+        )
+        rows = cursor.fetchall()
+        pg_handler.commit()
+        cursor.close()
+        return [dict(zip(columns, row)) for row in rows]
+
+    def create_sync_tables(self, table="VOLTRON_FINDINGS", pg_handler=None):
+        """Status and scope columns on the findings table, the VOLTRON_RUN_FINDINGS staging table
+        and the VOLTRON_RUN_FAILURES table read by finish_sync. Existing rows start OPEN with no
+        scope. The columns are added after the finding columns with defaults, so writers
+        inserting findingOutput rows are unaffected.
+        """
+        if pg_handler is None:
+            pg_handler = self.pg_handler
+
+        table_statements = [
+            """
+            ALTER TABLE {}
+                {},
+                ADD COLUMN IF NOT EXISTS lastSeenRun TEXT,
+                ADD COLUMN IF NOT EXISTS syncScope TEXT,
+                ADD COLUMN IF NOT EXISTS lastSeenDate TIMESTAMP WITHOUT TIME ZONE,
+                ADD COLUMN IF NOT EXISTS resolvedDate TIMESTAMP WITHOUT TIME ZONE
+            """.format(table, STATUS_COLUMN),
+            """
+            CREATE INDEX IF NOT EXISTS {} ON {} (toolName, findingStatus)
+            """.format("{}_status".format(table).lower(), table),
+            """
+            CREATE TABLE IF NOT EXISTS VOLTRON_RUN_FINDINGS (
+                runId TEXT,
+                toolFindingId TEXT,
+                PRIMARY KEY (runId, toolFindingId)
+            )
+            """,
+            RUN_FAILURES_TABLE,
+        ]
+
+        for statement in table_statements:
+            self.execute_statement(statement, pg_handler)
+
+    def stage_run_findings(self, run_id, finding_ids, pg_handler=None):
+        """Record that run_id saw finding_ids. Safe to call from many workers, and to repeat."""
+        # Sorted, so concurrent workers take the primary key locks in the same order
+        rows = [(run_id, x) for x in sorted(set(finding_ids))]
+        self.write_batch(
+            "VOLTRON_RUN_FINDINGS",
+            rows,
+            pg_handler=pg_handler,
+            onConflict="(runId, toolFindingId) DO NOTHING",
+        )
+
+    def finish_sync(
+        self,
+        run_id,
+        tool,
+        table="VOLTRON_FINDINGS",
+        allow_empty=False,
+        pg_handler=None,
+        scope=None,
+        failures=None,
+        allow_failures=False,
+        **filters,
+    ) -> dict:
+        """Close out a run: findings it staged are marked OPEN and seen by run_id, and OPEN
+        findings of tool it did not stage are marked RESOLVED. Both are single set-based
+        statements, in one transaction, after which the run's staging rows are dropped.
+        scope names the part of the tool the run crawled (a Snyk org, a Wiz tenant or project).
+        Findings the run saw are stamped with it, and only OPEN findings with that syncScope are
+        resolved; an unscoped run resolves across the whole tool. filters takes the other
+        keyword arguments of finding_filters and narrows both statements.
+        A run with failed fetches saw only part of its scope, so it raises ValueError unless
+        allow_failures. failures defaults to the run's rows in VOLTRON_RUN_FAILURES (written by
+        VoltronPostgresRunTracker); with the in-process tracker pass tracker.failures(run_id).
+        A run that staged nothing raises ValueError unless allow_empty.
+        Findings never seen by a sync before (including rows written before syncing was
+        enabled) count as new.
+        """
+        if pg_handler is None:
+            pg_handler = self.pg_handler
+
+        seen_where, seen_params = finding_filters(tool=tool, **filters)
+        where, params = finding_filters(tool=tool, scope=scope, **filters)
+        cursor = pg_handler.cursor()
+        try:
+            if failures is None:
+                cursor.execute(
+                    "SELECT stage, message FROM VOLTRON_RUN_FAILURES WHERE run_id = %s",
+                    (run_id,),
+                )
+                failures = [{"stage": x[0], "message": x[1]} for x in cursor.fetchall()]
+            if failures and not allow_failures:
+                raise ValueError(
+                    "Run {} has {} failed fetches and may have missed findings of {}; "
+                    "not resolving. First failure: {}".format(
+                        run_id, len(failures), tool, failures[0]
+                    )
+                )
+            cursor.execute(
+                "SELECT COUNT(*) FROM VOLTRON_RUN_FINDINGS WHERE runId = %s", (run_id,)
+            )
+            staged = cursor.fetchone()[0]
+            if staged == 0 and not allow_empty:
+                raise ValueError(
+                    "Run {} staged no findings; pass allow_empty to resolve all of {}".format(
+                        run_id, tool
+                    )
+                )
+            cursor.execute(
+                SYNC_SEEN.format(table=table, where=seen_where),
+                seen_params + [run_id, run_id, scope],
+            )
+            new, reopened, still_open = cursor.fetchone()
+            cursor.execute(SYNC_RESOLVE.format(table=table, where=where), params + [run_id])
+            resolved = cursor.rowcount
+            cursor.execute("DELETE FROM VOLTRON_RUN_FINDINGS WHERE runId = %s", (run_id,))
+            pg_handler.commit()
+        except Exception:
+            pg_handler.rollback()
+            raise
+        finally:
+            cursor.close()
+
+        counts = {
+            "runId": run_id,
+            "staged": staged,
+            "new": new,
+            "stillOpen": still_open,
+            "reopened": reopened,
+            "resolved": resolved,
+        }
+        logger.info(dict(counts, step="syncComplete", tool=tool, scope=scope))
+        return counts
+
+    def create_blob_tables(self, table="VOLTRON_FINDINGS_COMPACT", pg_handler=None):
+        """Optional layout for write_findings_compact: a findings table whose toolFindingJson
+        references shared sub-documents in VOLTRON_BLOBS.
+        """
+        if pg_handler is None:
+            pg_handler = self.pg_handler
+
+        table_statements = [
+            """
+            CREATE TABLE IF NOT EXISTS VOLTRON_BLOBS (
+                blobHash TEXT PRIMARY KEY,
+                blob JSONB
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS {} (
+                toolName TEXT,
+                resourceType TEXT,
+                resourceId TEXT,
+                toolFindingId TEXT PRIMARY KEY,
+                toolFindingSummary TEXT,
+                toolFindingJson JSONB,
+                toolFindingURL TEXT,
+                toolFindingSeverity TEXT,
+                voltronSeverity TEXT,
+                extractDate TIMESTAMP WITHOUT TIME ZONE,
+                findingDate TIMESTAMP WITHOUT TIME ZONE
+            )
+            """.format(table),
+        ]
+
+        for statement in table_statements:
+            self.execute_statement(statement, pg_handler)
+
+    def write_findings_compact(
+        self,
+        t_rows,
+        table="VOLTRON_FINDINGS_COMPACT",
+        paths=None,
+        onConflict="DO NOTHING",
+        pg_handler=None,
+    ):
+        """Write findingOutput rows with their toolFindingJson split into deduplicated blobs.
+        See voltron_blobs.split_document for paths. Blobs this connection has already
+        written are not sent again. Blobs and rows commit in one transaction, so a row never
+        references a blob that was rolled back.
+        """
+        if pg_handler is None:
+            pg_handler = self.pg_handler
+
+        compact_rows = []
+        new_blobs = {}
+        for row in t_rows:
+            row = list(row)
+            document = voltron_blobs.finding_document(row[5])
+            document, blobs = voltron_blobs.split_document(document, paths)
+            for digest, blob in blobs.items():
+                if digest not in self.known_blobs:
+                    new_blobs[digest] = blob
+            row[5] = json.dumps(document)
+            compact_rows.append(tuple(row))
+
+        try:
+            if new_blobs:
+                self.write_batch(
+                    "VOLTRON_BLOBS",
+                    [(digest, json.dumps(blob)) for digest, blob in new_blobs.items()],
+                    pg_handler=pg_handler,
+                    onConflict="(blobHash) DO NOTHING",
+                    commit=False,
+                )
+            self.write_batch(
+                table, compact_rows, pg_handler=pg_handler, onConflict=onConflict, commit=False
+            )
+            pg_handler.commit()
+        except Exception:
+            pg_handler.rollback()
+            raise
+        if len(self.known_blobs) > self.max_known_blobs:
+            self.known_blobs.clear()
+        self.known_blobs.update(new_blobs.keys())
+        logger.info(
+            {"step": "writeCompactComplete", "rows": len(compact_rows), "newBlobs": len(new_blobs)}
+        )
+
+    def fetch_blobs(self, hashes, pg_handler=None, commit=True):
+        if pg_handler is None:
+            pg_handler = self.pg_handler
+        if not hashes:
+            return {}
+
+        cursor = pg_handler.cursor()
+        cursor.execute(
+            "SELECT blobHash, blob FROM VOLTRON_BLOBS WHERE blobHash = ANY(%s)",
+            (list(hashes),),
+        )
+        blobs = {digest: voltron_blobs.load_finding_json(blob) for digest, blob in cursor.fetchall()}
+        if commit:
+            pg_handler.commit()
+        cursor.close()
+        return blobs
+
+    def reassemble_documents(self, documents, pg_handler=None, commit=True):
+        """Replace blob references in a list of toolFindingJson documents, with one blob lookup.
+        Documents are column values as the driver returns them and are not decoded again;
+        documents without references are returned unchanged and cost no query.
+        """
+        refs = set()
+        for document in documents:
+            refs.update(voltron_blobs.find_blob_refs(document))
+        blobs = self.fetch_blobs(refs, pg_handler, commit)
+        # Blobs only ever come from top-level splits, but a blob could itself hold references
+        nested = set()
+        for blob in blobs.values():
+            nested.update(voltron_blobs.find_blob_refs(blob))
+        nested -= set(blobs)
+        if nested:
+            blobs.update(self.fetch_blobs(nested, pg_handler, commit))
+        return [voltron_blobs.join_document(x, blobs) for x in documents]
+
+    def _select_findings(self, table, where, include_json, after=None, limit=None):
+        columns = list(FINDING_COLUMNS)
+        if not include_json:
+            columns[FINDING_COLUMNS.index("toolFindingJson")] = "NULL"
+        if after is not None:
+            where = "({}) AND toolFindingId > %s".format(where)
+        statement = "SELECT {} FROM {} WHERE {} ORDER BY toolFindingId".format(
+            ", ".join(columns), table, where
+        )
+        if limit is not None:
+            statement += " LIMIT %s"
+        return statement
+
+    def _to_findings(self, rows, include_json, reassemble, pg_handler, commit=True):
+        findings = [VoltronStoredFinding(x) for x in rows]
+        if include_json and reassemble and findings:
+            documents = self.reassemble_documents(
+                [x.toolFindingJson for x in findings], pg_handler, commit
+            )
+            for finding, document in zip(findings, documents):
+                finding.toolFindingJson = document
+        return findings
+
+    def query_findings(
+        self,
+        after: Optional[str] = None,
+        page_size: int = 1000,
+        table: str = "VOLTRON_FINDINGS",
+        include_json: bool = True,
+        reassemble: bool = True,
+        pg_handler=None,
+        **filters,
+    ) -> tuple[list[VoltronStoredFinding], Optional[str]]:
+        """Read one page of findings, ordered by toolFindingId.
+        filters are the keyword arguments of finding_filters. Pass the returned key as after
+        to get the next page; it is None on the last page. Rows written with
+        write_findings_compact come back reassembled unless reassemble is False.
+        """
+        if pg_handler is None:
+            pg_handler = self.pg_handler
+
+        where, params = finding_filters(**filters)
+        if after is not None:
+            params.append(after)
+        params.append(page_size)
+        cursor = pg_handler.cursor()
+        try:
+            cursor.execute(
+                self._select_findings(table, where, include_json, after, page_size), params
+            )
+            rows = cursor.fetchall()
+            findings = self._to_findings(rows, include_json, reassemble, pg_handler, False)
+        finally:
+            cursor.close()
+            pg_handler.commit()
+
+        next_key = None
+        if len(findings) == page_size:
+            next_key = findings[-1].toolFindingId
+        return findings, next_key
+
+    def iter_findings(
+        self,
+        batch_size: int = 2000,
+        table: str = "VOLTRON_FINDINGS",
+        include_json: bool = True,
+        reassemble: bool = True,
+        pg_handler=None,
+        **filters,
+    ):
+        """Stream every matching finding through a server-side named cursor.
+        Only batch_size rows are held in memory at a time. The cursor lives in a transaction,
+        so don't write on the same connection until the generator is exhausted or closed.
+        """
+        if pg_handler is None:
+            pg_handler = self.pg_handler
+
+        where, params = finding_filters(**filters)
+        cursor = pg_handler.cursor(name="voltron_findings_{}".format(uuid.uuid4().hex))
+        cursor.itersize = batch_size
+        count = 0
+        try:
+            cursor.execute(self._select_findings(table, where, include_json), params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for finding in self._to_findings(
+                    rows, include_json, reassemble, pg_handler, False
+                ):
+                    count += 1
+                    yield finding
+        finally:
+            cursor.close()
+            pg_handler.commit()
+            logger.debug({"step": "iterFindingsComplete", "table": table, "findings": count})
+
+
+class VoltronPostgresRunTracker(VoltronPostgres):
+    """Run tracker backed by the VOLTRON_RUNS table, for stages running in separate workers.
+    Same interface as voltron_pipeline.VoltronRunTracker. Counter updates are single
+    UPDATE ... RETURNING statements, so concurrent workers never lose an update and only
+    one of them sees the run finish.
+    """
+
+    def __init__(self, host, user, password, port, db, on_complete=None):
+        super().__init__(host, user, password, port, db)
+        self.on_complete = on_complete
+
+    def create_tables(self, pg_handler=None):
+        self.execute_statement(
+            """
+            CREATE TABLE IF NOT EXISTS VOLTRON_RUNS (
+                run_id TEXT PRIMARY KEY,
+                outstanding BIGINT NOT NULL,
+                startDate TIMESTAMP WITHOUT TIME ZONE DEFAULT (now() at time zone 'utc'),
+                completedDate TIMESTAMP WITHOUT TIME ZONE
+            )
+            """,
+            pg_handler,
+        )
+        self.execute_statement(RUN_FAILURES_TABLE, pg_handler)
+
+    def _fetch_one(self, statement, params, pg_handler=None):
+        if pg_handler is None:
+            pg_handler = self.pg_handler
+
+        cursor = pg_handler.cursor()
+        cursor.execute(statement, params)
+        row = cursor.fetchone()
+        pg_handler.commit()
+        cursor.close()
+        return row
+
+    def start_run(self, run_id, outstanding=1):
+        self._fetch_one(
+            "INSERT INTO VOLTRON_RUNS (run_id, outstanding) VALUES (%s, %s) RETURNING run_id",
+            (run_id, outstanding),
+        )
+
+    def add_children(self, run_id, count):
+        row = self._fetch_one(
+            "UPDATE VOLTRON_RUNS SET outstanding = outstanding + %s WHERE run_id = %s RETURNING outstanding",
+            (count, run_id),
+        )
+        return row[0]
+
+    def complete_child(self, run_id, count=1):
+        """Mark count messages as done. Returns True for the call that finished the run."""
+        row = self._fetch_one(
+            """
+            UPDATE VOLTRON_RUNS
+            SET outstanding = outstanding - %s,
+                completedDate = CASE WHEN outstanding - %s <= 0
+                    THEN (now() at time zone 'utc') ELSE NULL END
+            WHERE run_id = %s AND completedDate IS NULL
+            RETURNING outstanding
+            """,
+            (count, count, run_id),
+        )
+        finished = row is not None and row[0] <= 0
+        if finished:
+            logger.info({"step": "runComplete", "runId": run_id})
+            if self.on_complete is not None:
+                self.on_complete(run_id)
+        return finished
+
+    def outstanding(self, run_id):
+        row = self._fetch_one(
+            "SELECT outstanding FROM VOLTRON_RUNS WHERE run_id = %s", (run_id,)
+        )
+        return row[0]
+
+    def is_complete(self, run_id):
+        row = self._fetch_one(
+            "SELECT completedDate IS NOT NULL FROM VOLTRON_RUNS WHERE run_id = %s",
+            (run_id,),
+        )
+        return row[0]
+
+    def record_failure(self, run_id, key, stage, message):
+        self._fetch_one(
+            """
+            INSERT INTO VOLTRON_RUN_FAILURES (run_id, failureKey, stage, message)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (run_id, failureKey) DO UPDATE SET stage = EXCLUDED.stage,
+                message = EXCLUDED.message, failedDate = EXCLUDED.failedDate
+            RETURNING run_id
+            """,
+            (run_id, key, stage, message),
+        )
+
+    def clear_failure(self, run_id, key):
+        self._fetch_one(
+            "DELETE FROM VOLTRON_RUN_FAILURES WHERE run_id = %s AND failureKey = %s RETURNING run_id",
+            (run_id, key),
+        )
+
+    def failures(self, run_id, pg_handler=None):
+        if pg_handler is None:
+            pg_handler = self.pg_handler
+
+        cursor = pg_handler.cursor()
+        cursor.execute(
+            "SELECT failureKey, stage, message FROM VOLTRON_RUN_FAILURES WHERE run_id = %s",
+            (run_id,),
+        )
+        rows = cursor.fetchall()
+        pg_handler.commit()
+        cursor.close()
+        return [{"key": x[0], "stage": x[1], "message": x[2]} for x in rows]
+
+
+class VoltronPostgresCheckpointStore(VoltronPostgres):
+    """Crawl checkpoints in the VOLTRON_CHECKPOINTS table.
+    Same interface as voltron_checkpoint.VoltronCheckpointStore.
+    """
+
+    def create_tables(self, pg_handler=None):
+        self.execute_statement(
+            """
+            CREATE TABLE IF NOT EXISTS VOLTRON_CHECKPOINTS (
+                crawl_id TEXT PRIMARY KEY,
+                cursor TEXT,
+                updateDate TIMESTAMP WITHOUT TIME ZONE
+            )
+            """,
+            pg_handler,
+        )
+
+    def load(self, crawl_id, pg_handler=None):
+        if pg_handler is None:
+            pg_handler = self.pg_handler
+
+        cursor = pg_handler.cursor()
+        cursor.execute(
+            "SELECT cursor, updateDate FROM VOLTRON_CHECKPOINTS WHERE crawl_id = %s",
+            (crawl_id,),
+        )
+        row = cursor.fetchone()
+        pg_handler.commit()
+        cursor.close()
+        if row is None:
+            return None
+        return {"cursor": row[0], "updated": row[1]}
+
+    def save(self, crawl_id, page_cursor, pg_handler=None):
+        if pg_handler is None:
+            pg_handler = self.pg_handler
+
+        cursor = pg_handler.cursor()
+        cursor.execute(
+            """
+            INSERT INTO VOLTRON_CHECKPOINTS VALUES (%s, %s, now() at time zone 'utc')
+            ON CONFLICT (crawl_id) DO UPDATE
+            SET cursor = EXCLUDED.cursor, updateDate = EXCLUDED.updateDate
+            """,
+            (crawl_id, page_cursor),
+        )
+        pg_handler.commit()
+        cursor.close()
+
+    def clear(self, crawl_id, pg_handler=None):
+        if pg_handler is None:
+            pg_handler = self.pg_handler
+
+        cursor = pg_handler.cursor()
+        cursor.execute("DELETE FROM VOLTRON_CHECKPOINTS WHERE crawl_id = %s", (crawl_id,))
+        pg_handler.commit()
+        cursor.close()
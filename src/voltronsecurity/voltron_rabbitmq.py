@@ -4,16 +4,46 @@ from voltronsecurity.voltron_base import (
     VoltronBaseMessageInterface,
 )
 
+from voltronsecurity.voltron_retry import (
+    ATTEMPT_HEADER,
+    ERROR_HEADER,
+    VoltronRetryPolicy,
+    dead_letter_queue_name,
+    get_attempt,
+    retry_queue_name,
+)
+
+from voltronsecurity.voltron_tracing import restore_context, trace_headers
+
+from voltronsecurity.helpers import import_optional
+
 from typing import Optional
 
+import asyncio
+import copy
+import functools
 import logging
 import json
 import pika
 
-FORMAT = "[%(filename)s:%(lineno)s - %(funcName)s() ] %(message)s"
-logging.basicConfig(format=FORMAT)
 logger = logging.getLogger("voltron")
 
+# AMQP properties a retried or dead-lettered message keeps; only its headers change
+REPUBLISHED_PROPERTIES = (
+    "content_type",
+    "content_encoding",
+    "delivery_mode",
+    "priority",
+    "correlation_id",
+    "reply_to",
+    "expiration",
+    "message_id",
+    "timestamp",
+    "type",
+    "user_id",
+    "app_id",
+)
+
 
 class VoltronRabbitMQQueue(VoltronBaseMessageInterface):
     def __init__(
@@ -21,10 +51,12 @@ class VoltronRabbitMQQueue(VoltronBaseMessageInterface):
         queue_name: str,
         queue_endpoint: str,
         credential: Optional[dict[str, str]] = None,
+        retry_policy: Optional[VoltronRetryPolicy] = None,
     ):
         self.queue_name = queue_name
         self.queue_endpoint = queue_endpoint
         self.creds = credential
+        self.retry_policy = retry_policy
 
     def get_client(
         self, queue_endpoint: Optional[str] = None, creds: Optional[dict] = None
@@ -39,7 +71,13 @@ class VoltronRabbitMQQueue(VoltronBaseMessageInterface):
     def process_message(
         self, ch, method, properties, body
     ) -> VoltronBaseProcessResponse:
-        """Callback method. Override in child class."""
+        """Callback method. Override in child class.
+        Without a retry policy this is the raw pika callback and must ack the delivery itself.
+        Trace context arrives in properties.headers; restore_context(json.loads(body),
+        properties.headers) puts it back on the decoded message for a traced stage.
+        With a retry policy it must return a VoltronBaseProcessResponse and must not ack:
+        the queue acks on success and retries or dead-letters on failure.
+        """
         result = {
             "success": True,
             "message": "Default RabbitMQ Response. Message Dropped.",
@@ -47,6 +85,76 @@ class VoltronRabbitMQQueue(VoltronBaseMessageInterface):
         }
         return result
 
+    def declare_retry_queues(self, channel, queue: Optional[str] = None):
+        """Declare one delay queue per retry step plus the dead-letter queue.
+        Delay queues have no consumers; RabbitMQ expires each message after the queue TTL
+        and dead-letters it back onto the work queue.
+        """
+        if queue is None:
+            queue = self.queue_name
+        for delay in self.retry_policy.delays():
+            channel.queue_declare(
+                queue=retry_queue_name(queue, delay),
+                arguments={
+                    "x-message-ttl": int(delay * 1000),
+                    "x-dead-letter-exchange": "",
+                    "x-dead-letter-routing-key": queue,
+                },
+            )
+        channel.queue_declare(
+            queue=dead_letter_queue_name(queue), arguments={"x-queue-mode": "lazy"}
+        )
+
+    def retry_message(self, ch, method, properties, body, reason: str, queue: str):
+        """Republish a failed message to the next delay queue, or to the dead-letter queue
+        once the policy runs out of attempts, then ack the original delivery.
+        """
+        headers = dict(properties.headers or {})
+        attempt = get_attempt(headers)
+        if self.retry_policy.should_retry(attempt):
+            target = retry_queue_name(queue, self.retry_policy.delay_for(attempt))
+            headers[ATTEMPT_HEADER] = attempt + 1
+        else:
+            target = dead_letter_queue_name(queue)
+            headers[ERROR_HEADER] = reason
+        logger.warning(
+            "Attempt {} failed for message on {}. Sending to {}".format(
+                attempt, queue, target
+            )
+        )
+        # Keep delivery_mode, correlation_id, message_id and the rest; only headers change
+        republished = copy.copy(properties)
+        republished.headers = headers
+        ch.basic_publish(
+            exchange="",
+            routing_key=target,
+            body=body,
+            properties=republished,
+        )
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+
+    def _process_with_retry(self, ch, method, properties, body, queue=None):
+        """Callback used when a retry policy is set. The queue owns acking:
+        process_message returns a VoltronBaseProcessResponse and must not ack itself.
+        """
+        try:
+            result = self.process_message(ch, method, properties, body)
+        except Exception as e:
+            logger.error(e)
+            result = {"success": False, "message": str(e), "data": {}}
+        if result is None:
+            # An ack from process_message followed by our own ack or republish would close
+            # the channel, or duplicate the message, so a missing response is a programming error
+            raise TypeError(
+                "{}.process_message must return a VoltronBaseProcessResponse and leave "
+                "acking to the queue when a retry policy is set".format(type(self).__name__)
+            )
+        if result["success"]:
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+        else:
+            self.retry_message(ch, method, properties, body, result["message"], queue)
+        return result
+
     def handle_messages(
         self,
         client: Optional[pika.BlockingConnection] = None,
@@ -58,10 +166,14 @@ class VoltronRabbitMQQueue(VoltronBaseMessageInterface):
         if queue is None:
             queue = self.queue_name
         channel = client.channel()
+        callback = self.process_message
         try:
             channel.queue_declare(queue=queue, arguments={"x-queue-mode": "lazy"})
+            if self.retry_policy is not None:
+                self.declare_retry_queues(channel, queue)
+                callback = functools.partial(self._process_with_retry, queue=queue)
             channel.basic_consume(
-                queue=queue, on_message_callback=self.process_message, auto_ack=False
+                queue=queue, on_message_callback=callback, auto_ack=False
             )
             channel.start_consuming()
         except Exception as e:
@@ -107,11 +219,312 @@ class VoltronRabbitMQQueue(VoltronBaseMessageInterface):
         channel = client.channel()
         channel.queue_declare(queue=queue, arguments={"x-queue-mode": "lazy"})
         try:
-            channel.basic_publish(exchange="", routing_key=queue, body=formatted)
+            channel.basic_publish(
+                exchange="",
+                routing_key=queue,
+                body=formatted,
+                properties=pika.BasicProperties(headers=trace_headers(message)),
+            )
             response = {
                 "success": True,
                 "message": "Sent message.",
             }
         except Exception as e:
             response = {"success": False, "message": str(e)}
+        # Callers may reuse one connection for many sends; an open channel per send would
+        # exhaust its channel ids
+        channel.close()
+        return response
+
+    async def send_messages(
+        self,
+        messages: list[VoltronMessagePayload],
+        client: Optional[pika.BlockingConnection] = None,
+        queue: Optional[str] = None,
+    ) -> VoltronBaseProcessResponse:
+        """Publish several messages over a single channel"""
+        if client is None:
+            client = self.get_client()
+        if queue is None:
+            queue = self.queue_name
+        channel = client.channel()
+        channel.queue_declare(queue=queue, arguments={"x-queue-mode": "lazy"})
+        failures = []
+        for index, message in enumerate(messages):
+            formatted = self.generate_message(
+                message["handlerName"],
+                message["handlerConfig"],
+                message["handlerData"],
+                message["messageSource"],
+                message["startTime"],
+            )
+            try:
+                channel.basic_publish(
+                    exchange="",
+                    routing_key=queue,
+                    body=formatted,
+                    properties=pika.BasicProperties(headers=trace_headers(message)),
+                )
+            except Exception as e:
+                failures.append({"index": index, "message": str(e)})
+        channel.close()
+        response = {
+            "success": len(failures) == 0,
+            "message": "Sent {} of {} messages".format(
+                len(messages) - len(failures), len(messages)
+            ),
+            "data": {"failures": failures},
+        }
+        return response
+
+
+class VoltronAsyncRabbitMQQueue(VoltronBaseMessageInterface):
+    """asyncio RabbitMQ queue built on aio-pika.
+    Mirrors VoltronAzureServiceBusQueue: process_message(message) is a coroutine that receives the
+    decoded VoltronMessagePayload, and the queue acks based on the response. Up to
+    max_concurrency messages are processed at once; prefetch is set to the same value.
+    Publishing uses publisher confirms, so send_message returns once the broker has the message.
+    Queues are declared with the same arguments as VoltronRabbitMQQueue, so both classes can
+    share queues.
+    """
+
+    def __init__(
+        self,
+        queue_name: str,
+        queue_endpoint: str,
+        credential: Optional[dict[str, str]] = None,
+        retry_policy: Optional[VoltronRetryPolicy] = None,
+        max_concurrency: int = 10,
+    ):
+        self.queue_name = queue_name
+        self.queue_endpoint = queue_endpoint
+        self.creds = credential
+        self.retry_policy = retry_policy
+        self.max_concurrency = max_concurrency
+
+    def get_url(
+        self, queue_endpoint: Optional[str] = None, creds: Optional[dict] = None
+    ) -> str:
+        if queue_endpoint is None:
+            queue_endpoint = self.queue_endpoint
+        if creds is None:
+            creds = self.creds
+        if queue_endpoint.startswith("amqp"):
+            return queue_endpoint
+        if creds and creds.get("username"):
+            return "amqp://{}:{}@{}/".format(
+                creds["username"], creds.get("password", ""), queue_endpoint
+            )
+        return "amqp://{}/".format(queue_endpoint)
+
+    async def get_client(
+        self, queue_endpoint: Optional[str] = None, creds: Optional[dict] = None
+    ):
+        aio_pika = import_optional("aio_pika", "rabbitmq")
+        return await aio_pika.connect_robust(self.get_url(queue_endpoint, creds))
+
+    async def declare_queue(self, channel, queue: str):
+        work_queue = await channel.declare_queue(
+            queue, arguments={"x-queue-mode": "lazy"}
+        )
+        if self.retry_policy is not None:
+            for delay in self.retry_policy.delays():
+                await channel.declare_queue(
+                    retry_queue_name(queue, delay),
+                    arguments={
+                        "x-message-ttl": int(delay * 1000),
+                        "x-dead-letter-exchange": "",
+                        "x-dead-letter-routing-key": queue,
+                    },
+                )
+            await channel.declare_queue(
+                dead_letter_queue_name(queue), arguments={"x-queue-mode": "lazy"}
+            )
+        return work_queue
+
+    async def process_message(
+        self, message: VoltronMessagePayload
+    ) -> VoltronBaseProcessResponse:
+        """Override this in child class to perform an action based on the message received."""
+        logger.debug("Processed Message : {}".format(message))
+        response = {
+            "success": True,
+            "message": "Default Message Processor. No action taken. Message deleted.",
+            "data": message,
+        }
+        return response
+
+    async def retry_message(self, channel, incoming, reason: str, queue: str):
+        """Republish a failed message to the next delay queue or the dead-letter queue, then ack it"""
+        aio_pika = import_optional("aio_pika", "rabbitmq")
+        headers = dict(incoming.headers or {})
+        attempt = get_attempt(headers)
+        if self.retry_policy.should_retry(attempt):
+            target = retry_queue_name(queue, self.retry_policy.delay_for(attempt))
+            headers[ATTEMPT_HEADER] = attempt + 1
+        else:
+            target = dead_letter_queue_name(queue)
+            headers[ERROR_HEADER] = reason
+        logger.warning(
+            "Attempt {} failed for message on {}. Sending to {}".format(
+                attempt, queue, target
+            )
+        )
+        properties = {x: getattr(incoming, x, None) for x in REPUBLISHED_PROPERTIES}
+        await channel.default_exchange.publish(
+            aio_pika.Message(body=incoming.body, headers=headers, **properties),
+            routing_key=target,
+        )
+        await incoming.ack()
+
+    async def _handle_one(self, channel, incoming, queue: str) -> VoltronBaseProcessResponse:
+        try:
+            resp = await self.process_message(
+                restore_context(json.loads(incoming.body), incoming.headers)
+            )
+        except Exception as e:
+            logger.error(e)
+            resp = {"success": False, "message": str(e), "data": {}}
+        if resp["success"]:
+            await incoming.ack()
+        elif self.retry_policy is not None:
+            await self.retry_message(channel, incoming, resp["message"], queue)
+        else:
+            await incoming.reject(requeue=True)
+        return resp
+
+    async def handle_messages(
+        self,
+        client=None,
+        queue: Optional[str] = None,
+        max_message_count: Optional[int] = None,
+        max_wait_time: Optional[float] = 5,
+    ) -> list[VoltronBaseProcessResponse]:
+        """Consume and process messages concurrently.
+        Returns after max_message_count messages, or once the queue has been idle for
+        max_wait_time seconds. Pass max_wait_time=None to consume forever.
+        """
+        owns_client = client is None
+        if owns_client:
+            client = await self.get_client()
+        if queue is None:
+            queue = self.queue_name
+
+        results = []
+        tasks = set()
+        try:
+            channel = await client.channel()
+            await channel.set_qos(prefetch_count=self.max_concurrency)
+            work_queue = await self.declare_queue(channel, queue)
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+
+            async def run(incoming):
+                try:
+                    results.append(await self._handle_one(channel, incoming, queue))
+                finally:
+                    semaphore.release()
+
+            received = 0
+            async with work_queue.iterator() as messages:
+                while max_message_count is None or received < max_message_count:
+                    await semaphore.acquire()
+                    try:
+                        incoming = await asyncio.wait_for(
+                            messages.__anext__(), max_wait_time
+                        )
+                    except (asyncio.TimeoutError, StopAsyncIteration):
+                        semaphore.release()
+                        break
+                    received += 1
+                    task = asyncio.ensure_future(run(incoming))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                if tasks:
+                    await asyncio.gather(*tasks)
+            await channel.close()
+        finally:
+            if owns_client:
+                await client.close()
+        return results
+
+    def generate_message(
+        self,
+        handlerName: str,
+        handlerConfig: dict,
+        handlerData: dict,
+        messageSource: str,
+        startTime: int,
+    ) -> VoltronMessagePayload:
+        body = {
+            "handlerName": handlerName,
+            "handlerConfig": handlerConfig,
+            "handlerData": handlerData,
+            "messageSource": messageSource,
+            "startTime": startTime,
+        }
+        message = json.dumps(body)
+        return message
+
+    def _to_amqp(self, message: VoltronMessagePayload):
+        aio_pika = import_optional("aio_pika", "rabbitmq")
+        formatted = self.generate_message(
+            message["handlerName"],
+            message["handlerConfig"],
+            message["handlerData"],
+            message["messageSource"],
+            message["startTime"],
+        )
+        return aio_pika.Message(
+            body=formatted.encode(),
+            content_type="application/json",
+            headers=trace_headers(message),
+        )
+
+    async def send_message(
+        self,
+        message: VoltronMessagePayload,
+        client=None,
+        queue: Optional[str] = None,
+    ) -> VoltronBaseProcessResponse:
+        response = await self.send_messages([message], client, queue)
+        if response["success"]:
+            return {"success": True, "message": "Sent message."}
+        return {"success": False, "message": response["data"]["failures"][0]["message"]}
+
+    async def send_messages(
+        self,
+        messages: list[VoltronMessagePayload],
+        client=None,
+        queue: Optional[str] = None,
+    ) -> VoltronBaseProcessResponse:
+        """Publish messages concurrently on one confirming channel"""
+        owns_client = client is None
+        if owns_client:
+            client = await self.get_client()
+        if queue is None:
+            queue = self.queue_name
+        try:
+            channel = await client.channel(publisher_confirms=True)
+            await self.declare_queue(channel, queue)
+            sends = [
+                channel.default_exchange.publish(self._to_amqp(x), routing_key=queue)
+                for x in messages
+            ]
+            outcomes = await asyncio.gather(*sends, return_exceptions=True)
+            await channel.close()
+        finally:
+            if owns_client:
+                await client.close()
+        failures = [
+            {"index": index, "message": str(outcome)}
+            for index, outcome in enumerate(outcomes)
+            if isinstance(outcome, Exception)
+        ]
+        response = {
+            "success": len(failures) == 0,
+            "message": "Sent {} of {} messages".format(
+                len(messages) - len(failures), len(messages)
+            ),
+            "data": {"failures": failures},
+        }
         return response
@@ -0,0 +1,37 @@
+import threading
+import time
+
+from typing import Optional
+
+
+class VoltronRateLimiter:
+    """Token bucket limiting requests to rate per second, with bursts of up to burst requests.
+    acquire() blocks until a token is free. Safe to share between threads.
+    """
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, int(rate))
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self) -> float:
+        """Take one token, sleeping if needed. Returns the seconds spent waiting."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # Reserve the token now so concurrent callers queue up behind each other
+            self.tokens -= 1
+            wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+            self.waited += wait
+        if wait:
+            time.sleep(wait)
+        return wait
@@ -0,0 +1,53 @@
+ATTEMPT_HEADER = "x-voltron-attempt"
+ERROR_HEADER = "x-voltron-error"
+
+
+class VoltronRetryPolicy:
+    """Exponential backoff for failed messages:
+    attempt 1 fails -> wait base_delay, attempt 2 fails -> wait base_delay * multiplier, ...
+    After max_attempts the message goes to the dead-letter queue.
+    Delays are in seconds.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 5,
+        base_delay: float = 30,
+        multiplier: float = 2,
+        max_delay: float = 3600,
+    ):
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.multiplier = multiplier
+        self.max_delay = max_delay
+
+    def should_retry(self, attempt: int) -> bool:
+        """attempt is the 1-based attempt that just failed"""
+        return attempt < self.max_attempts
+
+    def delay_for(self, attempt: int) -> float:
+        """Seconds to wait before retrying after the given attempt failed"""
+        delay = self.base_delay * (self.multiplier ** (attempt - 1))
+        return min(delay, self.max_delay)
+
+    def delays(self) -> list[float]:
+        return [self.delay_for(x) for x in range(1, self.max_attempts)]
+
+
+def retry_queue_name(queue: str, delay: float) -> str:
+    """Name of the RabbitMQ queue that holds messages for delay seconds"""
+    return "{}.retry.{}ms".format(queue, int(delay * 1000))
+
+
+def dead_letter_queue_name(queue: str) -> str:
+    return "{}.dead-letter".format(queue)
+
+
+def get_attempt(headers) -> int:
+    """Read the attempt counter from message headers. Service Bus may return byte keys."""
+    if not headers:
+        return 1
+    value = headers.get(ATTEMPT_HEADER, headers.get(ATTEMPT_HEADER.encode(), 1))
+    return int(value)
@@ -0,0 +1,232 @@
+import collections
+import json
+import logging
+import re
+import threading
+
+from typing import Iterable, Optional
+
+from voltronsecurity.voltron_base import VoltronFindingOutput
+from voltronsecurity.voltron_blobs import finding_document
+
+logger = logging.getLogger("voltron")
+
+DEFAULT_LEVELS = ("INFORMATIONAL", "LOW", "MEDIUM", "HIGH", "CRITICAL")
+DEFAULT_ALIASES = {"INFO": "INFORMATIONAL", "NOTE": "INFORMATIONAL", "WARNING": "MEDIUM"}
+OUTPUT_COLUMNS = list(VoltronFindingOutput.__annotations__)
+JSON_PREFIX = "toolFindingJson."
+OPERATORS = ("eq", "in", "not_in", "gte", "lte", "regex", "exists")
+# Key added to toolFindingJson naming the rule that set voltronSeverity
+RULE_KEY = "voltronSeverityRule"
+
+
+class VoltronSeverityRule:
+    """One compiled rule. Built by VoltronSeverityEngine from a dict like:
+    {
+        "name": "rdp-exposed",
+        "when": {"toolName": "TotallyLegitSiteNetConns", "toolFindingJson.port": 3389},
+        "upgrade": "HIGH",
+    }
+    Every key of "when" must match. A plain value means equality; a dict uses one operator:
+    {"in": [...]}, {"not_in": [...]}, {"gte": n}, {"lte": n}, {"regex": "..."}, {"exists": bool}.
+    Fields are finding attributes, or "toolFindingJson.<dotted path>" for the raw payload.
+    "severity" sets the voltronSeverity; "upgrade" only ever raises it, and only matches
+    findings it raises, so later rules still see the rest.
+    """
+
+    def __init__(self, name: str, conditions: list, severity: str, upgrade: bool):
+        self.name = name
+        self.conditions = conditions
+        self.severity = severity
+        self.upgrade = upgrade
+
+
+def _compile_condition(field: str, spec):
+    if not isinstance(spec, dict):
+        return field, lambda value, expected=spec: value == expected
+    if len(spec) != 1 or next(iter(spec)) not in OPERATORS:
+        raise ValueError("Condition on {} must use one of {}".format(field, OPERATORS))
+    operator, expected = next(iter(spec.items()))
+    if operator == "eq":
+        return field, lambda value: value == expected
+    if operator == "in":
+        allowed = frozenset(expected)
+        return field, lambda value: value in allowed
+    if operator == "not_in":
+        denied = frozenset(expected)
+        return field, lambda value: value not in denied
+    if operator == "gte":
+        return field, lambda value: value is not None and value >= expected
+    if operator == "lte":
+        return field, lambda value: value is not None and value <= expected
+    if operator == "regex":
+        pattern = re.compile(expected)
+        return field, lambda value: value is not None and pattern.search(str(value)) is not None
+    return field, lambda value: (value is not None) == bool(expected)
+
+
+def annotate_document(value, rule: str):
+    """Add the fired rule to a toolFindingJson value, keeping its encoding: dicts get the key,
+    and encoded text (however many times findingOutput encoded it) is re-encoded as deep.
+    Values that don't hold an object are returned unchanged.
+    """
+    if isinstance(value, dict):
+        return dict(value, **{RULE_KEY: rule})
+    if not isinstance(value, (str, bytes)):
+        return value
+    try:
+        decoded = json.loads(value)
+    except ValueError:
+        return value
+    annotated = annotate_document(decoded, rule)
+    if annotated is decoded:
+        return value
+    return json.dumps(annotated)
+
+
+class VoltronSeverityEngine:
+    """Sets voltronSeverity for batches of findings from declarative rules.
+    The tool severity is first normalized to one of levels (case-insensitive, through aliases),
+    then rules are tried in order and the first match wins. Rules are compiled once; apply()
+    extracts each referenced field once per batch and evaluates rules column by column over the
+    findings no earlier rule has claimed. The name of the rule that fired is stored in
+    voltronSeverityRule (None when no rule matched) and, so it is persisted with the finding,
+    under the same key in toolFindingJson. Unmatched findings keep their tool severity, only
+    normalized when it names one of levels.
+    """
+
+    def __init__(
+        self,
+        rules: Optional[Iterable[dict]] = None,
+        levels: Iterable[str] = DEFAULT_LEVELS,
+        aliases: Optional[dict] = None,
+    ):
+        self.levels = tuple(x.upper() for x in levels)
+        self.rank = {level: index for index, level in enumerate(self.levels)}
+        if aliases is None:
+            aliases = DEFAULT_ALIASES
+        self.aliases = {key.upper(): value.upper() for key, value in aliases.items()}
+        self.rules = [self.compile_rule(x) for x in rules or []]
+        self.fired = collections.Counter()
+        self._lock = threading.Lock()
+
+    def compile_rule(self, rule: dict) -> VoltronSeverityRule:
+        name = rule.get("name")
+        if not name:
+            raise ValueError("Severity rules need a name")
+        if ("severity" in rule) == ("upgrade" in rule):
+            raise ValueError("Rule {} needs exactly one of severity or upgrade".format(name))
+        severity = self.normalize(rule.get("severity", rule.get("upgrade")))
+        if severity not in self.rank:
+            raise ValueError("Rule {} uses unknown severity {}".format(name, severity))
+        conditions = [_compile_condition(k, v) for k, v in rule.get("when", {}).items()]
+        return VoltronSeverityRule(name, conditions, severity, "upgrade" in rule)
+
+    def normalize(self, severity) -> Optional[str]:
+        if severity is None:
+            return None
+        severity = str(severity).upper()
+        return self.aliases.get(severity, severity)
+
+    def _column(self, records, field, get, columns):
+        if not field.startswith(JSON_PREFIX):
+            return [get(x, field) for x in records]
+        # Payloads are only decoded if some rule looks inside them, and only once per batch
+        if JSON_PREFIX not in columns:
+            columns[JSON_PREFIX] = [finding_document(get(x, "toolFindingJson")) for x in records]
+        path = field[len(JSON_PREFIX) :].split(".")
+        column = []
+        for document in columns[JSON_PREFIX]:
+            for key in path:
+                document = document.get(key) if isinstance(document, dict) else None
+            column.append(document)
+        return column
+
+    def _evaluate(self, records, get) -> tuple[list, list]:
+        severities = []
+        for x in records:
+            original = get(x, "toolFindingSeverity")
+            normalized = self.normalize(original)
+            severities.append(normalized if normalized in self.rank else original)
+        fired = [None] * len(records)
+        columns = {}
+        remaining = list(range(len(records)))
+        for rule in self.rules:
+            if not remaining:
+                break
+            matched = remaining
+            for field, test in rule.conditions:
+                if field not in columns:
+                    columns[field] = self._column(records, field, get, columns)
+                column = columns[field]
+                matched = [i for i in matched if test(column[i])]
+                if not matched:
+                    break
+            if rule.upgrade:
+                rank = self.rank[rule.severity]
+                matched = [i for i in matched if self.rank.get(severities[i], -1) < rank]
+            if not matched:
+                continue
+            for i in matched:
+                severities[i] = rule.severity
+                fired[i] = rule.name
+            # apply() is called from worker threads sharing one engine
+            with self._lock:
+                self.fired[rule.name] += len(matched)
+            claimed = set(matched)
+            remaining = [i for i in remaining if i not in claimed]
+        return severities, fired
+
+    def apply(self, findings: list) -> list:
+        """Set voltronSeverity and voltronSeverityRule on VoltronFinding objects or
+        findingOutput dicts, in place. Returns the rule that fired for each finding.
+        """
+        if not findings:
+            return []
+        if isinstance(findings[0], dict):
+            severities, fired = self._evaluate(findings, lambda x, f: x.get(f))
+            for finding, severity, rule in zip(findings, severities, fired):
+                finding["voltronSeverity"] = severity
+                finding[RULE_KEY] = rule
+                if rule is not None:
+                    finding["toolFindingJson"] = annotate_document(
+                        finding.get("toolFindingJson"), rule
+                    )
+        else:
+            severities, fired = self._evaluate(findings, lambda x, f: getattr(x, f, None))
+            for finding, severity, rule in zip(findings, severities, fired):
+                finding.voltronSeverity = severity
+                if rule is not None:
+                    finding.toolFindingJson = annotate_document(finding.toolFindingJson, rule)
+                try:
+                    finding.voltronSeverityRule = rule
+                except AttributeError:
+                    # Slotted objects such as VoltronStoredFinding only get the severity
+                    pass
+        return fired
+
+    def apply_rows(self, rows: list[tuple]) -> tuple[list[tuple], list]:
+        """Same as apply, for findingOutput row tuples (see voltron_normalize).
+        Returns (new rows, rule fired per row).
+        """
+        index = {x: i for i, x in enumerate(OUTPUT_COLUMNS)}
+        severity_index = index["voltronSeverity"]
+        json_index = index["toolFindingJson"]
+
+        def get(row, field):
+            position = index.get(field)
+            return row[position] if position is not None else None
+
+        severities, fired = self._evaluate(rows, get)
+        updated = []
+        for row, severity, rule in zip(rows, severities, fired):
+            row = list(row)
+            row[severity_index] = severity
+            if rule is not None:
+                row[json_index] = annotate_document(row[json_index], rule)
+            updated.append(tuple(row))
+        return updated, fired
+
+    def report(self) -> dict:
+        with self._lock:
+            return {"rules": len(self.rules), "fired": dict(self.fired)}
@@ -1,15 +1,23 @@
+import asyncio
 import csv
-import requests
 import json
 import logging
 import os
 import datetime
+import time
 
-from voltronsecurity.helpers import UNKNOWN_DATE
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from voltronsecurity.helpers import UNKNOWN_DATE, import_optional
 from voltronsecurity.voltron_base import VoltronFinding
+from voltronsecurity.voltron_checkpoint import crawl_identity
+from voltronsecurity.voltron_pagination import VoltronPageSizer, set_query_param
+from voltronsecurity.voltron_stream import (
+    VoltronCrawler,
+    VoltronStreamPipeline,
+    VoltronStreamStage,
+)
 
-FORMAT = "[%(filename)s:%(lineno)s - %(funcName)s() ] %(message)s"
-logging.basicConfig(format=FORMAT)
 logger = logging.getLogger("snykcode")
 
 
@@ -53,8 +61,32 @@ class snykFinding:
                 self.orgName, self.projectId, self.id
             )
 
-    def decorate_issue(self, apiHandler):
-        response_data = apiHandler.get_finding_data(self.issueURL)
+    def decorate_issue(self, apiHandler, cache=None):
+        """Fetch title, file path and region. With a VoltronDecorationCache, issues that
+        haven't changed since they were cached (same updated_at) skip the API call.
+        """
+        marker = str(getattr(self, "updated_at", None) or "")
+        response_data = None
+        if cache is not None:
+            response_data = cache.get(self.id, marker)
+        if response_data is None:
+            response_data = apiHandler.get_finding_data(self.issueURL)
+            if (
+                cache is not None
+                and response_data["attributes"]["title"] != "DecorationFailed"
+            ):
+                attributes = response_data["attributes"]
+                cache.set(
+                    self.id,
+                    marker,
+                    {
+                        "attributes": {
+                            "title": attributes["title"],
+                            "primaryFilePath": attributes["primaryFilePath"],
+                            "primaryRegion": attributes["primaryRegion"],
+                        }
+                    },
+                )
         self.longTitle = response_data["attributes"]["title"]
         self.primaryFilePath = response_data["attributes"]["primaryFilePath"]
         self.locationData = response_data["attributes"]["primaryRegion"]
@@ -90,8 +122,19 @@ class snykProject:
 
 
 class SnykCodeCollector:
-    def __init__(self, api_key, orgs=None, org_response_data=None):
+    def __init__(
+        self,
+        api_key,
+        orgs=None,
+        org_response_data=None,
+        decoration_cache=None,
+        page_sizers=None,
+    ):
         self.api_key = api_key
+        self.decoration_cache = decoration_cache
+        if page_sizers is None:
+            page_sizers = self.default_page_sizers()
+        self.page_sizers = page_sizers
         self.session = self.gen_session(api_key)
 
         if org_response_data is None:
@@ -104,6 +147,7 @@ class SnykCodeCollector:
 
     def gen_session(self, api_key):
         logger.info("Started")
+        requests = import_optional("requests", "snyk")
         session = requests.Session()
         headers = {
             "Content-Type": "application/json",
@@ -132,29 +176,102 @@ class SnykCodeCollector:
         logger.info("Started")
         issues = [snykFinding(entry, project_object) for entry in issue_response]
         for issue in issues:
-            issue.decorate_issue(self)
+            issue.decorate_issue(self, self.decoration_cache)
         return issues
 
+    def default_page_sizers(self):
+        return {
+            # Snyk REST rejects a limit that is not a multiple of 10
+            "projects": VoltronPageSizer(100, 10, 100, step=10),
+            "issues": VoltronPageSizer(100, 10, 100, step=10),
+        }
+
+    def page_size_report(self):
+        """Page size chosen for each endpoint, with the latency/bytes/error stats behind it"""
+        return {name: sizer.report() for name, sizer in self.page_sizers.items()}
+
+    def _sized_get(self, session, target_url, params=None, page_sizer=None, retries=3):
+        """GET one page, with "limit" taken from page_sizer.
+        Gateway errors and timeouts shrink the page and retry up to retries times.
+        """
+        if page_sizer is None:
+            return session.get(target_url, params=params)
+        for attempt in range(retries + 1):
+            page_size = page_sizer.page_size
+            if params is not None:
+                params = dict(params, limit=page_size)
+            else:
+                target_url = set_query_param(target_url, "limit", page_size)
+            start = time.monotonic()
+            try:
+                response = session.get(target_url, params=params)
+            except Exception as e:
+                page_sizer.record(time.monotonic() - start, error=True, page_size=page_size)
+                if attempt == retries:
+                    raise
+                logger.warning("Error: {}\n Retrying with a smaller page...".format(e))
+                continue
+            latency = time.monotonic() - start
+            if response.status_code in (502, 503, 504) and attempt < retries:
+                page_sizer.record(latency, error=True, page_size=page_size)
+                logger.warning(
+                    "Got {}. Retrying with a smaller page...".format(response.status_code)
+                )
+                continue
+            page_sizer.record(latency, len(response.content), page_size=page_size)
+            return response
+
     def _paginated_get_request(
-        self, session, target_endpoint, target_path, target_params
+        self,
+        session,
+        target_endpoint,
+        target_path,
+        target_params,
+        checkpoint=None,
+        crawl_id=None,
+        page_sizer=None,
+        run_id=None,
     ):
+        """Yield each page of a paginated REST call.
+        With a checkpoint store, the crawl resumes from the links.next saved by the same run and
+        the next link is saved once the consumer comes back for the following page.
+        With a VoltronPageSizer, the "limit" of every request is set from the sizer.
+        """
         logger.info("Started")
-        target_url = "{}{}".format(target_endpoint, target_path)
-        response = session.get(target_url, params=target_params)
+        saved = None
+        if checkpoint is not None:
+            if crawl_id is None:
+                if run_id is None:
+                    raise ValueError("Checkpointed crawls need a run_id")
+                crawl_id = crawl_identity(
+                    "snyk:{}".format(target_path), target_params, run_id
+                )
+            saved = checkpoint.load(crawl_id)
+        if saved is not None:
+            logger.info("Resuming {} from checkpoint".format(crawl_id))
+            target_url = "{}{}".format(target_endpoint, saved["cursor"])
+            response = self._sized_get(session, target_url, page_sizer=page_sizer)
+        else:
+            target_url = "{}{}".format(target_endpoint, target_path)
+            response = self._sized_get(
+                session, target_url, target_params, page_sizer=page_sizer
+            )
         if response.status_code != 404:
-            try:
-                response.raise_for_status()
-            except:
-                logger.warning("Failed to get first page")
-                return
+            # Raised rather than ending the crawl early, which would look like a complete one
+            response.raise_for_status()
         yield response
 
         next_url = response.json().get("links", {}).get("next")
         while next_url is not None:
+            if checkpoint is not None:
+                checkpoint.save(crawl_id, next_url)
             target_url = "{}{}".format(target_endpoint, next_url)
-            response = session.get(target_url)
+            response = self._sized_get(session, target_url, page_sizer=page_sizer)
+            response.raise_for_status()
             next_url = response.json().get("links", {}).get("next")
             yield response
+        if checkpoint is not None:
+            checkpoint.clear(crawl_id)
 
     def get_orgs(self, session=None):
         logger.info("Started")
@@ -178,7 +295,13 @@ class SnykCodeCollector:
         urlpath = "/orgs/{}/projects".format(org_id)
         params = {"version": "beta", "limit": "100"}
         results = []
-        for page in self._paginated_get_request(session, endpoint, urlpath, params):
+        for page in self._paginated_get_request(
+            session,
+            endpoint,
+            urlpath,
+            params,
+            page_sizer=self.page_sizers.get("projects"),
+        ):
             results.extend(page.json()["data"])
         if as_dict is True:
             results = self.gen_project_data(results, org_id)
@@ -186,10 +309,12 @@ class SnykCodeCollector:
         logger.info({"step": "getProjectsComplete", "resultCount": len(results)})
         return results
 
-    def get_all_code_issues(
-        self, orgObject, projectObject, session=None, as_dict=False
+    def iter_code_issue_pages(
+        self, orgObject, projectObject, session=None, checkpoint=None, run_id=None
     ):
-        logger.info("Started")
+        """Yield the raw issues of each page. Persist each page before asking for the next one
+        when using a checkpoint store; run_id scopes the checkpoint to the current run.
+        """
         if session is None:
             session = self.session
         endpoint = "https://api.snyk.io/rest"
@@ -199,21 +324,77 @@ class SnykCodeCollector:
             "version": "2022-04-06~experimental",
             "limit": 100,
         }
-        all_issues = []
-        for page in self._paginated_get_request(session, endpoint, urlpath, params):
+        for page in self._paginated_get_request(
+            session,
+            endpoint,
+            urlpath,
+            params,
+            checkpoint=checkpoint,
+            page_sizer=self.page_sizers.get("issues"),
+            run_id=run_id,
+        ):
             try:
-                all_issues.extend(page.json()["data"])
+                yield page.json()["data"]
             except KeyError:
                 logger.error("No data in response.")
                 logger.error(page.json())
                 continue
 
+    def get_all_code_issues(self, orgObject, projectObject, session=None, as_dict=False):
+        logger.info("Started")
+        all_issues = []
+        for page in self.iter_code_issue_pages(orgObject, projectObject, session):
+            all_issues.extend(page)
+
         if as_dict is True:
             logger.info("decorating {} issues".format(len(all_issues)))
             all_issues = self.gen_issue_data(all_issues, projectObject)
 
         return all_issues
 
+    async def astream_code_issues(
+        self,
+        orgObject,
+        projectObject,
+        sink,
+        session=None,
+        decorate_concurrency=8,
+        queue_size=100,
+        batch_size=100,
+    ):
+        """Fetch, decorate and normalize a project's issues as concurrent stages, passing lists of
+        up to batch_size VoltronSnykCodeFinding objects to sink as they are ready. Queues between
+        stages hold at most queue_size issues, so a slow sink pauses fetching instead of
+        buffering the project. sink may be a coroutine function. Returns per-stage counts.
+        """
+
+        def issues():
+            for page in self.iter_code_issue_pages(orgObject, projectObject, session):
+                for entry in page:
+                    yield snykFinding(entry, projectObject)
+
+        def decorate(finding):
+            finding.decorate_issue(self, self.decoration_cache)
+            return finding
+
+        def normalize(finding):
+            return VoltronSnykCodeFinding(finding.__dict__)
+
+        pipeline = VoltronStreamPipeline(
+            [
+                VoltronStreamStage("decorate", decorate, decorate_concurrency, queue_size),
+                VoltronStreamStage("normalize", normalize, 1, queue_size),
+            ],
+            sink_batch_size=batch_size,
+        )
+        return await pipeline.run(issues(), sink)
+
+    def stream_code_issues(self, orgObject, projectObject, sink, **kwargs):
+        """Blocking form of astream_code_issues"""
+        return asyncio.run(
+            self.astream_code_issues(orgObject, projectObject, sink, **kwargs)
+        )
+
     def get_finding_data(self, finding_path, session=None):
         logger.info("Started")
         if session is None:
@@ -263,6 +444,97 @@ class SnykCodeCollector:
             writer.writerows(dict_results)
 
 
+class SnykCodeCrawler(VoltronCrawler):
+    """Walks orgs -> projects -> issues with a separate thread pool (and concurrency limit) per level.
+    All levels share the collector's session, whose connection pool is sized to the total
+    number of workers. Decorated snykFinding objects are streamed out of crawl() as they are
+    ready; the bounded output queue keeps a slow consumer from buffering the whole account.
+    After crawl() is exhausted, self.summary holds per-org counts and failures.
+    """
+
+    def __init__(
+        self,
+        collector,
+        org_concurrency=4,
+        project_concurrency=8,
+        issue_concurrency=16,
+        decorate=True,
+        buffer_size=1000,
+        decoration_cache=None,
+    ):
+        super().__init__(buffer_size)
+        self.collector = collector
+        self.decoration_cache = decoration_cache
+        self.org_concurrency = org_concurrency
+        self.project_concurrency = project_concurrency
+        self.issue_concurrency = issue_concurrency
+        self.decorate = decorate
+        self._mount_pool()
+
+    def _mount_pool(self):
+        adapters = import_optional("requests.adapters", "snyk")
+        pool_size = (
+            self.org_concurrency + self.project_concurrency + self.issue_concurrency
+        )
+        adapter = adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.collector.session.mount("https://", adapter)
+
+    def _crawl_issue(self, output, org_id, finding):
+        if self._stop.is_set():
+            return
+        if self.decorate:
+            finding.decorate_issue(self.collector, self.decoration_cache)
+            if finding.longTitle == "DecorationFailed":
+                self._record(org_id, "failures", "decorate {}".format(finding.id))
+        self._record(org_id, "issues")
+        self._emit(output, finding)
+
+    def _crawl_project(self, pools, output, org_id, project):
+        if self._stop.is_set():
+            return
+        try:
+            org = self.collector.orgData[org_id]
+            issues = self.collector.get_all_code_issues(org, project)
+        except Exception as e:
+            logger.error(e)
+            self._record(org_id, "failures", "project {}: {}".format(project.id, e))
+            return
+        self._record(org_id, "projects")
+        findings = [snykFinding(entry, project) for entry in issues]
+        wait([pools["issue"].submit(self._crawl_issue, output, org_id, x) for x in findings])
+
+    def _crawl_org(self, pools, output, org_id):
+        if self._stop.is_set():
+            return
+        try:
+            projects = self.collector.get_projects(org_id, as_dict=True)
+        except Exception as e:
+            logger.error(e)
+            self._record(org_id, "failures", "org {}: {}".format(org_id, e))
+            return
+        wait(
+            [
+                pools["project"].submit(self._crawl_project, pools, output, org_id, x)
+                for x in projects.values()
+            ]
+        )
+
+    def crawl(self, orgs=None):
+        """Yield decorated snykFinding objects for every issue in orgs (default: collector.orgs)"""
+        if orgs is None:
+            orgs = self.collector.orgs
+        pools = {
+            "org": ThreadPoolExecutor(self.org_concurrency, "snyk-org"),
+            "project": ThreadPoolExecutor(self.project_concurrency, "snyk-project"),
+            "issue": ThreadPoolExecutor(self.issue_concurrency, "snyk-issue"),
+        }
+
+        def start(output):
+            wait([pools["org"].submit(self._crawl_org, pools, output, x) for x in orgs])
+
+        yield from self._stream(orgs, start, list(pools.values()), "snyk-crawl")
+
+
 def write_to_table(pg_handler, tablename, inputlist):
     cursor = pg_handler.cursor()
     fillers = "%s," * len(inputlist[0])
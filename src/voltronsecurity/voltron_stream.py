@@ -0,0 +1,239 @@
+import asyncio
+import inspect
+import logging
+import queue
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Optional
+
+logger = logging.getLogger("voltron")
+
+_DONE = object()
+
+
+class VoltronStreamStage:
+    """One step of a VoltronStreamPipeline.
+    func(item) returns the item for the next stage, or None to drop it. Blocking functions
+    (e.g. requests calls) run in the pipeline's thread pool; coroutine functions are awaited.
+    concurrency workers read from an input queue that holds at most queue_size items.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable,
+        concurrency: int = 1,
+        queue_size: int = 100,
+    ):
+        if concurrency < 1 or queue_size < 1:
+            raise ValueError("concurrency and queue_size must be at least 1")
+        self.name = name
+        self.func = func
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+
+
+class VoltronStreamPipeline:
+    """Runs source -> stages -> sink with bounded queues between every step.
+    All steps run at the same time, and a full queue pauses everything upstream of it, so memory
+    stays at roughly the sum of the queue sizes no matter how large the source is.
+    The source is a (possibly lazy, blocking) iterable that is pulled one item at a time in a
+    thread. The sink receives lists of up to sink_batch_size items; a partial batch is flushed
+    after flush_interval seconds without new items. An exception in a stage drops that item and
+    is counted; an exception in the source or sink stops the pipeline and is raised.
+    """
+
+    def __init__(
+        self,
+        stages: list[VoltronStreamStage],
+        sink_batch_size: int = 100,
+        sink_queue_size: Optional[int] = None,
+        flush_interval: float = 1.0,
+    ):
+        self.stages = stages
+        self.sink_batch_size = sink_batch_size
+        self.sink_queue_size = sink_queue_size or sink_batch_size * 2
+        self.flush_interval = flush_interval
+        self.stats = {}
+
+    def _reset_stats(self):
+        self.stats = {"source": {"items": 0}, "sink": {"items": 0, "batches": 0}}
+        for stage in self.stages:
+            self.stats[stage.name] = {"items": 0, "dropped": 0, "failures": 0}
+
+    async def _call(self, executor, func, *args):
+        if inspect.iscoroutinefunction(func):
+            return await func(*args)
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(executor, func, *args)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    async def _produce(self, executor, source, output, consumers):
+        loop = asyncio.get_running_loop()
+        iterator = iter(source)
+        while True:
+            item = await loop.run_in_executor(executor, next, iterator, _DONE)
+            if item is _DONE:
+                break
+            self.stats["source"]["items"] += 1
+            await output.put(item)
+        for _ in range(consumers):
+            await output.put(_DONE)
+
+    async def _work(self, executor, stage, input_queue, output):
+        stats = self.stats[stage.name]
+        while True:
+            item = await input_queue.get()
+            if item is _DONE:
+                return
+            try:
+                result = await self._call(executor, stage.func, item)
+            except Exception as e:
+                logger.error("Stage {} failed: {}".format(stage.name, e))
+                stats["failures"] += 1
+                continue
+            if result is None:
+                stats["dropped"] += 1
+                continue
+            stats["items"] += 1
+            await output.put(result)
+
+    async def _run_stage(self, executor, stage, input_queue, output, consumers):
+        await asyncio.gather(
+            *[self._work(executor, stage, input_queue, output) for _ in range(stage.concurrency)]
+        )
+        for _ in range(consumers):
+            await output.put(_DONE)
+
+    async def _drain(self, executor, sink, input_queue):
+        batch = []
+        while True:
+            try:
+                timeout = self.flush_interval if batch else None
+                item = await asyncio.wait_for(input_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                item = None
+            if item is not None and item is not _DONE:
+                batch.append(item)
+            if batch and (
+                item is None or item is _DONE or len(batch) >= self.sink_batch_size
+            ):
+                await self._call(executor, sink, batch)
+                self.stats["sink"]["items"] += len(batch)
+                self.stats["sink"]["batches"] += 1
+                batch = []
+            if item is _DONE:
+                return
+
+    async def run(self, source: Iterable, sink: Callable) -> dict:
+        """Push every source item through the stages into sink(list). Returns per-step counts."""
+        self._reset_stats()
+        queues = [asyncio.Queue(maxsize=x.queue_size) for x in self.stages]
+        queues.append(asyncio.Queue(maxsize=self.sink_queue_size))
+        consumers = [x.concurrency for x in self.stages] + [1]
+        workers = sum(x.concurrency for x in self.stages) + 2
+
+        with ThreadPoolExecutor(workers, "voltron-stream") as executor:
+            tasks = [
+                asyncio.ensure_future(
+                    self._produce(executor, source, queues[0], consumers[0])
+                )
+            ]
+            for index, stage in enumerate(self.stages):
+                tasks.append(
+                    asyncio.ensure_future(
+                        self._run_stage(
+                            executor,
+                            stage,
+                            queues[index],
+                            queues[index + 1],
+                            consumers[index + 1],
+                        )
+                    )
+                )
+            tasks.append(asyncio.ensure_future(self._drain(executor, sink, queues[-1])))
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+        logger.info({"step": "streamComplete", "stats": self.stats})
+        return self.stats
+
+
+class VoltronCrawler:
+    """Base for crawlers that fan work out over thread pools and stream the results through
+    one bounded queue, so a slow consumer pauses the crawl instead of buffering the account.
+    crawl() in the subclass hands _stream the summary keys, a start(output) function that
+    submits the work and waits for it, and the pools to shut down. Workers pass each result
+    to _emit, count with _record, and return early once _stop is set.
+    After crawl() is exhausted, self.summary holds the counts and failures of each key.
+    """
+
+    counters = ("projects", "issues")
+
+    def __init__(self, buffer_size: int = 1000):
+        self.buffer_size = buffer_size
+        self.summary = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _record(self, key, counter, value=1):
+        with self._lock:
+            if counter == "failures":
+                self.summary[key]["failures"].append(value)
+            else:
+                self.summary[key][counter] += value
+
+    def _emit(self, output, item):
+        while not self._stop.is_set():
+            try:
+                output.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _stream(self, keys, start: Callable, pools: list, name: str):
+        self._stop.clear()
+        self.summary = {
+            key: dict({x: 0 for x in self.counters}, failures=[]) for key in keys
+        }
+        output = queue.Queue(maxsize=self.buffer_size)
+        done = object()
+
+        def run():
+            try:
+                start(output)
+            finally:
+                self._emit(output, done)
+
+        coordinator = threading.Thread(target=run, name=name, daemon=True)
+        coordinator.start()
+        try:
+            while True:
+                item = output.get()
+                if item is done:
+                    break
+                yield item
+        finally:
+            # Also reached when the caller stops iterating early
+            self._stop.set()
+            coordinator.join()
+            for pool in pools:
+                pool.shutdown(wait=True)
+        logger.info({"step": "crawlComplete", "summary": self.summary})
+
+    def crawl(self, *args, **kwargs):
+        """Override in child class"""
+        pass
+
+    def run(self, sink: Callable, *args, **kwargs) -> dict:
+        """Pass everything crawl(*args, **kwargs) yields to sink(item) and return the summary"""
+        for item in self.crawl(*args, **kwargs):
+            sink(item)
+        return self.summary
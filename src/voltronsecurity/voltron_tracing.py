@@ -0,0 +1,360 @@
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+
+from typing import Iterable, Optional
+
+from voltronsecurity.helpers import import_optional
+
+logger = logging.getLogger("voltron")
+
+TRACE_KEY = "traceContext"
+TRACEPARENT_HEADER = "traceparent"
+TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+SPAN_KINDS = {"internal": 1, "server": 2, "client": 3, "producer": 4, "consumer": 5}
+
+
+def format_traceparent(trace_id: str, span_id: str, sampled: bool = True) -> str:
+    """W3C traceparent header value"""
+    return "00-{}-{}-{}".format(trace_id, span_id, "01" if sampled else "00")
+
+
+def parse_traceparent(value: str) -> Optional[tuple[str, str]]:
+    """(trace_id, span_id) of a traceparent value, or None if it is malformed"""
+    match = TRACEPARENT_RE.match(value or "")
+    if match is None or set(match.group(1)) == {"0"} or set(match.group(2)) == {"0"}:
+        return None
+    return match.group(1), match.group(2)
+
+
+def extract(message: dict) -> Optional[tuple[str, str]]:
+    """(trace_id, parent span_id) carried by a message, or None"""
+    context = message.get(TRACE_KEY)
+    if not isinstance(context, dict):
+        return None
+    return parse_traceparent(context.get("traceparent"))
+
+
+def trace_headers(message: dict) -> dict:
+    """Transport headers carrying the message's trace context. Queues send these as AMQP
+    headers, Service Bus application properties or memory envelope headers, not in the body.
+    """
+    context = message.get(TRACE_KEY)
+    if not isinstance(context, dict) or not context.get("traceparent"):
+        return {}
+    return {TRACEPARENT_HEADER: context["traceparent"]}
+
+
+def restore_context(message: dict, headers: Optional[dict]) -> dict:
+    """Copy a received traceparent header into message[TRACE_KEY], in place, so stages can
+    extract() it. Received headers may have byte keys and values.
+    """
+    for key, value in (headers or {}).items():
+        if isinstance(key, bytes):
+            key = key.decode()
+        if key != TRACEPARENT_HEADER:
+            continue
+        if isinstance(value, bytes):
+            value = value.decode()
+        message[TRACE_KEY] = {"traceparent": value}
+    return message
+
+
+class VoltronSpan:
+    """One timed operation. Times are epoch nanoseconds."""
+
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        span_id: str,
+        parent_id: Optional[str] = None,
+        kind: str = "internal",
+        attributes: Optional[dict] = None,
+    ):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.start = time.time_ns()
+        self.end = None
+        self.ok = True
+        self.status_message = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def set_status(self, ok: bool, message: Optional[str] = None):
+        self.ok = ok
+        self.status_message = message
+
+    def traceparent(self) -> str:
+        return format_traceparent(self.trace_id, self.span_id)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "kind": self.kind,
+            "start": self.start,
+            "end": self.end,
+            "durationMs": (self.end - self.start) / 1e6 if self.end else None,
+            "ok": self.ok,
+            "statusMessage": self.status_message,
+            "attributes": self.attributes,
+        }
+
+
+class VoltronTracer:
+    """Opens spans and hands finished ones to an exporter in batches.
+    The active span is tracked per thread and per asyncio task, so nested span() calls become
+    children of it. With no active span, a span continues the trace carried by message (see
+    inject/extract), or starts a new trace. Spans are buffered batch_size at a time and exported
+    by a background thread, so a slow collector never blocks the traced code or the event loop.
+    At most max_pending batches wait for export; further batches are dropped and logged.
+    Call flush() (waits for the export) or close() before exiting.
+    """
+
+    def __init__(
+        self,
+        exporter,
+        service_name: str = "voltron",
+        batch_size: int = 100,
+        max_pending: int = 16,
+    ):
+        self.exporter = exporter
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._current = contextvars.ContextVar("voltron_span", default=None)
+        self._finished = []
+        self._lock = threading.Lock()
+        self._pending = queue.Queue(maxsize=max_pending)
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def current_span(self) -> Optional[VoltronSpan]:
+        return self._current.get()
+
+    @contextlib.contextmanager
+    def span(
+        self,
+        name: str,
+        attributes: Optional[dict] = None,
+        message: Optional[dict] = None,
+        kind: str = "internal",
+    ):
+        parent = self._current.get()
+        if parent is not None:
+            trace_id, parent_id = parent.trace_id, parent.span_id
+        else:
+            remote = extract(message) if message is not None else None
+            if remote is not None:
+                trace_id, parent_id = remote
+            else:
+                trace_id, parent_id = os.urandom(16).hex(), None
+        span = VoltronSpan(name, trace_id, os.urandom(8).hex(), parent_id, kind, attributes)
+        token = self._current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set_status(False, "{}: {}".format(type(e).__name__, e))
+            raise
+        finally:
+            self._current.reset(token)
+            span.end = time.time_ns()
+            self._finish(span)
+
+    def inject(self, message: dict) -> dict:
+        """Set the message's trace context to the active span, in place.
+        Queues move it into transport headers when they send the message.
+        """
+        span = self._current.get()
+        if span is not None:
+            message[TRACE_KEY] = {"traceparent": span.traceparent()}
+        return message
+
+    def _finish(self, span: VoltronSpan):
+        with self._lock:
+            self._finished.append(span)
+            if len(self._finished) < self.batch_size:
+                return
+            batch, self._finished = self._finished, []
+        self._enqueue(batch)
+
+    def _enqueue(self, batch: list[VoltronSpan]):
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run_exports, name="voltron-span-export", daemon=True
+                )
+                self._worker.start()
+        try:
+            self._pending.put_nowait(batch)
+        except queue.Full:
+            self.dropped += len(batch)
+            logger.warning(
+                "Span export is falling behind. Dropped {} spans".format(len(batch))
+            )
+
+    def _run_exports(self):
+        while True:
+            batch = self._pending.get()
+            try:
+                if batch is None:
+                    return
+                self._export(batch)
+            finally:
+                self._pending.task_done()
+
+    def _export(self, batch: list[VoltronSpan]):
+        try:
+            self.exporter.export(batch, self.service_name)
+        except Exception as e:
+            # Tracing must never break the work being traced
+            logger.error("Failed to export {} spans: {}".format(len(batch), e))
+
+    def flush(self):
+        """Export buffered spans and wait until every queued batch has been exported.
+        Blocks, so call it from a thread (or at exit) rather than inside a busy event loop.
+        """
+        with self._lock:
+            batch, self._finished = self._finished, []
+        if batch:
+            self._enqueue(batch)
+        if self._worker is not None:
+            self._pending.join()
+
+    def close(self):
+        """flush(), then stop the export thread"""
+        self.flush()
+        with self._worker_lock:
+            worker, self._worker = self._worker, None
+        if worker is not None:
+            self._pending.put(None)
+            worker.join()
+
+
+def span(tracer: Optional[VoltronTracer], name: str, **kwargs):
+    """tracer.span(name, ...), or a no-op context yielding None when tracer is None"""
+    if tracer is None:
+        return contextlib.nullcontext()
+    return tracer.span(name, **kwargs)
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_document(spans: Iterable[VoltronSpan], service_name: str) -> dict:
+    """OTLP/JSON ExportTraceServiceRequest for spans"""
+    encoded = []
+    for x in spans:
+        item = {
+            "traceId": x.trace_id,
+            "spanId": x.span_id,
+            "name": x.name,
+            "kind": SPAN_KINDS.get(x.kind, 1),
+            "startTimeUnixNano": str(x.start),
+            "endTimeUnixNano": str(x.end),
+            "attributes": [
+                {"key": k, "value": _otlp_value(v)} for k, v in x.attributes.items()
+            ],
+            "status": {"code": 1 if x.ok else 2},
+        }
+        if x.parent_id:
+            item["parentSpanId"] = x.parent_id
+        if x.status_message:
+            item["status"]["message"] = x.status_message
+        encoded.append(item)
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [
+                        {"key": "service.name", "value": {"stringValue": service_name}}
+                    ]
+                },
+                "scopeSpans": [{"scope": {"name": "voltronsecurity"}, "spans": encoded}],
+            }
+        ]
+    }
+
+
+class VoltronFileSpanExporter:
+    """Appends finished spans to a file, one JSON object per line"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: list[VoltronSpan], service_name: str):
+        lines = "".join(
+            json.dumps(dict(x.to_dict(), service=service_name), default=str) + "\n"
+            for x in spans
+        )
+        with self._lock:
+            with open(self.path, "a", encoding="utf8") as outfile:
+                outfile.write(lines)
+
+
+class VoltronMemorySpanExporter:
+    """Keeps exported OTLP documents in memory. Stand-in for a collector in tests and local runs."""
+
+    def __init__(self):
+        self.documents = []
+        self._lock = threading.Lock()
+
+    def export(self, spans: list[VoltronSpan], service_name: str):
+        with self._lock:
+            self.documents.append(otlp_document(spans, service_name))
+
+    def spans(self) -> list[dict]:
+        return [
+            x
+            for document in self.documents
+            for resource in document["resourceSpans"]
+            for scope in resource["scopeSpans"]
+            for x in scope["spans"]
+        ]
+
+
+class VoltronOTLPSpanExporter:
+    """POSTs spans as OTLP/JSON to a collector's HTTP endpoint, e.g.
+    http://localhost:4318/v1/traces. Needs requests (any of the snyk or wiz extras).
+    """
+
+    def __init__(self, endpoint: str, headers: Optional[dict] = None, timeout: float = 10):
+        self.endpoint = endpoint
+        self.headers = dict(headers or {})
+        self.headers.setdefault("Content-Type", "application/json")
+        self.timeout = timeout
+        self.session = None
+
+    def export(self, spans: list[VoltronSpan], service_name: str):
+        if self.session is None:
+            requests = import_optional("requests", "snyk")
+            self.session = requests.Session()
+        response = self.session.post(
+            self.endpoint,
+            data=json.dumps(otlp_document(spans, service_name)),
+            headers=self.headers,
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
@@ -1,20 +1,32 @@
-import csv
-import requests
 import json
 import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
 
 from voltronsecurity import helpers
 from voltronsecurity.voltron_base import VoltronFinding
+from voltronsecurity.voltron_checkpoint import crawl_identity
+from voltronsecurity.voltron_pagination import VoltronPageSizer
+from voltronsecurity.voltron_ratelimit import VoltronRateLimiter
+from voltronsecurity.voltron_stream import VoltronCrawler
 
-FORMAT = "[%(filename)s:%(lineno)s - %(funcName)s() ] %(message)s"
-logging.basicConfig(format=FORMAT)
 logger = logging.getLogger("wiz")
 logger.setLevel(os.environ.get("APP_LOGLEVEL", logging.DEBUG))
 
+TENANT_KEY = "voltronTenant"
+
+ISSUES_QUERY = "query IssuesTable($filterBy: IssueFilters, $first: Int, $after: String, $orderBy: IssueOrder) { issues(filterBy: $filterBy, first: $first, after: $after, orderBy: $orderBy) { nodes {  ...IssueDetails } pageInfo {  hasNextPage  endCursor } totalCount } }  "
+
+# Field sets for the IssueDetails fragment. "inventory" holds what VoltronWizFinding reads plus
+# a few fields for reports; "full" is everything the collector has always fetched.
+# Pass a custom "fragment IssueDetails on Issue { ... }" string to WizCollector for anything else.
+ISSUE_PROFILES = {
+    "full": "fragment IssueDetails on Issue { id control { id name securitySubCategories {  id  category {  id  } } } createdAt updatedAt status severity entity { id name type } resolutionReason entitySnapshot { id type name cloudPlatform cloudProviderURL region subscriptionName externalId subscriptionId subscriptionExternalId subscriptionTags nativeType } notes { id text } }",
+    "inventory": "fragment IssueDetails on Issue { id control { id name } createdAt updatedAt status severity entitySnapshot { id type name cloudPlatform region externalId subscriptionExternalId } }",
+}
+
 
 class VoltronWizFinding(VoltronFinding):
     def processPayload(self, payload):
@@ -34,6 +46,8 @@ class VoltronWizFinding(VoltronFinding):
             "findingDate": datetime.strptime(
                 payload["createdAt"], "%Y-%m-%dT%H:%M:%S.%fZ"
             ).isoformat(),
+            # Set by WizMultiTenantCollector. Also kept in toolFindingJson.
+            "tenant": payload.get(TENANT_KEY),
         }
         return results
 
@@ -43,16 +57,24 @@ class WizBaseApi:
         self,
         wiz_url="https://api.us2.app.wiz.io",
         wiz_auth_url="https://auth.app.wiz.io",
+        rate_limiter=None,
     ):
         self.base_url = wiz_url
         self.auth_url = wiz_auth_url
+        self.rate_limiter = rate_limiter
+        self.page_retries = 3
 
-    def gen_client(self, client_id, client_secret, headers=None):
+    def gen_client(self, client_id, client_secret, headers=None, compress=True):
+        """compress asks Wiz for gzip responses; requests decompresses them transparently"""
         if headers is None:
             headers = {
                 "Accept": "application/json",
                 "Content-Type": "application/x-www-form-urlencoded",
             }
+        requests = helpers.import_optional("requests", "wiz")
+        gql = helpers.import_optional("gql", "wiz")
+        gql_requests = helpers.import_optional("gql.transport.requests", "wiz")
+
         session = requests.Session()
         session.headers.update(headers)
         # Get an auth token, then update the session
@@ -60,10 +82,14 @@ class WizBaseApi:
         auth = f"Bearer {token}"
 
         url = self.base_url + "/graphql"
-        transport = RequestsHTTPTransport(
-            url=url, verify=True, retries=5, headers={"Authorization": auth}
+        transport_headers = {
+            "Authorization": auth,
+            "Accept-Encoding": "gzip, deflate" if compress else "identity",
+        }
+        transport = gql_requests.RequestsHTTPTransport(
+            url=url, verify=True, retries=5, headers=transport_headers
         )
-        client = Client(transport=transport, fetch_schema_from_transport=False)
+        client = gql.Client(transport=transport, fetch_schema_from_transport=False)
         return client, session
 
     def get_token(self, session, client_id, client_secret):
@@ -73,30 +99,125 @@ class WizBaseApi:
         token = resp.json()["access_token"]
         return token
 
-    def _query_paginator(self, gql_client, query_name, query, variables):
-        result = gql_client.execute(query, variable_values=variables)
+    def _response_bytes(self, result):
+        """Size of the decoded page. Content-Length is missing on chunked responses and
+        is the compressed size under gzip, so the parsed result is measured instead.
+        """
+        return len(json.dumps(result, separators=(",", ":")).encode())
+
+    def _execute_page(self, gql_client, query, variables, page_sizer=None):
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        if page_sizer is None:
+            return gql_client.execute(query, variable_values=variables)
+        page_size = page_sizer.page_size
+        variables["first"] = page_size
+        start = time.monotonic()
+        try:
+            result = gql_client.execute(query, variable_values=variables)
+        except Exception:
+            page_sizer.record(time.monotonic() - start, error=True, page_size=page_size)
+            raise
+        page_sizer.record(
+            time.monotonic() - start,
+            self._response_bytes(result),
+            page_size=page_size,
+        )
+        return result
+
+    def _query_paginator(
+        self,
+        gql_client,
+        query_name,
+        query,
+        variables,
+        checkpoint=None,
+        crawl_id=None,
+        page_sizer=None,
+        run_id=None,
+    ):
+        """Yield each page of a paginated query.
+        With a checkpoint store, the crawl resumes from the cursor saved by the same run and
+        the next cursor is saved once the consumer comes back for the following page.
+        With a VoltronPageSizer, "first" is set from the sizer before every request.
+        A page that still fails after page_retries gateway errors raises, so callers never
+        mistake a partial crawl for a complete one.
+        """
+        if checkpoint is not None:
+            if crawl_id is None:
+                if run_id is None:
+                    raise ValueError("Checkpointed crawls need a run_id")
+                crawl_id = self.checkpoint_id(query_name, variables, run_id)
+            saved = checkpoint.load(crawl_id)
+            if saved is not None:
+                logger.info("Resuming {} from checkpoint".format(crawl_id))
+                variables["after"] = saved["cursor"]
+        result = self._execute_page(gql_client, query, variables, page_sizer)
         yield result
+        failures = 0
         while result[query_name]["pageInfo"]["hasNextPage"]:
             variables["after"] = result[query_name]["pageInfo"]["endCursor"]
+            if checkpoint is not None:
+                checkpoint.save(crawl_id, variables["after"])
             try:
-                result = gql_client.execute(query, variable_values=variables)
-                yield result
+                result = self._execute_page(gql_client, query, variables, page_sizer)
             except Exception as e:
-                if "502: Bad Gateway" not in str(
-                    e
-                ) and "503: Service Unavailable" not in str(e):
-                    print("<p>WizIngestion-Error: %s</p>" % str(e))
-                    break
-                else:
-                    logger.warning(
-                        "Error: {errorstr}\n Retrying...".format(errorstr=str(e))
-                    )
-                    continue
-
-    def run_query(self, gql_client, query, qname, qvars):
+                transient = "502: Bad Gateway" in str(e) or "503: Service Unavailable" in str(e)
+                if not transient or failures >= self.page_retries:
+                    logger.error("WizIngestion-Error: {}".format(e))
+                    raise
+                failures += 1
+                logger.warning("Error: {errorstr}\n Retrying...".format(errorstr=str(e)))
+                continue
+            failures = 0
+            yield result
+        if checkpoint is not None:
+            checkpoint.clear(crawl_id)
+
+    def checkpoint_id(self, query_name, variables, run_id=None):
+        params = {k: v for k, v in variables.items() if k not in ("after", "first")}
+        params["url"] = self.base_url
+        return crawl_identity("wiz:{}".format(query_name), params, run_id)
+
+    def iter_pages(
+        self,
+        gql_client,
+        query,
+        qname,
+        qvars,
+        checkpoint=None,
+        page_sizer=None,
+        run_id=None,
+    ):
+        """Yield the nodes of each page. Persist each page before asking for the next one
+        when using a checkpoint store; run_id scopes the checkpoint to the current run.
+        """
+        for resp in self._query_paginator(
+            gql_client,
+            qname,
+            query,
+            qvars,
+            checkpoint=checkpoint,
+            page_sizer=page_sizer,
+            run_id=run_id,
+        ):
+            try:
+                yield resp[qname]["nodes"]
+            except KeyError:
+                logger.info("No nodes")
+                continue
+
+    def run_query(self, gql_client, query, qname, qvars, page_sizer=None):
+        """Collect every node. Use iter_pages with a checkpoint store to resume long crawls."""
         results = []
 
-        for resp in self._query_paginator(gql_client, qname, query, qvars):
+        for resp in self._query_paginator(
+            gql_client,
+            qname,
+            query,
+            qvars,
+            page_sizer=page_sizer,
+        ):
             try:
                 results.extend(resp[qname]["nodes"])
             except KeyError:
@@ -106,11 +227,36 @@ class WizBaseApi:
 
 
 class WizCollector:
-    def __init__(self, client_id, client_secret):
-        self.wiz_api = WizBaseApi()
+    def __init__(
+        self,
+        client_id,
+        client_secret,
+        page_sizers=None,
+        issue_profile="full",
+        compress=True,
+        wiz_url="https://api.us2.app.wiz.io",
+        wiz_auth_url="https://auth.app.wiz.io",
+        rate_limiter=None,
+    ):
+        self.wiz_api = WizBaseApi(wiz_url, wiz_auth_url, rate_limiter)
         self.api_client, self.session = self.wiz_api.gen_client(
-            client_id, client_secret
+            client_id, client_secret, compress=compress
         )
+        if page_sizers is None:
+            page_sizers = self.default_page_sizers()
+        self.page_sizers = page_sizers
+        self.issue_profile = issue_profile
+        self._issue_queries = {}
+
+    def default_page_sizers(self):
+        return {
+            "projects": VoltronPageSizer(100, 10, 500, step=10),
+            "issues": VoltronPageSizer(500, 25, 500, step=25),
+        }
+
+    def page_size_report(self):
+        """Page size chosen for each query, with the latency/bytes/error stats behind it"""
+        return {name: sizer.report() for name, sizer in self.page_sizers.items()}
 
     def get_projects(self):
         query_name = "projects"
@@ -118,14 +264,59 @@ class WizCollector:
             "first": 100,
             "filterBy": {},
         }
-        query = gql(
+        gql = helpers.import_optional("gql", "wiz")
+        query = gql.gql(
             "query ProjectsTable($filterBy: ProjectFilters, $first: Int, $after: String, $orderBy: ProjectOrder,) { projects(filterBy: $filterBy, first: $first, after: $after, orderBy: $orderBy) { nodes { id name slug archived } pageInfo { hasNextPage endCursor } totalCount LBICount MBICount HBICount }}"
         )
-        result = self.wiz_api.run_query(self.api_client, query, query_name, query_vars)
+        result = self.wiz_api.run_query(
+            self.api_client,
+            query,
+            query_name,
+            query_vars,
+            page_sizer=self.page_sizers.get("projects"),
+        )
         logger.debug({"projects": result})
         return result
 
-    def get_all_issues(self, project_id):
+    def get_all_issues(self, project_id, profile=None):
+        query, query_name, query_vars = self.issues_query(project_id, profile)
+        result = self.wiz_api.run_query(
+            self.api_client,
+            query,
+            query_name,
+            query_vars,
+            page_sizer=self.page_sizers.get("issues"),
+        )
+        return result
+
+    def iter_issue_pages(self, project_id, checkpoint=None, profile=None, run_id=None):
+        """Yield each page of a project's issues, resuming from the checkpoint run_id saved"""
+        query, query_name, query_vars = self.issues_query(project_id, profile)
+        return self.wiz_api.iter_pages(
+            self.api_client,
+            query,
+            query_name,
+            query_vars,
+            checkpoint=checkpoint,
+            page_sizer=self.page_sizers.get("issues"),
+            run_id=run_id,
+        )
+
+    def issue_document(self, profile=None):
+        """Parsed IssuesTable query for a profile name (see ISSUE_PROFILES) or fragment string.
+        Each profile is parsed once per collector.
+        """
+        if profile is None:
+            profile = self.issue_profile
+        if profile not in self._issue_queries:
+            fragment = ISSUE_PROFILES.get(profile, profile)
+            if not fragment.startswith("fragment IssueDetails on Issue"):
+                raise ValueError("Unknown issue profile {}".format(profile))
+            gql = helpers.import_optional("gql", "wiz")
+            self._issue_queries[profile] = gql.gql(ISSUES_QUERY + fragment)
+        return self._issue_queries[profile]
+
+    def issues_query(self, project_id, profile=None):
         query_name = "issues"
         query_vars = {
             "first": 500,
@@ -136,9 +327,88 @@ class WizCollector:
             },
             "orderBy": {"field": "SEVERITY", "direction": "DESC"},
         }
+        return self.issue_document(profile), query_name, query_vars
 
-        query = gql(
-            "query IssuesTable($filterBy: IssueFilters, $first: Int, $after: String, $orderBy: IssueOrder) { issues(filterBy: $filterBy, first: $first, after: $after, orderBy: $orderBy) { nodes {  ...IssueDetails } pageInfo {  hasNextPage  endCursor } totalCount } }  fragment IssueDetails on Issue { id control { id name securitySubCategories {  id  category {  id  } } } createdAt updatedAt status severity entity { id name type } resolutionReason entitySnapshot { id type name cloudPlatform cloudProviderURL region subscriptionName externalId subscriptionId subscriptionExternalId subscriptionTags nativeType } notes { id text } }"
-        )
-        result = self.wiz_api.run_query(self.api_client, query, query_name, query_vars)
-        return result
+
+class WizMultiTenantCollector(VoltronCrawler):
+    """Crawls several Wiz tenants, in any regions, concurrently into one stream of findings.
+    Each tenant config is a dict with name, client_id and client_secret, and optionally
+    wiz_url, wiz_auth_url, rate (requests per second) and burst. Every tenant gets its own
+    WizCollector, so auth tokens, sessions, page sizers and rate limits never mix.
+    A gql client isn't safe to share between threads, so each tenant's projects are crawled
+    one at a time and concurrency comes from crawling tenants side by side.
+    Findings carry the tenant name in tenant and in toolFindingJson["voltronTenant"].
+    After crawl() is exhausted, self.summary holds per-tenant counts and failures.
+    """
+
+    def __init__(
+        self,
+        tenants: list[dict],
+        max_concurrency=None,
+        issue_profile="full",
+        buffer_size=1000,
+        default_rate=5.0,
+    ):
+        names = [x["name"] for x in tenants]
+        if len(set(names)) != len(names):
+            raise ValueError("Tenant names must be unique")
+        super().__init__(buffer_size)
+        self.tenants = tenants
+        self.max_concurrency = max_concurrency or len(tenants)
+        self.issue_profile = issue_profile
+        self.default_rate = default_rate
+        self.collectors = {}
+
+    def get_collector(self, tenant):
+        """WizCollector for one tenant config, created on first use"""
+        name = tenant["name"]
+        if name not in self.collectors:
+            rate_limiter = VoltronRateLimiter(
+                tenant.get("rate", self.default_rate), tenant.get("burst")
+            )
+            self.collectors[name] = WizCollector(
+                tenant["client_id"],
+                tenant["client_secret"],
+                issue_profile=self.issue_profile,
+                wiz_url=tenant.get("wiz_url", "https://api.us2.app.wiz.io"),
+                wiz_auth_url=tenant.get("wiz_auth_url", "https://auth.app.wiz.io"),
+                rate_limiter=rate_limiter,
+            )
+        return self.collectors[name]
+
+    def _crawl_tenant(self, output, tenant):
+        name = tenant["name"]
+        try:
+            collector = self.get_collector(tenant)
+            projects = collector.get_projects()
+        except Exception as e:
+            logger.error("Tenant {}: {}".format(name, e))
+            self._record(name, "failures", "tenant {}: {}".format(name, e))
+            return
+        for project in projects:
+            if self._stop.is_set():
+                return
+            try:
+                for page in collector.iter_issue_pages(project["id"]):
+                    for payload in page:
+                        payload[TENANT_KEY] = name
+                        self._emit(output, VoltronWizFinding(payload))
+                        self._record(name, "issues")
+                    if self._stop.is_set():
+                        return
+            except Exception as e:
+                logger.error("Tenant {} project {}: {}".format(name, project["id"], e))
+                self._record(name, "failures", "project {}: {}".format(project["id"], e))
+                continue
+            self._record(name, "projects")
+
+    def crawl(self, tenants=None):
+        """Yield VoltronWizFinding objects from every tenant (default: all configured tenants)"""
+        if tenants is None:
+            tenants = self.tenants
+        pool = ThreadPoolExecutor(self.max_concurrency, "wiz-tenant")
+
+        def start(output):
+            wait([pool.submit(self._crawl_tenant, output, x) for x in tenants])
+
+        yield from self._stream([x["name"] for x in tenants], start, [pool], "wiz-crawl")
@@ -0,0 +1,14 @@
+import unittest
+
+from src.voltronsecurity.helpers import import_optional
+
+
+class TestImportOptional(unittest.TestCase):
+    def test_import_installed(self):
+        module = import_optional("json", "core")
+        self.assertTrue(hasattr(module, "dumps"))
+
+    def test_import_missing(self):
+        with self.assertRaises(ImportError) as ctx:
+            import_optional("voltron_missing_dependency", "wiz")
+        self.assertIn("voltronsecurity[wiz]", str(ctx.exception))
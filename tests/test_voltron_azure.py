@@ -4,11 +4,13 @@ import unittest
 import json
 from unittest import mock
 from src.voltronsecurity.voltron_azure import (
+    MessageSizeExceededError,
     VoltronAzureServiceBusQueue,
     DefaultAzureCredential,
     ServiceBusClient,
     ServiceBusMessage,
 )
+from src.voltronsecurity.voltron_retry import ATTEMPT_HEADER, VoltronRetryPolicy
 from azure.servicebus.aio import ServiceBusReceiver, ServiceBusSender
 
 
@@ -87,6 +89,58 @@ class TestVoltronAzureServiceBusQueue(unittest.TestCase):
         self.assertIn("data", resp[0])
         self.assertEqual(resp[0]["success"], False)
 
+    @mock.patch(
+        "src.voltronsecurity.voltron_azure.VoltronAzureServiceBusQueue.process_message",
+        return_value={"success": False, "message": "MockedFail", "data": {}},
+    )
+    @mock.patch("src.voltronsecurity.voltron_azure.ServiceBusClient")
+    def test_failed_process_messages_with_retry(self, mock_sbc, mock_vsb):
+        mock_sbr = mock.AsyncMock(spec=ServiceBusReceiver)
+        mock_sbr.receive_messages.return_value = self.sample_received_messages
+        mock_sbs = mock.AsyncMock(spec=ServiceBusSender)
+        mock_sbc.return_value.get_queue_receiver.return_value = mock_sbr
+        mock_sbc.return_value.get_queue_sender.return_value = mock_sbs
+        handler = VoltronAzureServiceBusQueue(
+            self.sample_queue_name,
+            self.sample_namespace,
+            self.sample_creds,
+            VoltronRetryPolicy(max_attempts=2),
+        )
+        received = ServiceBusMessage(
+            json.dumps(self.sample_voltron_payload),
+            correlation_id="run-1",
+            application_properties={"tenant": "acme", ATTEMPT_HEADER.encode(): 1},
+        )
+        mock_sbr.receive_messages.return_value = [received]
+        asyncio.run(handler.handle_messages())
+        mock_sbs.schedule_messages.assert_called_once()
+        retry = mock_sbs.schedule_messages.call_args.args[0]
+        self.assertEqual(retry.application_properties[ATTEMPT_HEADER], 2)
+        self.assertEqual(retry.application_properties["tenant"], "acme")
+        self.assertNotIn(ATTEMPT_HEADER.encode(), retry.application_properties)
+        self.assertEqual(retry.correlation_id, "run-1")
+        mock_sbr.complete_message.assert_called()
+        mock_sbr.dead_letter_message.assert_not_called()
+
+    @mock.patch(
+        "src.voltronsecurity.voltron_azure.VoltronAzureServiceBusQueue.process_message",
+        return_value={"success": False, "message": "MockedFail", "data": {}},
+    )
+    @mock.patch("src.voltronsecurity.voltron_azure.ServiceBusClient")
+    def test_failed_process_messages_dead_letter(self, mock_sbc, mock_vsb):
+        mock_sbr = mock.AsyncMock(spec=ServiceBusReceiver)
+        mock_sbr.receive_messages.return_value = self.sample_received_messages
+        mock_sbc.return_value.get_queue_receiver.return_value = mock_sbr
+        handler = VoltronAzureServiceBusQueue(
+            self.sample_queue_name,
+            self.sample_namespace,
+            self.sample_creds,
+            VoltronRetryPolicy(max_attempts=1),
+        )
+        asyncio.run(handler.handle_messages())
+        mock_sbr.dead_letter_message.assert_called_once()
+        mock_sbr.complete_message.assert_not_called()
+
     def test_generate_message(self):
         handler = VoltronAzureServiceBusQueue(
             self.sample_queue_name, self.sample_namespace, self.sample_creds
@@ -109,6 +163,20 @@ class TestVoltronAzureServiceBusQueue(unittest.TestCase):
         self.assertEqual(msg_json["messageSource"], msg_source)
         self.assertEqual(msg_json["startTime"], msg_start_time)
 
+    def test_trace_context_travels_in_application_properties(self):
+        handler = VoltronAzureServiceBusQueue(
+            self.sample_queue_name, self.sample_namespace, self.sample_creds
+        )
+        traceparent = "00-{}-{}-01".format("a" * 32, "b" * 16)
+        traced = handler._to_servicebus(
+            dict(self.sample_voltron_payload, traceContext={"traceparent": traceparent})
+        )
+        self.assertEqual(traced.application_properties, {"traceparent": traceparent})
+        self.assertNotIn("traceContext", json.loads(str(traced)))
+        self.assertIsNone(
+            handler._to_servicebus(self.sample_voltron_payload).application_properties
+        )
+
     @mock.patch("src.voltronsecurity.voltron_azure.ServiceBusClient")
     def test_happy_default_send_message(self, mock_sbc):
         mock_sbs = mock.AsyncMock(spec=ServiceBusSender)
@@ -141,3 +209,89 @@ class TestVoltronAzureServiceBusQueue(unittest.TestCase):
         self.assertIn("message", resp)
         self.assertEqual(resp["success"], False)
         self.assertEqual(resp["message"], "TestSendFailure")
+
+    def get_batch_sender(self, batch_limit, fail_batch=None):
+        """A sender whose batches hold batch_limit messages. Sending batch number fail_batch raises."""
+        mock_sbs = mock.AsyncMock(spec=ServiceBusSender)
+        self.sent_batches = []
+
+        def create_batch():
+            batch = mock.MagicMock()
+            batch.messages = []
+
+            def add_message(message):
+                if len(batch.messages) >= batch_limit or "huge" in str(message):
+                    raise MessageSizeExceededError(message="too big")
+                batch.messages.append(message)
+
+            batch.add_message.side_effect = add_message
+            return batch
+
+        async def send_messages(batch):
+            if fail_batch is not None and batch is self.created[fail_batch]:
+                raise Exception("TestSendFailure")
+            self.sent_batches.append(batch)
+
+        self.created = []
+
+        async def create_message_batch():
+            batch = create_batch()
+            self.created.append(batch)
+            return batch
+
+        mock_sbs.create_message_batch.side_effect = create_message_batch
+        mock_sbs.send_messages.side_effect = send_messages
+        return mock_sbs
+
+    @mock.patch("src.voltronsecurity.voltron_azure.ServiceBusClient")
+    def test_send_messages_batches(self, mock_sbc):
+        mock_sbs = self.get_batch_sender(batch_limit=2)
+        mock_sbc.return_value.get_queue_sender.return_value = mock_sbs
+        handler = VoltronAzureServiceBusQueue(
+            self.sample_queue_name, self.sample_namespace, self.sample_creds
+        )
+        messages = [dict(self.sample_voltron_payload, startTime=x) for x in range(5)]
+        resp = asyncio.run(handler.send_messages(messages))
+
+        self.assertTrue(resp["success"])
+        self.assertEqual(resp["message"], "Sent 5 of 5 messages")
+        self.assertEqual([len(x.messages) for x in self.sent_batches], [2, 2, 1])
+        mock_sbc.return_value.__aenter__.assert_called_once()
+
+    @mock.patch("src.voltronsecurity.voltron_azure.ServiceBusClient")
+    def test_send_messages_reports_failures(self, mock_sbc):
+        mock_sbs = self.get_batch_sender(batch_limit=2, fail_batch=1)
+        mock_sbc.return_value.get_queue_sender.return_value = mock_sbs
+        handler = VoltronAzureServiceBusQueue(
+            self.sample_queue_name, self.sample_namespace, self.sample_creds
+        )
+        messages = [dict(self.sample_voltron_payload, startTime=x) for x in range(4)]
+        messages.insert(1, dict(self.sample_voltron_payload, handlerData={"x": "huge"}))
+        resp = asyncio.run(handler.send_messages(messages, max_concurrency=2))
+
+        self.assertFalse(resp["success"])
+        self.assertEqual([x["index"] for x in resp["data"]["failures"]], [1, 2, 3])
+        self.assertEqual(resp["message"], "Sent 2 of 5 messages")
+
+    @mock.patch("src.voltronsecurity.voltron_azure.ServiceBusClient")
+    def test_send_messages_error_partway_keeps_sent_batches(self, mock_sbc):
+        mock_sbs = self.get_batch_sender(batch_limit=2, fail_batch=1)
+        mock_sbc.return_value.get_queue_sender.return_value = mock_sbs
+        handler = VoltronAzureServiceBusQueue(
+            self.sample_queue_name, self.sample_namespace, self.sample_creds
+        )
+        messages = [dict(self.sample_voltron_payload, startTime=x) for x in range(5)]
+        # Handling the second batch's failure blows up, aborting the remaining sends
+        with mock.patch(
+            "src.voltronsecurity.voltron_azure.logger.error",
+            side_effect=[RuntimeError("boom"), None],
+        ):
+            resp = asyncio.run(handler.send_messages(messages, max_concurrency=1))
+
+        self.assertEqual(len(self.sent_batches), 1)
+        self.assertEqual([x["index"] for x in resp["data"]["failures"]], [2, 3, 4])
+        self.assertEqual(resp["message"], "Sent 2 of 5 messages")
+
+
+if __name__ == "__main__":
+    unittest.main()
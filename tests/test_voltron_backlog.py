@@ -0,0 +1,211 @@
+import asyncio
+import math
+import unittest
+import urllib.request
+from unittest.mock import MagicMock
+
+from src.voltronsecurity.voltron_backlog import (
+    VoltronBacklogExporter,
+    VoltronLocalProbe,
+    VoltronRabbitMQManagementProbe,
+    VoltronServiceBusProbe,
+    queue_depth,
+)
+from src.voltronsecurity.voltron_memory import VoltronMemoryQueue
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def sample_message():
+    return {
+        "handlerName": "persist-wiz-findings",
+        "handlerConfig": {},
+        "handlerData": {},
+        "messageSource": "test",
+        "startTime": 1,
+    }
+
+
+class TestBacklogProbes(unittest.TestCase):
+    def test_rabbitmq_management(self):
+        probe = VoltronRabbitMQManagementProbe("http://rabbit:15672/", vhost="/")
+        probe.session = MagicMock()
+        probe.session.get.return_value.json.return_value = {
+            "messages_ready": 40,
+            "messages_unacknowledged": 10,
+            "consumers": 2,
+            "message_stats": {
+                "ack": 120,
+                "deliver_no_ack": 3,
+                "ack_details": {"rate": 5.0},
+            },
+        }
+        depth = probe.depth("persist-wiz-findings")
+        self.assertEqual(
+            probe.session.get.call_args[0][0],
+            "http://rabbit:15672/api/queues/%2F/persist-wiz-findings",
+        )
+        self.assertEqual(
+            depth, queue_depth("persist-wiz-findings", 40, 10, 2, 5.0, processed=123)
+        )
+
+    def test_servicebus(self):
+        with self.assertRaises(ValueError):
+            VoltronServiceBusProbe("namespace")
+        probe = VoltronServiceBusProbe(connection_string="Endpoint=sb://test/")
+        probe.client = MagicMock()
+        probe.client.get_queue_runtime_properties.return_value = MagicMock(
+            active_message_count=7, dead_letter_message_count=1
+        )
+        depth = probe.depth("inventory-snyk-findings")
+        self.assertEqual(depth["ready"], 7)
+        self.assertEqual(depth["deadLetter"], 1)
+        self.assertIsNone(depth["unacked"])
+
+
+class TestVoltronBacklogExporter(unittest.TestCase):
+    def setUp(self):
+        self.probe = MagicMock()
+        self.exporter = VoltronBacklogExporter(
+            self.probe, ["work"], window=60, target_drain_seconds=10
+        )
+        self.clock = FakeClock()
+        self.exporter.clock = self.clock
+        self.exporter._started = self.clock.now
+
+    def test_drain_from_local_rate(self):
+        self.probe.depth.return_value = queue_depth("work", 80, 20, consumers=2)
+        self.clock.now += 10
+        self.exporter.record("work", 50)
+        sample = asyncio.run(self.exporter.poll())["work"]
+        # The local rate is this process's one consumer; the broker reports two
+        self.assertEqual(sample["localRate"], 5.0)
+        self.assertEqual(sample["rate"], 10.0)
+        self.assertEqual(sample["drainSeconds"], 10.0)
+        # 5 messages/s per consumer; 100 messages in 10s needs 2
+        self.assertEqual(sample["desiredConsumers"], 2)
+
+    def test_local_consumers_are_not_the_broker_count(self):
+        exporter = VoltronBacklogExporter(
+            self.probe, ["work"], window=60, target_drain_seconds=10, local_consumers=2
+        )
+        exporter.clock = self.clock
+        exporter._started = self.clock.now
+        self.probe.depth.return_value = queue_depth("work", 100, consumers=8, rate=20.0)
+        self.clock.now += 10
+        exporter.record("work", 50)
+        sample = asyncio.run(exporter.poll())["work"]
+        # The broker's rate describes the queue; the local one only sizes a consumer
+        self.assertEqual(sample["rate"], 20.0)
+        self.assertEqual(sample["desiredConsumers"], 4)
+
+    def test_rate_from_consumed_counter(self):
+        self.probe.depth.return_value = queue_depth("work", 100, 0, 4, processed=1000)
+        asyncio.run(self.exporter.poll())
+        self.clock.now += 10
+        self.probe.depth.return_value = queue_depth("work", 100, 0, 4, processed=1200)
+        sample = asyncio.run(self.exporter.poll())["work"]
+        self.assertEqual(sample["rate"], 20.0)
+        self.assertEqual(sample["growthRate"], 0.0)
+        # Flat backlog: arrivals keep pace, so it never drains at this size
+        self.assertTrue(math.isinf(sample["drainSeconds"]))
+        # 5/s per consumer must cover 20/s arriving plus 100 messages in 10s
+        self.assertEqual(sample["desiredConsumers"], 6)
+
+    def test_growing_backlog_scales_up(self):
+        self.probe.depth.return_value = queue_depth("work", 10, consumers=3)
+        asyncio.run(self.exporter.poll())
+        self.clock.now += 10
+        self.probe.depth.return_value = queue_depth("work", 50, consumers=3)
+        sample = asyncio.run(self.exporter.poll())["work"]
+        self.assertEqual(sample["growthRate"], 4.0)
+        self.assertIsNone(sample["rate"])
+        self.assertTrue(math.isinf(sample["drainSeconds"]))
+        self.assertEqual(sample["desiredConsumers"], 4)
+
+    def test_old_observations_expire(self):
+        self.assertIsNone(self.exporter.rate("work"))
+        self.exporter.record("work", 100)
+        self.clock.now += 120
+        # An instrumented worker that processed nothing in the window reports a stall
+        self.assertEqual(self.exporter.rate("work"), 0.0)
+
+    def test_falls_back_to_probe_then_shrink_rate(self):
+        self.probe.depth.return_value = queue_depth("work", 30, rate=3.0)
+        self.assertEqual(asyncio.run(self.exporter.poll())["work"]["drainSeconds"], 10.0)
+
+        exporter = VoltronBacklogExporter(self.probe, ["work"], window=60)
+        exporter.clock = self.clock
+        self.probe.depth.return_value = queue_depth("work", 100)
+        sample = asyncio.run(exporter.poll())["work"]
+        self.assertTrue(math.isinf(sample["drainSeconds"]))
+        self.clock.now += 10
+        self.probe.depth.return_value = queue_depth("work", 60)
+        sample = asyncio.run(exporter.poll())["work"]
+        self.assertEqual(sample["rate"], 4.0)
+        self.assertEqual(sample["drainSeconds"], 15.0)
+
+    def test_empty_queue(self):
+        self.probe.depth.return_value = queue_depth("work", 0, 0)
+        sample = asyncio.run(self.exporter.poll())["work"]
+        self.assertEqual(sample["drainSeconds"], 0.0)
+
+    def test_poll_error_keeps_last_sample(self):
+        self.probe.depth.return_value = queue_depth("work", 5)
+        asyncio.run(self.exporter.poll())
+        self.probe.depth.side_effect = ConnectionError("broker down")
+        samples = asyncio.run(self.exporter.poll())
+        self.assertEqual(samples["work"]["ready"], 5)
+        self.assertEqual(self.exporter.poll_errors["work"], 1)
+
+    def test_render(self):
+        self.probe.depth.return_value = queue_depth("work", 12, 3)
+        asyncio.run(self.exporter.poll())
+        text = self.exporter.render()
+        self.assertIn("# TYPE voltron_queue_messages_ready gauge", text)
+        self.assertIn('voltron_queue_messages_ready{queue="work"} 12', text)
+        self.assertIn('voltron_queue_messages_unacked{queue="work"} 3', text)
+        self.assertIn('voltron_queue_drain_seconds{queue="work"} +Inf', text)
+        self.assertIn('voltron_queue_poll_errors_total{queue="work"} 0', text)
+        self.assertNotIn("voltron_queue_consumers", text)
+
+
+class TestBacklogWithMemoryQueue(unittest.TestCase):
+    def test_instrumented_worker(self):
+        async def run():
+            queue = VoltronMemoryQueue("work")
+            exporter = VoltronBacklogExporter(VoltronLocalProbe(queue), ["work"])
+            exporter.instrument(queue)
+            for _ in range(5):
+                await queue.send_message(sample_message())
+            before = dict((await exporter.poll())["work"])
+            await queue.handle_messages(max_message_count=2, max_wait_time=0.1)
+            after = (await exporter.poll())["work"]
+            return before, after
+
+        before, after = asyncio.run(run())
+        self.assertEqual(before["ready"], 5)
+        self.assertEqual(after["ready"], 3)
+        self.assertEqual(after["rate"], 2.0)
+
+    def test_serve(self):
+        exporter = VoltronBacklogExporter(MagicMock(), ["work"])
+        exporter.samples["work"] = exporter.estimate(queue_depth("work", 4))
+        server = exporter.serve(port=0, host="127.0.0.1")
+        try:
+            url = "http://127.0.0.1:{}/metrics".format(server.server_address[1])
+            with urllib.request.urlopen(url) as response:
+                body = response.read().decode("utf8")
+        finally:
+            server.shutdown()
+        self.assertIn('voltron_queue_messages_ready{queue="work"} 4', body)
+
+
+if __name__ == "__main__":
+    unittest.main()
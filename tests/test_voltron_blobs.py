@@ -0,0 +1,62 @@
+import json
+import unittest
+
+from src.voltronsecurity.voltron_blobs import (
+    BLOB_REF_KEY,
+    blob_hash,
+    find_blob_refs,
+    finding_document,
+    join_document,
+    load_finding_json,
+    split_document,
+)
+
+
+class TestVoltronBlobs(unittest.TestCase):
+    def setUp(self):
+        self.document = {
+            "id": "issue-1",
+            "entitySnapshot": {"name": "vm-1", "tags": {"env": "prod"}},
+            "sourceRule": {"name": "rule", "description": "x" * 300},
+        }
+
+    def test_blob_hash_ignores_key_order(self):
+        self.assertEqual(blob_hash({"a": 1, "b": 2}), blob_hash({"b": 2, "a": 1}))
+        self.assertNotEqual(blob_hash({"a": 1}), blob_hash({"a": 2}))
+
+    def test_load_finding_json_decodes_once(self):
+        self.assertEqual(load_finding_json(json.dumps(self.document)), self.document)
+        self.assertEqual(load_finding_json(self.document), self.document)
+        # A string document that happens to hold JSON is not decoded a second time
+        self.assertEqual(load_finding_json(json.dumps('{"a": 1}')), '{"a": 1}')
+        self.assertEqual(load_finding_json(json.dumps("plain")), "plain")
+
+    def test_finding_document_unwraps_encoded_payloads(self):
+        encoded = json.dumps(json.dumps(self.document))
+        self.assertEqual(finding_document(encoded), self.document)
+        self.assertEqual(finding_document(json.dumps("plain")), "plain")
+        self.assertEqual(finding_document(json.dumps("42")), "42")
+
+    def test_split_by_size(self):
+        document, blobs = split_document(self.document)
+        self.assertEqual(list(blobs.values()), [self.document["sourceRule"]])
+        self.assertIn(BLOB_REF_KEY, document["sourceRule"])
+        self.assertEqual(document["entitySnapshot"], self.document["entitySnapshot"])
+
+    def test_split_by_path_round_trip(self):
+        document, blobs = split_document(self.document, paths=["entitySnapshot.tags", "missing.key"])
+        self.assertEqual(len(blobs), 1)
+        self.assertEqual(self.document["entitySnapshot"]["tags"], {"env": "prod"})
+        self.assertEqual(find_blob_refs(document), set(blobs))
+        self.assertEqual(join_document(document, blobs), self.document)
+
+    def test_identical_subdocuments_share_a_blob(self):
+        first, blobs_a = split_document(self.document, paths=["entitySnapshot"])
+        other = dict(self.document, id="issue-2")
+        second, blobs_b = split_document(other, paths=["entitySnapshot"])
+        self.assertEqual(first["entitySnapshot"], second["entitySnapshot"])
+        self.assertEqual(blobs_a, blobs_b)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+import time
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from src.voltronsecurity.voltron_buffer import VoltronFindingBuffer, row_bytes
+
+
+def sample_row(finding_id, summary="summary"):
+    return ("Wiz", "BUCKET", "bucket", finding_id, summary, "{}", "url", "HIGH", "HIGH", "d", "d")
+
+
+class TestVoltronFindingBuffer(unittest.TestCase):
+    def setUp(self):
+        self.db = MagicMock()
+
+    def test_row_bytes(self):
+        self.assertEqual(row_bytes(("ab", 1, "cde")), 5)
+
+    def test_flush_on_row_count(self):
+        buffer = VoltronFindingBuffer(self.db, "VOLTRON_FINDINGS", max_rows=3)
+        ack1, ack2 = MagicMock(), MagicMock()
+        self.assertFalse(buffer.add([sample_row("a"), sample_row("b")], ack1))
+        ack1.assert_not_called()
+        self.assertTrue(buffer.add([sample_row("c")], ack2))
+        ack1.assert_called_once()
+        ack2.assert_called_once()
+        self.db.write_batch.assert_called_once()
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(buffer.rows_written, 3)
+
+    def test_flush_on_bytes(self):
+        buffer = VoltronFindingBuffer(self.db, "VOLTRON_FINDINGS", max_bytes=50)
+        self.assertTrue(buffer.add([sample_row("a", "x" * 100)]))
+
+    def test_flush_on_age(self):
+        buffer = VoltronFindingBuffer(self.db, "VOLTRON_FINDINGS", max_age=5)
+        with patch("src.voltronsecurity.voltron_buffer.time.monotonic", return_value=100):
+            buffer.add([sample_row("a")])
+        with patch("src.voltronsecurity.voltron_buffer.time.monotonic", return_value=104):
+            self.assertFalse(buffer.maybe_flush())
+        with patch("src.voltronsecurity.voltron_buffer.time.monotonic", return_value=105):
+            self.assertTrue(buffer.maybe_flush())
+
+    def test_failed_flush_nacks(self):
+        self.db.write_batch.side_effect = Exception("TestWriteFailure")
+        buffer = VoltronFindingBuffer(self.db, "VOLTRON_FINDINGS", max_rows=1)
+        ack, nack = MagicMock(), MagicMock()
+        self.assertFalse(buffer.add([sample_row("a")], ack, nack))
+        ack.assert_not_called()
+        nack.assert_called_once()
+
+    def test_dedupe_keeps_last(self):
+        buffer = VoltronFindingBuffer(self.db, "VOLTRON_FINDINGS", max_rows=10)
+        buffer.add([sample_row("a", "old"), sample_row("b")])
+        buffer.add([sample_row("a", "new")])
+        buffer.flush()
+        rows = self.db.write_batch.call_args.args[1]
+        self.assertEqual(len(rows), 2)
+        self.assertIn(sample_row("a", "new"), rows)
+
+    def test_async_flush(self):
+        buffer = VoltronFindingBuffer(self.db, "VOLTRON_FINDINGS", max_rows=2)
+        ack = AsyncMock()
+        flushed = asyncio.run(buffer.aadd([sample_row("a"), sample_row("b")], ack))
+        self.assertTrue(flushed)
+        ack.assert_awaited_once()
+
+    def test_concurrent_async_flushes_are_serialized(self):
+        active = []
+        overlap = []
+        lock = threading.Lock()
+
+        def write_batch(table, rows, onConflict):
+            with lock:
+                active.append(rows)
+                overlap.append(len(active))
+            time.sleep(0.05)
+            with lock:
+                active.remove(rows)
+            if rows[0][3] == "a":
+                raise Exception("TestWriteFailure")
+
+        self.db.write_batch.side_effect = write_batch
+        buffer = VoltronFindingBuffer(self.db, "VOLTRON_FINDINGS", max_rows=1)
+        first, second = (AsyncMock(), AsyncMock()), (AsyncMock(), AsyncMock())
+
+        async def run():
+            return await asyncio.gather(
+                buffer.aadd([sample_row("a")], *first),
+                buffer.aadd([sample_row("b")], *second),
+            )
+
+        self.assertEqual(asyncio.run(run()), [False, True])
+        self.assertEqual(max(overlap), 1)
+        first[0].assert_not_awaited()
+        first[1].assert_awaited_once()
+        second[0].assert_awaited_once()
+        second[1].assert_not_awaited()
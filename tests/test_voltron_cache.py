@@ -0,0 +1,89 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from src.voltronsecurity.voltron_cache import VoltronDecorationCache
+from src.voltronsecurity.voltron_snyk import snykFinding
+
+
+class TestVoltronDecorationCache(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempdir.name, "decorations.db")
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_get_set(self):
+        cache = VoltronDecorationCache(self.path)
+        self.assertIsNone(cache.get("issue1", "v1"))
+        cache.set("issue1", "v1", {"attributes": {"title": "t"}})
+        self.assertEqual(cache.get("issue1", "v1"), {"attributes": {"title": "t"}})
+        self.assertIsNone(cache.get("issue1", "v2"))
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 2)
+        cache.close()
+
+    def test_ttl(self):
+        cache = VoltronDecorationCache(self.path, ttl=10)
+        with patch("src.voltronsecurity.voltron_cache.time.time", return_value=1000):
+            cache.set("issue1", "", {"a": 1})
+        with patch("src.voltronsecurity.voltron_cache.time.time", return_value=1011):
+            self.assertIsNone(cache.get("issue1", ""))
+            cache.evict()
+        self.assertEqual(len(cache), 0)
+
+    def test_size_eviction(self):
+        cache = VoltronDecorationCache(self.path, max_entries=2, evict_every=1)
+        now = time.time()
+        for x in range(4):
+            with patch("src.voltronsecurity.voltron_cache.time.time", return_value=now + x):
+                cache.set("issue{}".format(x), "", {"n": x})
+        self.assertEqual(len(cache), 2)
+        self.assertIsNotNone(cache.get("issue3", ""))
+        self.assertIsNone(cache.get("issue0", ""))
+
+
+class TestCachedDecoration(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.cache = VoltronDecorationCache(os.path.join(self.tempdir.name, "d.db"))
+        self.snykData = {
+            "id": "issue1",
+            "attributes": {"updated_at": "2023-07-08T00:00:00Z"},
+            "links": {"self": "/issue1"},
+        }
+        self.apiHandler = MagicMock()
+        self.apiHandler.get_finding_data.return_value = {
+            "attributes": {
+                "title": "Test finding",
+                "primaryFilePath": "path/to/file",
+                "primaryRegion": "region",
+                "extra": "not cached",
+            }
+        }
+
+    def tearDown(self):
+        self.cache.close()
+        self.tempdir.cleanup()
+
+    def test_second_decoration_is_cached(self):
+        snykFinding(dict(self.snykData)).decorate_issue(self.apiHandler, self.cache)
+        finding = snykFinding(dict(self.snykData))
+        finding.decorate_issue(self.apiHandler, self.cache)
+        self.assertEqual(self.apiHandler.get_finding_data.call_count, 1)
+        self.assertEqual(finding.longTitle, "Test finding")
+        self.assertEqual(finding.locationData, "region")
+
+    def test_failed_decoration_not_cached(self):
+        self.apiHandler.get_finding_data.return_value = {
+            "attributes": {
+                "title": "DecorationFailed",
+                "primaryFilePath": "DecorationFailed",
+                "primaryRegion": "DecorationFailed",
+            }
+        }
+        snykFinding(dict(self.snykData)).decorate_issue(self.apiHandler, self.cache)
+        self.assertEqual(len(self.cache), 0)
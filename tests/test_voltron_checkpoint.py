@@ -0,0 +1,145 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from src.voltronsecurity.voltron_checkpoint import (
+    VoltronFileCheckpointStore,
+    crawl_identity,
+)
+from src.voltronsecurity.voltron_snyk import SnykCodeCollector
+from src.voltronsecurity.voltron_wiz import WizBaseApi
+
+
+def wiz_page(nodes, end_cursor=None):
+    return {
+        "issues": {
+            "nodes": nodes,
+            "pageInfo": {"hasNextPage": end_cursor is not None, "endCursor": end_cursor},
+        }
+    }
+
+
+def snyk_page(data, next_url=None):
+    response = MagicMock()
+    response.status_code = 200
+    response.json.return_value = {"data": data, "links": {"next": next_url}}
+    return response
+
+
+class TestCrawlIdentity(unittest.TestCase):
+    def test_stable(self):
+        self.assertEqual(
+            crawl_identity("wiz:issues", {"a": 1, "b": 2}),
+            crawl_identity("wiz:issues", {"b": 2, "a": 1}),
+        )
+        self.assertNotEqual(
+            crawl_identity("wiz:issues", {"a": 1}), crawl_identity("wiz:issues", {"a": 2})
+        )
+        self.assertEqual(crawl_identity("wiz:projects"), "wiz:projects")
+        self.assertNotEqual(
+            crawl_identity("wiz:issues", {"a": 1}, "run1"),
+            crawl_identity("wiz:issues", {"a": 1}, "run2"),
+        )
+
+
+class TestVoltronFileCheckpointStore(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempdir.name, "checkpoints.json")
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_save_load_clear(self):
+        store = VoltronFileCheckpointStore(self.path)
+        self.assertIsNone(store.load("crawl"))
+        store.save("crawl", "cursor1")
+        self.assertEqual(VoltronFileCheckpointStore(self.path).load("crawl")["cursor"], "cursor1")
+        store.clear("crawl")
+        self.assertIsNone(store.load("crawl"))
+
+    def test_corrupt_file(self):
+        with open(self.path, "w") as outfile:
+            outfile.write("{not json")
+        store = VoltronFileCheckpointStore(self.path)
+        self.assertIsNone(store.load("crawl"))
+
+
+class TestPaginatorCheckpoints(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.store = VoltronFileCheckpointStore(
+            os.path.join(self.tempdir.name, "checkpoints.json")
+        )
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_wiz_resume(self):
+        api = WizBaseApi()
+        client = MagicMock()
+        client.execute.side_effect = [wiz_page([1], "c1"), wiz_page([2], "c2")]
+        variables = {"first": 500, "filterBy": {"project": ["p1"]}}
+        pages = api.iter_pages(
+            client, "query", "issues", dict(variables), self.store, run_id="run1"
+        )
+        self.assertEqual(next(pages), [1])
+        self.assertEqual(next(pages), [2])
+        crawl_id = api.checkpoint_id("issues", variables, "run1")
+        self.assertEqual(self.store.load(crawl_id)["cursor"], "c1")
+
+        # A new worker picks up after the last committed page
+        responses = [wiz_page([2], "c2"), wiz_page([3])]
+        cursors = []
+
+        def execute(query, variable_values):
+            cursors.append(variable_values.get("after"))
+            return responses.pop(0)
+
+        client.execute.side_effect = execute
+        pages = list(
+            api.iter_pages(
+                client, "query", "issues", dict(variables), self.store, run_id="run1"
+            )
+        )
+        self.assertEqual(pages, [[2], [3]])
+        self.assertEqual(cursors, ["c1", "c2"])
+        self.assertIsNone(self.store.load(crawl_id))
+
+    def test_wiz_checkpoint_belongs_to_its_run(self):
+        api = WizBaseApi()
+        client = MagicMock()
+        variables = {"first": 500, "filterBy": {"project": ["p1"]}}
+        self.store.save(api.checkpoint_id("issues", variables, "run1"), "c1")
+        client.execute.return_value = wiz_page([1])
+        pages = list(
+            api.iter_pages(
+                client, "query", "issues", dict(variables), self.store, run_id="run2"
+            )
+        )
+        # An abandoned checkpoint from another run never skips pages of this one
+        self.assertEqual(pages, [[1]])
+        self.assertNotIn("after", client.execute.call_args.kwargs["variable_values"])
+        with self.assertRaises(ValueError):
+            next(api.iter_pages(client, "query", "issues", dict(variables), self.store))
+
+    def test_snyk_resume(self):
+        collector = SnykCodeCollector("abc123", [], {})
+        session = MagicMock()
+        session.get.side_effect = [snyk_page([1], "/next1"), snyk_page([2], "/next2")]
+        org = MagicMock(id="org1")
+        project = MagicMock(id="p1")
+        pages = collector.iter_code_issue_pages(org, project, session, self.store, "run1")
+        self.assertEqual(next(pages), [1])
+        self.assertEqual(next(pages), [2])
+        pages.close()
+
+        session.get.side_effect = [snyk_page([2], "/next2"), snyk_page([3])]
+        pages = list(
+            collector.iter_code_issue_pages(org, project, session, self.store, "run1")
+        )
+        self.assertEqual(pages, [[2], [3]])
+        self.assertTrue(
+            session.get.call_args_list[2].args[0].startswith("https://api.snyk.io/rest/next1")
+        )
@@ -0,0 +1,146 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from src.voltronsecurity.voltron_base import VoltronBaseQueryInterface
+from src.voltronsecurity.voltron_dispatch import (
+    VoltronDispatcher,
+    VoltronHandlerRegistry,
+)
+
+
+class EchoHandler(VoltronBaseQueryInterface):
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def run_query(self, query_message):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+        return {"success": True, "message": "", "data": query_message["handlerData"]}
+
+    def process_results(self, results):
+        return {"success": True, "message": "processed", "data": results["data"]}
+
+
+class AsyncFailHandler(VoltronBaseQueryInterface):
+    async def run_query(self, query_message):
+        return {"success": False, "message": "no data", "data": {}}
+
+
+def sample_message(handler_name, data=None):
+    return {
+        "handlerName": handler_name,
+        "handlerConfig": {},
+        "handlerData": data or {},
+        "messageSource": "test_voltron_dispatch.py",
+        "startTime": 12345,
+    }
+
+
+class TestVoltronHandlerRegistry(unittest.TestCase):
+    def test_register(self):
+        registry = VoltronHandlerRegistry()
+        handler = EchoHandler()
+        registration = registry.register("echo", handler, max_concurrency=2, timeout=5)
+        self.assertIn("echo", registry)
+        self.assertEqual(registry.get("echo"), registration)
+        self.assertEqual(registration.max_concurrency, 2)
+        self.assertEqual(registry.handler_names(), ["echo"])
+
+    def test_register_duplicate(self):
+        registry = VoltronHandlerRegistry()
+        registry.register("echo", EchoHandler())
+        with self.assertRaises(ValueError):
+            registry.register("echo", EchoHandler())
+
+    def test_register_invalid_concurrency(self):
+        registry = VoltronHandlerRegistry()
+        with self.assertRaises(ValueError):
+            registry.register("echo", EchoHandler(), max_concurrency=0)
+
+
+class TestVoltronDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.registry = VoltronHandlerRegistry()
+
+    def test_dispatch(self):
+        self.registry.register("echo", EchoHandler())
+        dispatcher = VoltronDispatcher(self.registry)
+        resp = asyncio.run(dispatcher.dispatch(sample_message("echo", {"a": 1})))
+        self.assertTrue(resp["success"])
+        self.assertEqual(resp["message"], "processed")
+        self.assertEqual(resp["data"], {"a": 1})
+
+    def test_dispatch_unknown_handler(self):
+        dispatcher = VoltronDispatcher(self.registry)
+        resp = asyncio.run(dispatcher.dispatch(sample_message("missing")))
+        self.assertFalse(resp["success"])
+
+    def test_dispatch_failed_query_skips_processing(self):
+        self.registry.register("fail", AsyncFailHandler())
+        dispatcher = VoltronDispatcher(self.registry)
+        resp = asyncio.run(dispatcher.dispatch(sample_message("fail")))
+        self.assertFalse(resp["success"])
+        self.assertEqual(resp["message"], "no data")
+
+    def test_dispatch_timeout(self):
+        self.registry.register("slow", EchoHandler(delay=0.2), timeout=0.01)
+        dispatcher = VoltronDispatcher(self.registry)
+        resp = asyncio.run(dispatcher.dispatch(sample_message("slow")))
+        self.assertFalse(resp["success"])
+        self.assertIn("timed out", resp["message"])
+
+    def test_timed_out_thread_keeps_its_slot(self):
+        slow = EchoHandler(delay=0.2)
+        fast = EchoHandler()
+        self.registry.register("slow", slow, max_concurrency=1, timeout=0.02)
+        self.registry.register("fast", fast, max_concurrency=1)
+        dispatcher = VoltronDispatcher(self.registry)
+
+        async def run():
+            first = await dispatcher.dispatch(sample_message("slow"))
+            # The first call's thread is still sleeping, so this one waits for the slot
+            second = asyncio.ensure_future(dispatcher.dispatch(sample_message("slow")))
+            start = time.monotonic()
+            fast_resp = await dispatcher.dispatch(sample_message("fast", {"n": 1}))
+            fast_elapsed = time.monotonic() - start
+            await second
+            return first, fast_resp, fast_elapsed
+
+        first, fast_resp, fast_elapsed = asyncio.run(run())
+        self.assertIn("timed out", first["message"])
+        self.assertTrue(fast_resp["success"])
+        self.assertLess(fast_elapsed, 0.1)
+        self.assertEqual(slow.max_active, 1)
+        dispatcher.close()
+
+    def test_dispatcher_reused_across_event_loops(self):
+        self.registry.register("echo", EchoHandler(delay=0.01), max_concurrency=1)
+        dispatcher = VoltronDispatcher(self.registry)
+        for _ in range(2):
+            resp = asyncio.run(
+                dispatcher.dispatch_many([sample_message("echo", {"n": x}) for x in range(3)])
+            )
+            self.assertEqual([x["data"]["n"] for x in resp], [0, 1, 2])
+        dispatcher.close()
+
+    def test_dispatch_many_respects_concurrency(self):
+        slow = EchoHandler(delay=0.05)
+        fast = EchoHandler()
+        self.registry.register("slow", slow, max_concurrency=2)
+        self.registry.register("fast", fast, max_concurrency=1)
+        dispatcher = VoltronDispatcher(self.registry)
+        messages = [sample_message("slow", {"n": x}) for x in range(6)]
+        messages.append(sample_message("fast", {"n": 6}))
+        resp = asyncio.run(dispatcher.dispatch_many(messages))
+        self.assertEqual([x["data"]["n"] for x in resp], list(range(7)))
+        self.assertEqual(slow.max_active, 2)
+        dispatcher.close()
@@ -0,0 +1,45 @@
+import unittest
+
+from src.voltronsecurity.voltron_fingerprint import (
+    VoltronFingerprint,
+    canonical_json,
+    fingerprint,
+)
+
+
+class TestVoltronFingerprint(unittest.TestCase):
+    def test_canonical_json(self):
+        self.assertEqual(canonical_json({"b": 1.0, "a": [2.5, "é"]}), '{"a":[2.5,"é"],"b":1}'.encode())
+        self.assertEqual(canonical_json({"x": float("nan")}), b'{"x":"nan"}')
+
+    def test_key_order_and_number_format(self):
+        self.assertEqual(
+            fingerprint({"port": 3389, "source": "a"}),
+            fingerprint({"source": "a", "port": 3389.0}),
+        )
+        self.assertNotEqual(fingerprint({"port": 3389}), fingerprint({"port": 3390}))
+
+    def test_fields(self):
+        finger = VoltronFingerprint(fields=["source", "meta.port"])
+        first = {"source": "a", "meta": {"port": 22}, "time": 1}
+        second = {"source": "a", "meta": {"port": 22}, "time": 2}
+        self.assertEqual(finger(first), finger(second))
+        self.assertEqual(finger.select({"source": "a"}), {"source": "a"})
+
+    def test_exclude(self):
+        finger = VoltronFingerprint(exclude=["time"])
+        self.assertEqual(finger({"a": 1, "time": 1}), finger({"a": 1, "time": 2}))
+        with self.assertRaises(ValueError):
+            VoltronFingerprint(fields=["a"], exclude=["b"])
+
+    def test_namespace_and_batch(self):
+        payloads = [{"a": 1}, {"a": 2}]
+        wiz = VoltronFingerprint(namespace="Wiz", digest_size=20)
+        snyk = VoltronFingerprint(namespace="SnykCode", digest_size=20)
+        self.assertNotEqual(wiz(payloads[0]), snyk(payloads[0]))
+        self.assertEqual(wiz.many(payloads), [wiz(x) for x in payloads])
+        self.assertEqual(len(wiz(payloads[0])), 40)
+
+
+if __name__ == "__main__":
+    unittest.main()
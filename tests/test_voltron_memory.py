@@ -0,0 +1,119 @@
+import asyncio
+import json
+import multiprocessing
+import unittest
+
+from src.voltronsecurity.voltron_memory import (
+    VoltronMemoryBroker,
+    VoltronMemoryQueue,
+    VoltronMultiprocessBroker,
+    VoltronMultiprocessQueue,
+)
+from src.voltronsecurity.voltron_retry import ERROR_HEADER, VoltronRetryPolicy
+
+
+class FailingMemoryQueue(VoltronMemoryQueue):
+    async def process_message(self, message):
+        return {"success": False, "message": "MockedFail", "data": {}}
+
+
+def consume_one(broker, results):
+    handler = VoltronMultiprocessQueue("work", broker)
+    resp = asyncio.run(handler.handle_messages(max_wait_time=5))
+    results.put(resp[0]["data"]["handlerName"])
+
+
+class TestVoltronMemoryQueue(unittest.TestCase):
+    def setUp(self):
+        self.sample_voltron_payload = {
+            "handlerName": "samplehandler",
+            "handlerConfig": {},
+            "handlerData": {},
+            "messageSource": "test_voltron_memory.py",
+            "startTime": 12345,
+        }
+
+    def test_generate_message(self):
+        handler = VoltronMemoryQueue("work")
+        message = handler.generate_message("h", {}, {"a": 1}, "src", 1)
+        self.assertEqual(json.loads(message)["handlerData"], {"a": 1})
+
+    def test_send_and_handle(self):
+        async def run():
+            broker = VoltronMemoryBroker()
+            sender = VoltronMemoryQueue("work", broker)
+            consumer = VoltronMemoryQueue("work", broker)
+            for _ in range(3):
+                resp = await sender.send_message(self.sample_voltron_payload)
+                self.assertTrue(resp["success"])
+            results = await consumer.handle_messages(max_message_count=10)
+            return results, consumer.qsize()
+
+        results, remaining = asyncio.run(run())
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0]["data"], self.sample_voltron_payload)
+        self.assertEqual(remaining, 0)
+
+    def test_failed_message_is_redelivered(self):
+        async def run():
+            handler = FailingMemoryQueue("work")
+            await handler.send_message(self.sample_voltron_payload)
+            results = await handler.handle_messages()
+            envelope = handler.broker.get_queue("work").get_nowait()
+            return results, envelope
+
+        results, envelope = asyncio.run(run())
+        self.assertFalse(results[0]["success"])
+        self.assertEqual(envelope["deliveryCount"], 1)
+
+    def test_poison_message_is_dead_lettered(self):
+        async def run():
+            handler = FailingMemoryQueue("work", retry_policy=VoltronRetryPolicy(max_attempts=3))
+            await handler.send_message(self.sample_voltron_payload)
+            deliveries = 0
+            for _ in range(5):
+                deliveries += len(await handler.handle_messages(max_wait_time=0.01))
+            dead = handler.broker.get_queue("work.dead-letter").get_nowait()
+            return deliveries, handler.qsize(), dead
+
+        deliveries, remaining, dead = asyncio.run(run())
+        self.assertEqual(deliveries, 3)
+        self.assertEqual(remaining, 0)
+        self.assertEqual(dead["deliveryCount"], 3)
+        self.assertEqual(dead["headers"][ERROR_HEADER], "MockedFail")
+
+    def test_handle_empty_queue(self):
+        handler = VoltronMemoryQueue("work")
+        results = asyncio.run(handler.handle_messages(max_wait_time=0.01))
+        self.assertEqual(results, [])
+
+    def test_send_messages(self):
+        async def run():
+            handler = VoltronMemoryQueue("work")
+            resp = await handler.send_messages([self.sample_voltron_payload] * 4)
+            return resp, handler.qsize()
+
+        resp, size = asyncio.run(run())
+        self.assertTrue(resp["success"])
+        self.assertEqual(size, 4)
+
+
+class TestVoltronMultiprocessQueue(unittest.TestCase):
+    def test_cross_process(self):
+        context = multiprocessing.get_context()
+        broker = VoltronMultiprocessBroker(["work"], context)
+        self.assertIn("work.dead-letter", broker.queues)
+        results = context.Queue()
+        worker = context.Process(target=consume_one, args=(broker, results))
+        worker.start()
+        sender = VoltronMultiprocessQueue("work", broker)
+        payload = {
+            "handlerName": "fromparent",
+            "handlerConfig": {},
+            "handlerData": {},
+            "messageSource": "test_voltron_memory.py",
+            "startTime": 12345,
+        }
+        asyncio.run(sender.send_message(payload))
+        self.assertEqual(results.get(timeout=10), "fromparent")
+        worker.join(timeout=10)
@@ -0,0 +1,63 @@
+import unittest
+
+from src.voltronsecurity.voltron_normalize import (
+    chunk_payloads,
+    normalize_chunk,
+    normalize_pages,
+    normalize_payloads,
+)
+from src.voltronsecurity.voltron_wiz import VoltronWizFinding
+
+
+def sample_wiz_issue(issue_id):
+    return {
+        "id": issue_id,
+        "control": {"name": "Public bucket"},
+        "createdAt": "2023-07-08T13:08:04.123456Z",
+        "severity": "HIGH",
+        "entitySnapshot": {"type": "BUCKET", "externalId": "bucket-{}".format(issue_id)},
+    }
+
+
+class TestChunkPayloads(unittest.TestCase):
+    def test_chunks(self):
+        chunks = list(chunk_payloads(range(5), 2))
+        self.assertEqual(chunks, [[0, 1], [2, 3], [4]])
+
+    def test_invalid_chunk_size(self):
+        with self.assertRaises(ValueError):
+            list(chunk_payloads([1], 0))
+
+
+class TestNormalizePayloads(unittest.TestCase):
+    def setUp(self):
+        self.payloads = [sample_wiz_issue("issue-{}".format(x)) for x in range(7)]
+
+    def test_normalize_chunk(self):
+        rows = normalize_chunk(VoltronWizFinding, self.payloads[:2])
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(len(rows[0]), 11)
+        self.assertEqual(rows[0][3], "issue-0")
+
+    def test_normalize_in_process(self):
+        rows = list(
+            normalize_payloads(
+                VoltronWizFinding, iter(self.payloads), chunk_size=3, max_workers=0
+            )
+        )
+        self.assertEqual([x[3] for x in rows], [x["id"] for x in self.payloads])
+
+    def test_normalize_process_pool(self):
+        rows = list(
+            normalize_payloads(
+                VoltronWizFinding, iter(self.payloads), chunk_size=2, max_workers=2
+            )
+        )
+        self.assertEqual([x[3] for x in rows], [x["id"] for x in self.payloads])
+
+    def test_normalize_pages(self):
+        pages = [self.payloads[:4], self.payloads[4:]]
+        rows = list(
+            normalize_pages(VoltronWizFinding, pages, chunk_size=3, max_workers=0)
+        )
+        self.assertEqual(len(rows), len(self.payloads))
@@ -0,0 +1,148 @@
+import unittest
+from unittest.mock import MagicMock
+
+from src.voltronsecurity.voltron_pagination import VoltronPageSizer, set_query_param
+from src.voltronsecurity.voltron_snyk import SnykCodeCollector
+from src.voltronsecurity.voltron_wiz import WizBaseApi
+
+
+def response(status_code, data=None, next_url=None):
+    resp = MagicMock()
+    resp.status_code = status_code
+    resp.content = b"x" * 10
+    resp.json.return_value = {"data": data or [], "links": {"next": next_url}}
+    return resp
+
+
+class TestVoltronPageSizer(unittest.TestCase):
+    def test_invalid_bounds(self):
+        with self.assertRaises(ValueError):
+            VoltronPageSizer(500, 10, 100)
+
+    def test_error_halves(self):
+        sizer = VoltronPageSizer(100, 10, 100)
+        self.assertEqual(sizer.record(1, error=True), 50)
+        self.assertEqual(sizer.record(1, error=True), 25)
+        self.assertEqual(sizer.record(1, error=True), 12)
+        self.assertEqual(sizer.record(1, error=True), 10)
+
+    def test_step_keeps_sizes_valid(self):
+        with self.assertRaises(ValueError):
+            VoltronPageSizer(100, 15, 100, step=10)
+        sizer = SnykCodeCollector("abc123", [], {}).default_page_sizers()["issues"]
+        sizes = [
+            sizer.record(1, error=True),
+            sizer.record(1, error=True),
+            sizer.record(1, error=True),
+            sizer.record(0.1),
+            sizer.record(8),
+        ]
+        self.assertEqual(sizes, [50, 20, 10, 10, 10])
+        sizer = VoltronPageSizer(100, 10, 100, target_latency=2, step=10)
+        for latency, error in [(3, False), (1, True), (0.1, False), (0.7, False), (2.9, False)]:
+            size = sizer.record(latency, error=error)
+            self.assertEqual(size % 10, 0)
+            self.assertTrue(10 <= size <= 100)
+
+    def test_slow_pages_shrink(self):
+        sizer = VoltronPageSizer(100, 10, 100, target_latency=2)
+        self.assertEqual(sizer.record(3), 66)
+
+    def test_large_pages_shrink(self):
+        sizer = VoltronPageSizer(100, 10, 100, max_bytes=1000)
+        self.assertEqual(sizer.record(0.1, nbytes=1500), 66)
+
+    def test_fast_pages_grow(self):
+        sizer = VoltronPageSizer(20, 10, 100, target_latency=2)
+        self.assertEqual(sizer.record(0.1), 30)
+        self.assertEqual(sizer.record(0.1), 45)
+
+    def test_no_growth_after_errors(self):
+        sizer = VoltronPageSizer(20, 10, 100, target_latency=2)
+        sizer.record(0.1, error=True)
+        self.assertEqual(sizer.record(0.1), 10)
+
+    def test_report(self):
+        sizer = VoltronPageSizer(100, 10, 100, target_latency=2)
+        sizer.record(1, nbytes=100)
+        sizer.record(1, error=True)
+        report = sizer.report()
+        self.assertEqual(report["pages"], 1)
+        self.assertEqual(report["errors"], 1)
+        self.assertEqual(report["pageSize"], 50)
+        self.assertEqual(report["sizesUsed"], {100: 1})
+
+
+class TestSetQueryParam(unittest.TestCase):
+    def test_replace(self):
+        url = set_query_param("/orgs/1/issues?version=beta&limit=100&starting_after=abc", "limit", 50)
+        self.assertEqual(url, "/orgs/1/issues?version=beta&starting_after=abc&limit=50")
+
+
+class TestAdaptivePaginators(unittest.TestCase):
+    def test_wiz_sets_first(self):
+        api = WizBaseApi()
+        client = MagicMock()
+        # Compressed size; must not be mistaken for the page size
+        client.transport.response_headers = {"Content-Length": "12"}
+        firsts = []
+
+        def execute(query, variable_values):
+            firsts.append(variable_values["first"])
+            has_next = len(firsts) < 2
+            nodes = [{"id": "x" * 1200}]
+            return {"issues": {"nodes": nodes, "pageInfo": {"hasNextPage": has_next, "endCursor": "c"}}}
+
+        client.execute.side_effect = execute
+        sizer = VoltronPageSizer(200, 10, 500, target_latency=100)
+        api.run_query(client, "query", "issues", {"first": 500}, page_sizer=sizer)
+        self.assertEqual(firsts, [200, 300])
+        self.assertGreater(sizer.report()["avgBytes"], 1200)
+
+    def test_snyk_retries_gateway_errors_with_smaller_page(self):
+        collector = SnykCodeCollector("abc123", [], {})
+        session = MagicMock()
+        session.get.side_effect = [
+            response(200, [1], "/orgs/1/issues?limit=100&starting_after=a"),
+            response(502),
+            response(200, [2]),
+        ]
+        sizer = VoltronPageSizer(100, 10, 100, target_latency=100)
+        pages = list(
+            collector._paginated_get_request(
+                session, "https://api.snyk.io/rest", "/orgs/1/issues", {"limit": 100}, page_sizer=sizer
+            )
+        )
+        self.assertEqual(len(pages), 2)
+        self.assertIn("limit=50", session.get.call_args_list[2].args[0])
+        self.assertEqual(sizer.report()["errors"], 1)
+
+
+class TestPaginatorFailures(unittest.TestCase):
+    def test_wiz_raises_instead_of_truncating(self):
+        api = WizBaseApi()
+        client = MagicMock()
+        first = {"issues": {"nodes": [1], "pageInfo": {"hasNextPage": True, "endCursor": "c"}}}
+        client.execute.side_effect = [first, Exception("401: Unauthorized")]
+        with self.assertRaises(Exception):
+            api.run_query(client, "query", "issues", {"first": 500})
+
+        client.execute.side_effect = [first] + [Exception("502: Bad Gateway")] * 4
+        with self.assertRaises(Exception):
+            api.run_query(client, "query", "issues", {"first": 500})
+        self.assertEqual(client.execute.call_count, 2 + 1 + api.page_retries + 1)
+
+    def test_snyk_raises_on_failed_pages(self):
+        collector = SnykCodeCollector("abc123", [], {})
+        session = MagicMock()
+        failed = response(500)
+        failed.raise_for_status.side_effect = Exception("500 Server Error")
+        session.get.side_effect = [failed]
+        with self.assertRaises(Exception):
+            list(collector._paginated_get_request(session, "https://api.snyk.io/rest", "/orgs/1/issues", {}))
+
+        session.get.side_effect = [response(200, [1], "/orgs/1/issues?starting_after=a"), failed]
+        pages = collector._paginated_get_request(session, "https://api.snyk.io/rest", "/orgs/1/issues", {})
+        next(pages)
+        with self.assertRaises(Exception):
+            next(pages)
@@ -0,0 +1,233 @@
+import asyncio
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from src.voltronsecurity.voltron_base import VoltronBaseMessageInterface
+from src.voltronsecurity.voltron_dispatch import VoltronDispatcher, VoltronHandlerRegistry
+from src.voltronsecurity.voltron_pipeline import (
+    RUN_ID_KEY,
+    SnykOrgsStage,
+    VoltronPersistStage,
+    VoltronPipelineStage,
+    VoltronRunTracker,
+    WizFindingsStage,
+    start_run,
+)
+from src.voltronsecurity.voltron_postgres import VoltronDB
+from src.voltronsecurity.voltron_severity import VoltronSeverityEngine
+from src.voltronsecurity.voltron_wiz import VoltronWizFinding
+
+
+class ListQueue(VoltronBaseMessageInterface):
+    def __init__(self, fail=False):
+        self.sent = []
+        self.fail = fail
+
+    async def send_message(self, message):
+        if self.fail:
+            return {"success": False, "message": "TestSendFailure"}
+        self.sent.append(message)
+        return {"success": True, "message": "Sent message."}
+
+
+def sample_wiz_issue(issue_id):
+    return {
+        "id": issue_id,
+        "control": {"name": "Public bucket"},
+        "createdAt": "2023-07-08T13:08:04.123456Z",
+        "severity": "HIGH",
+        "entitySnapshot": {"type": "BUCKET", "externalId": "bucket"},
+    }
+
+
+class TestVoltronRunTracker(unittest.TestCase):
+    def test_completes_once(self):
+        on_complete = MagicMock()
+        tracker = VoltronRunTracker(on_complete)
+        tracker.start_run("run1")
+        self.assertEqual(tracker.add_children("run1", 2), 3)
+        self.assertFalse(tracker.complete_child("run1"))
+        self.assertFalse(tracker.complete_child("run1"))
+        self.assertTrue(tracker.complete_child("run1"))
+        self.assertFalse(tracker.complete_child("run1"))
+        self.assertTrue(tracker.is_complete("run1"))
+        on_complete.assert_called_once_with("run1")
+
+
+class TestVoltronPipeline(unittest.TestCase):
+    def setUp(self):
+        self.on_complete = MagicMock()
+        self.tracker = VoltronRunTracker(self.on_complete)
+
+    def test_full_run(self):
+        trigger_queue = ListQueue()
+        projects_queue = ListQueue()
+        findings_queue = ListQueue()
+
+        run_id = asyncio.run(
+            start_run(self.tracker, trigger_queue, "inventory-wiz-tenant")
+        )
+        trigger = trigger_queue.sent[0]
+        self.assertEqual(trigger["handlerConfig"][RUN_ID_KEY], run_id)
+
+        projects_stage = VoltronPipelineStage(
+            self.tracker, projects_queue, "inventory-wiz-findings"
+        )
+        projects_stage.expand = lambda message: [{"projectId": "p1"}, {"projectId": "p2"}]
+        resp = asyncio.run(projects_stage.process(trigger))
+        self.assertTrue(resp["success"])
+        self.assertEqual(len(projects_queue.sent), 2)
+        self.assertEqual(self.tracker.outstanding(run_id), 2)
+
+        collector = MagicMock()
+        collector.get_all_issues.return_value = [
+            sample_wiz_issue("a"),
+            sample_wiz_issue("b"),
+            sample_wiz_issue("c"),
+        ]
+        findings_stage = WizFindingsStage(
+            collector, self.tracker, findings_queue, batch_size=2
+        )
+        for message in projects_queue.sent:
+            asyncio.run(findings_stage.process(message))
+        self.assertEqual(len(findings_queue.sent), 4)
+        self.assertEqual(findings_queue.sent[0]["handlerName"], "persist-wiz-findings")
+
+        db = MagicMock()
+        persist_stage = VoltronPersistStage(
+            VoltronWizFinding, db, "VOLTRON_FINDINGS", self.tracker
+        )
+        for message in findings_queue.sent:
+            resp = asyncio.run(persist_stage.process(message))
+        self.assertTrue(resp["data"]["runComplete"])
+        self.assertEqual(db.write_to_table.call_count, 4)
+        self.on_complete.assert_called_once_with(run_id)
+
+    def test_failures_are_tracked_until_a_retry_succeeds(self):
+        self.tracker.start_run("run1")
+        collector = MagicMock()
+        collector.get_all_issues.side_effect = [ConnectionError("wiz down"), []]
+        stage = WizFindingsStage(collector, self.tracker, ListQueue())
+        message = {
+            "handlerName": "inventory-wiz-findings",
+            "handlerConfig": {RUN_ID_KEY: "run1"},
+            "handlerData": {"projectId": "p1"},
+            "messageSource": "test",
+            "startTime": 1,
+        }
+        with self.assertRaises(ConnectionError):
+            asyncio.run(stage.process(message))
+        failures = self.tracker.failures("run1")
+        self.assertEqual(len(failures), 1)
+        self.assertEqual(failures[0]["stage"], "WizFindingsStage")
+        self.assertIn("wiz down", failures[0]["message"])
+
+        self.assertTrue(asyncio.run(stage.process(dict(message)))["success"])
+        self.assertEqual(self.tracker.failures("run1"), [])
+
+    @patch("src.voltronsecurity.voltron_postgres.psycopg2.connect")
+    def test_dispatcher_failures_block_finish_sync(self, mock_connect):
+        self.tracker.start_run("run1")
+        collector = MagicMock()
+        collector.get_all_issues.side_effect = [ConnectionError("wiz down"), []]
+        registry = VoltronHandlerRegistry()
+        registry.register(
+            "inventory-wiz-findings", WizFindingsStage(collector, self.tracker, ListQueue())
+        )
+        dispatcher = VoltronDispatcher(registry)
+        message = {
+            "handlerName": "inventory-wiz-findings",
+            "handlerConfig": {RUN_ID_KEY: "run1"},
+            "handlerData": {"projectId": "p1"},
+            "messageSource": "test",
+            "startTime": 1,
+        }
+        self.assertFalse(asyncio.run(dispatcher.dispatch(message))["success"])
+        failures = self.tracker.failures("run1")
+        self.assertEqual(len(failures), 1)
+        self.assertIn("wiz down", failures[0]["message"])
+
+        db = VoltronDB("localhost", "user", "password", "5432", "test_db")
+        with self.assertRaises(ValueError):
+            db.finish_sync("run1", "Wiz", failures=failures)
+        mock_connect.return_value.commit.assert_not_called()
+
+        self.assertTrue(asyncio.run(dispatcher.dispatch(dict(message)))["success"])
+        self.assertEqual(self.tracker.failures("run1"), [])
+        dispatcher.close()
+
+    def test_dispatcher_timeout_is_tracked(self):
+        self.tracker.start_run("run1")
+        stage = VoltronPipelineStage(self.tracker)
+        stage.expand = lambda message: time.sleep(0.2) or []
+        registry = VoltronHandlerRegistry()
+        registry.register("slow", stage, timeout=0.01)
+        dispatcher = VoltronDispatcher(registry)
+        message = {
+            "handlerName": "slow",
+            "handlerConfig": {RUN_ID_KEY: "run1"},
+            "handlerData": {},
+            "messageSource": "test",
+            "startTime": 1,
+        }
+        self.assertFalse(asyncio.run(dispatcher.dispatch(message))["success"])
+        failures = self.tracker.failures("run1")
+        self.assertEqual(len(failures), 1)
+        self.assertIn("timed out", failures[0]["message"])
+        dispatcher.close()
+
+    def test_failed_publish_keeps_parent_outstanding(self):
+        self.tracker.start_run("run1")
+        collector = MagicMock()
+        collector.orgs = ["org1", "org2"]
+        stage = SnykOrgsStage(collector, self.tracker, ListQueue(fail=True))
+        message = {
+            "handlerName": "inventory-snyk-orgs",
+            "handlerConfig": {RUN_ID_KEY: "run1"},
+            "handlerData": {},
+            "messageSource": "test",
+            "startTime": 1,
+        }
+        resp = asyncio.run(stage.process(message))
+        self.assertFalse(resp["success"])
+        self.assertEqual(self.tracker.outstanding("run1"), 1)
+        self.assertEqual(len(self.tracker.failures("run1")), 1)
+        self.on_complete.assert_not_called()
+
+    def test_persist_applies_severity_rules(self):
+        self.tracker.start_run("run1")
+        engine = VoltronSeverityEngine(
+            [{"name": "buckets", "when": {"resourceType": "BUCKET"}, "severity": "CRITICAL"}]
+        )
+        db = MagicMock()
+        stage = VoltronPersistStage(
+            VoltronWizFinding, db, "VOLTRON_FINDINGS", self.tracker, severity_engine=engine
+        )
+        message = {
+            "handlerName": "persist-wiz-findings",
+            "handlerConfig": {RUN_ID_KEY: "run1"},
+            "handlerData": {"findings": [sample_wiz_issue("issue1")]},
+            "messageSource": "test",
+            "startTime": 1,
+        }
+        asyncio.run(stage.process(message))
+        rows = db.write_to_table.call_args[0][1]
+        self.assertEqual(rows[0][7:9], ("HIGH", "CRITICAL"))
+
+    def test_persist_stages_ids_for_sync(self):
+        self.tracker.start_run("run1")
+        db = MagicMock()
+        stage = VoltronPersistStage(
+            VoltronWizFinding, db, "VOLTRON_FINDINGS", self.tracker, sync=True
+        )
+        message = {
+            "handlerName": "persist-wiz-findings",
+            "handlerConfig": {RUN_ID_KEY: "run1"},
+            "handlerData": {"findings": [sample_wiz_issue("a"), sample_wiz_issue("b")]},
+            "messageSource": "test",
+            "startTime": 1,
+        }
+        asyncio.run(stage.process(message))
+        db.stage_run_findings.assert_called_once_with("run1", ["a", "b"])
+        db.write_to_table.assert_called_once()
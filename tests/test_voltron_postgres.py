@@ -1,7 +1,14 @@
+import json
 import unittest
 from unittest.mock import patch, MagicMock
 import psycopg2
-from src.voltronsecurity.voltron_postgres import VoltronPostgres, VoltronDB
+from src.voltronsecurity.voltron_postgres import (
+    VoltronPostgres,
+    VoltronDB,
+    VoltronPostgresRunTracker,
+    VoltronStoredFinding,
+    finding_filters,
+)
 
 
 class TestVoltronPostgres(unittest.TestCase):
@@ -78,6 +85,39 @@ class TestVoltronPostgres(unittest.TestCase):
 
         # Assert that the connect and cursor methods were called
 
+    @patch("src.voltronsecurity.voltron_postgres.psycopg2.extras.execute_values")
+    @patch("src.voltronsecurity.voltron_postgres.psycopg2.connect")
+    def test_write_batch(self, mock_connect, mock_execute_values):
+        voltron = VoltronPostgres(
+            host="localhost",
+            user="user",
+            password="password",
+            port="5432",
+            db="test_db",
+        )
+        rows = [(1, "A"), (2, "B")]
+        voltron.write_batch("test_table", rows, page_size=500)
+        statement = mock_execute_values.call_args.args[1]
+        self.assertEqual(statement, "INSERT INTO test_table VALUES %s ON CONFLICT DO NOTHING")
+        self.assertEqual(mock_execute_values.call_args.kwargs["page_size"], 500)
+        mock_connect.return_value.commit.assert_called_once()
+
+    @patch("src.voltronsecurity.voltron_postgres.psycopg2.extras.execute_values")
+    @patch("src.voltronsecurity.voltron_postgres.psycopg2.connect")
+    def test_write_batch_rollback(self, mock_connect, mock_execute_values):
+        voltron = VoltronPostgres(
+            host="localhost",
+            user="user",
+            password="password",
+            port="5432",
+            db="test_db",
+        )
+        mock_execute_values.side_effect = psycopg2.Error("TestWriteFailure")
+        with self.assertRaises(psycopg2.Error):
+            voltron.write_batch("test_table", [(1, "A")])
+        mock_connect.return_value.rollback.assert_called_once()
+        mock_connect.return_value.commit.assert_not_called()
+
 
 class TestVoltronDB(unittest.TestCase):
     @patch("src.voltronsecurity.voltron_postgres.psycopg2.connect")
@@ -102,6 +142,388 @@ class TestVoltronDB(unittest.TestCase):
 
         # Assert that the connect and cursor methods were called
 
+    @patch("src.voltronsecurity.voltron_postgres.VoltronPostgres.write_batch")
+    @patch("src.voltronsecurity.voltron_postgres.psycopg2.connect")
+    def test_write_findings_compact_dedupes_blobs(self, mock_connect, mock_write_batch):
+        voltron = VoltronDB(
+            host="localhost",
+            user="user",
+            password="password",
+            port="5432",
+            db="test_db",
+        )
+        snapshot = {"name": "vm-1", "tags": ["a"] * 10}
+        rows = [
+            ("wiz", "VM", "vm-1", "id-1", "s", json.dumps({"snapshot": snapshot, "n": 1})),
+            ("wiz", "VM", "vm-1", "id-2", "s", json.dumps({"snapshot": snapshot, "n": 2})),
+        ]
+
+        voltron.write_findings_compact(rows, paths=["snapshot"])
+        voltron.write_findings_compact(rows[:1], paths=["snapshot"])
+
+        blob_calls = [x for x in mock_write_batch.call_args_list if x[0][0] == "VOLTRON_BLOBS"]
+        self.assertEqual(len(blob_calls), 1)
+        self.assertEqual(len(blob_calls[0][0][1]), 1)
+        written = mock_write_batch.call_args_list[1][0][1]
+        self.assertIn("$voltronBlob", json.loads(written[0][5])["snapshot"])
+        self.assertTrue(all(x.kwargs["commit"] is False for x in mock_write_batch.call_args_list))
+        self.assertEqual(mock_connect.return_value.commit.call_count, 2)
+
+    @patch("src.voltronsecurity.voltron_postgres.VoltronPostgres.write_batch")
+    @patch("src.voltronsecurity.voltron_postgres.psycopg2.connect")
+    def test_write_findings_compact_rolls_back_blobs(self, mock_connect, mock_write_batch):
+        voltron = VoltronDB(
+            host="localhost",
+            user="user",
+            password="password",
+            port="5432",
+            db="test_db",
+        )
+        mock_write_batch.side_effect = [None, Exception("TestWriteFailure")]
+        snapshot = {"name": "vm-1"}
+        # findingOutput encodes a toolFindingJson that VoltronWizFinding already encoded
+        rows = [("wiz", "VM", "vm-1", "id-1", "s", json.dumps(json.dumps({"snapshot": snapshot})))]
+
+        with self.assertRaises(Exception):
+            voltron.write_findings_compact(rows, paths=["snapshot"])
+
+        self.assertEqual(mock_write_batch.call_args_list[0][0][1][0][1], json.dumps(snapshot))
+        mock_connect.return_value.rollback.assert_called_once()
+        mock_connect.return_value.commit.assert_not_called()
+        # The blob was rolled back, so the next write must send it again
+        self.assertEqual(voltron.known_blobs, set())
+
+    @patch("src.voltronsecurity.voltron_postgres.psycopg2.connect")
+    def test_reassemble_documents(self, mock_connect):
+        voltron = VoltronDB(
+            host="localhost",
+            user="user",
+            password="password",
+            port="5432",
+            db="test_db",
+        )
+        mock_cursor = MagicMock()
+        mock_cursor.fetchall.return_value = [("abc", {"name": "vm-1"})]
+        mock_connect.return_value.cursor.return_value = mock_cursor
+
+        documents = voltron.reassemble_documents([{"snapshot": {"$voltronBlob": "abc"}}])
+
+        self.assertEqual(documents, [{"snapshot": {"name": "vm-1"}}])
+        mock_cursor.execute.assert_called_once()
+
+
+class TestVoltronDBReads(unittest.TestCase):
+    def get_db(self, mock_connect):
+        voltron = VoltronDB(
+            host="localhost",
+            user="user",
+            password="password",
+            port="5432",
+            db="test_db",
+        )
+        mock_cursor = MagicMock()
+        mock_connect.return_value.cursor.return_value = mock_cursor
+        return voltron, mock_cursor
+
+    def get_row(self, finding_id, document=None):
+        return ("wiz", "VM", "vm-1", finding_id, "s", document, "url", "HIGH", "HIGH", None, None)
+
+    def test_finding_filters(self):
+        where, params = finding_filters(tool="wiz", severity=["HIGH", "CRITICAL"], since="2024-01-01")
+        self.assertEqual(
+            where, "toolName = ANY(%s) AND voltronSeverity = ANY(%s) AND findingDate >= %s"
+        )
+        self.assertEqual(params, [["wiz"], ["HIGH", "CRITICAL"], "2024-01-01"])
+        self.assertEqual(finding_filters(), ("TRUE", []))
+        with self.assertRaises(ValueError):
+            finding_filters(date_column="toolName; DROP TABLE x")
+
+    @patch("src.voltronsecurity.voltron_postgres.psycopg2.connect")
+    def test_query_findings_keyset(self, mock_connect):
+        voltron, mock_cursor = self.get_db(mock_connect)
+        mock_cursor.fetchall.return_value = [self.get_row("a"), self.get_row("b")]
+
+        findings, next_key = voltron.query_findings(after="0", page_size=2, tool="wiz")
+
+        statement, params = mock_cursor.execute.call_args[0]
+        self.assertIn("toolFindingId > %s", statement)
+        self.assertIn("ORDER BY toolFindingId LIMIT %s", statement)
+        self.assertEqual(params, [["wiz"], "0", 2])
+        self.assertEqual(next_key, "b")
+        self.assertIsInstance(findings[0], VoltronStoredFinding)
+        self.assertEqual(findings[0].findingOutput()["toolFindingSeverity"], "HIGH")
+
+    @patch("src.voltronsecurity.voltron_postgres.psycopg2.connect")
+    def test_query_findings_reassembles_by_default(self, mock_connect):
+        voltron, mock_cursor = self.get_db(mock_connect)
+        mock_cursor.fetchall.side_effect = [
+            [self.get_row("a", {"snapshot": {"$voltronBlob": "abc"}}), self.get_row("b", "text")],
+            [("abc", {"name": "vm-1"})],
+        ]
+
+        findings, _ = voltron.query_findings(table="VOLTRON_FINDINGS_COMPACT")
+
+        self.assertEqual(findings[0].toolFindingJson, {"snapshot": {"name": "vm-1"}})
+        self.assertEqual(findings[1].toolFindingJson, "text")
+
+    @patch("src.voltronsecurity.voltron_postgres.psycopg2.connect")
+    def test_query_findings_last_page(self, mock_connect):
+        voltron, mock_cursor = self.get_db(mock_connect)
+        mock_cursor.fetchall.return_value = [self.get_row("a")]
+        findings, next_key = voltron.query_findings(page_size=2, include_json=False)
+        self.assertIsNone(next_key)
+        self.assertIn("NULL", mock_cursor.execute.call_args[0][0])
+
+    @patch("src.voltronsecurity.voltron_postgres.psycopg2.connect")
+    def test_iter_findings_named_cursor(self, mock_connect):
+        voltron, mock_cursor = self.get_db(mock_connect)
+        mock_cursor.fetchmany.side_effect = [
+            [self.get_row("a", {"snapshot": {"$voltronBlob": "abc"}})],
+            [],
+        ]
+        mock_cursor.fetchall.return_value = [("abc", {"name": "vm-1"})]
+
+        findings = list(voltron.iter_findings(batch_size=1, severity="HIGH"))
+
+        self.assertEqual(findings[0].toolFindingJson, {"snapshot": {"name": "vm-1"}})
+        self.assertTrue(
+            mock_connect.return_value.cursor.call_args_list[0][1]["name"].startswith("voltron_findings_")
+        )
+        mock_connect.return_value.commit.assert_called_once()
+
+
+class TestVoltronDBSummaries(unittest.TestCase):
+    def get_db(self, mock_connect):
+        voltron = VoltronDB(
+            host="localhost",
+            user="user",
+            password="password",
+            port="5432",
+            db="test_db",
+        )
+        mock_cursor = MagicMock()
+        mock_connect.return_value.cursor.return_value = mock_cursor
+        return voltron, mock_cursor
+
+    @patch("src.voltronsecurity.voltron_postgres.psycopg2.connect")
+    def test_create_summary_tables_statement_triggers(self, mock_connect):
+        voltron, mock_cursor = self.get_db(mock_connect)
+        voltron.create_summary_tables()
+        statements = [x[0][0] for x in mock_cursor.execute.call_args_list]
+        triggers = [x for x in statements if "CREATE TRIGGER" in x]
+        self.assertEqual(len(triggers), 3)
+        for trigger in triggers:
+            self.assertIn("FOR EACH STATEMENT EXECUTE PROCEDURE", trigger)
+        self.assertIn("REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows", triggers[1])
+        self.assertIn("ADD COLUMN IF NOT EXISTS findingStatus", statements[0])
+        function = [x for x in statements if "voltron_summarize_findings()" in x][0]
+        self.assertEqual(function.count("WHERE findingStatus <> 'RESOLVED'"), 4)
+
+    @patch("src.voltronsecurity.voltron_postgres.psycopg2.connect")
+    def test_each_findings_table_has_its_own_summaries(self, mock_connect):
+        voltron, mock_cursor = self.get_db(mock_connect)
+        voltron.create_summary_tables(table="VOLTRON_FINDINGS_COMPACT")
+        statements = "\n".join(x[0][0] for x in mock_cursor.execute.call_args_list)
+        self.assertIn("CREATE TABLE IF NOT EXISTS VOLTRON_FINDINGS_COMPACT_SUMMARY_TOOL", statements)
+        self.assertIn("INSERT INTO VOLTRON_FINDINGS_COMPACT_SUMMARY_RESOURCE AS summary", statements)
+        self.assertIn("EXECUTE PROCEDURE voltron_findings_compact_summarize()", statements)
+        self.assertNotIn("VOLTRON_SUMMARY_TOOL", statements)
+        self.assertNotIn("voltron_summarize_findings", statements)
+
+        mock_cursor.reset_mock()
+        mock_cursor.fetchall.return_value = []
+        voltron.get_summary(by="resource", table="VOLTRON_FINDINGS_COMPACT")
+        self.assertIn(
+            "FROM VOLTRON_FINDINGS_COMPACT_SUMMARY_RESOURCE", mock_cursor.execute.call_args[0][0]
+        )
+
+    @patch("src.voltronsecurity.voltron_postgres.psycopg2.connect")
+    def test_refresh_summaries_rolls_back(self, mock_connect):
+        voltron, mock_cursor = self.get_db(mock_connect)
+        mock_cursor.execute.side_effect = [None, None, psycopg2.Error("boom")]
+        with self.assertRaises(psycopg2.Error):
+            voltron.refresh_summaries()
+        mock_connect.return_value.rollback.assert_called_once()
+        mock_connect.return_value.commit.assert_not_called()
+
+    @patch("src.voltronsecurity.voltron_postgres.psycopg2.connect")
+    def test_get_summary(self, mock_connect):
+        voltron, mock_cursor = self.get_db(mock_connect)
+        mock_cursor.fetchall.return_value = [("wiz", "HIGH", 4)]
+        self.assertEqual(
+            voltron.get_summary(),
+            [{"toolName": "wiz", "voltronSeverity": "HIGH", "findingCount": 4}],
+        )
+        with self.assertRaises(ValueError):
+            voltron.get_summary(by="project")
+
+
+class TestVoltronDBSync(unittest.TestCase):
+    def get_db(self, mock_connect):
+        voltron = VoltronDB(
+            host="localhost",
+            user="user",
+            password="password",
+            port="5432",
+            db="test_db",
+        )
+        mock_cursor = MagicMock()
+        mock_connect.return_value.cursor.return_value = mock_cursor
+        return voltron, mock_cursor
+
+    @patch("src.voltronsecurity.voltron_postgres.psycopg2.connect")
+    def test_create_sync_tables(self, mock_connect):
+        voltron, mock_cursor = self.get_db(mock_connect)
+        voltron.create_sync_tables()
+        statements = [x[0][0] for x in mock_cursor.execute.call_args_list]
+        self.assertIn("ADD COLUMN IF NOT EXISTS findingStatus TEXT NOT NULL DEFAULT 'OPEN'", statements[0])
+        self.assertIn("voltron_findings_status", statements[1])
+        self.assertIn("ADD COLUMN IF NOT EXISTS syncScope TEXT", statements[0])
+        self.assertIn("VOLTRON_RUN_FINDINGS", statements[2])
+        self.assertIn("VOLTRON_RUN_FAILURES", statements[3])
+
+    @patch("src.voltronsecurity.voltron_postgres.VoltronPostgres.write_batch")
+    @patch("src.voltronsecurity.voltron_postgres.psycopg2.connect")
+    def test_stage_run_findings(self, mock_connect, mock_write_batch):
+        voltron, _ = self.get_db(mock_connect)
+        voltron.stage_run_findings("run1", ["b", "a", "b"])
+        args, kwargs = mock_write_batch.call_args
+        self.assertEqual(args[:2], ("VOLTRON_RUN_FINDINGS", [("run1", "a"), ("run1", "b")]))
+        self.assertEqual(kwargs["onConflict"], "(runId, toolFindingId) DO NOTHING")
+
+    @patch("src.voltronsecurity.voltron_postgres.psycopg2.connect")
+    def test_finish_sync(self, mock_connect):
+        voltron, mock_cursor = self.get_db(mock_connect)
+        mock_cursor.fetchall.return_value = []
+        mock_cursor.fetchone.side_effect = [(6,), (2, 1, 3)]
+        mock_cursor.rowcount = 4
+
+        counts = voltron.finish_sync("run1", "Wiz", resource_type="BUCKET")
+
+        self.assertEqual(
+            counts,
+            {"runId": "run1", "staged": 6, "new": 2, "stillOpen": 3, "reopened": 1, "resolved": 4},
+        )
+        calls = mock_cursor.execute.call_args_list
+        self.assertIn("VOLTRON_RUN_FAILURES", calls[0][0][0])
+        seen, seen_params = calls[2][0]
+        self.assertIn("toolName = ANY(%s) AND resourceType = ANY(%s)", seen)
+        self.assertEqual(seen_params, [["Wiz"], ["BUCKET"], "run1", "run1", None])
+        resolve, resolve_params = calls[3][0]
+        self.assertIn("NOT EXISTS", resolve)
+        self.assertIn("staged.toolFindingId = VOLTRON_FINDINGS.toolFindingId", resolve)
+        self.assertEqual(resolve_params, [["Wiz"], ["BUCKET"], "run1"])
+        self.assertIn("DELETE FROM VOLTRON_RUN_FINDINGS", calls[4][0][0])
+        mock_connect.return_value.commit.assert_called_once()
+
+    @patch("src.voltronsecurity.voltron_postgres.psycopg2.connect")
+    def test_finish_sync_resolves_only_its_scope(self, mock_connect):
+        voltron, mock_cursor = self.get_db(mock_connect)
+        mock_cursor.fetchone.side_effect = [(6,), (2, 1, 3)]
+        mock_cursor.rowcount = 0
+
+        voltron.finish_sync("run1", "Snyk", scope="org-1", failures=[])
+
+        calls = mock_cursor.execute.call_args_list
+        # Everything the run saw is stamped with its scope...
+        seen, seen_params = calls[1][0]
+        self.assertIn("syncScope = COALESCE(%s, VOLTRON_FINDINGS.syncScope)", seen)
+        self.assertNotIn("syncScope = ANY", seen)
+        self.assertEqual(seen_params, [["Snyk"], "run1", "run1", "org-1"])
+        # ...and only findings from that scope can be resolved
+        resolve, resolve_params = calls[2][0]
+        self.assertIn("toolName = ANY(%s) AND syncScope = ANY(%s)", resolve)
+        self.assertEqual(resolve_params, [["Snyk"], ["org-1"], "run1"])
+
+    @patch("src.voltronsecurity.voltron_postgres.psycopg2.connect")
+    def test_finish_sync_refuses_failed_run(self, mock_connect):
+        voltron, mock_cursor = self.get_db(mock_connect)
+        mock_cursor.fetchall.return_value = [("WizFindingsStage", "HTTPError: 500")]
+        with self.assertRaises(ValueError) as raised:
+            voltron.finish_sync("run1", "Wiz")
+        self.assertIn("WizFindingsStage", str(raised.exception))
+        self.assertEqual(mock_cursor.execute.call_count, 1)
+        mock_connect.return_value.rollback.assert_called_once()
+        mock_connect.return_value.commit.assert_not_called()
+
+        mock_cursor.reset_mock()
+        mock_cursor.fetchone.side_effect = [(6,), (2, 1, 3)]
+        voltron.finish_sync("run1", "Wiz", allow_failures=True)
+        mock_connect.return_value.commit.assert_called_once()
+
+    @patch("src.voltronsecurity.voltron_postgres.psycopg2.connect")
+    def test_finish_sync_refuses_empty_run(self, mock_connect):
+        voltron, mock_cursor = self.get_db(mock_connect)
+        mock_cursor.fetchall.return_value = []
+        mock_cursor.fetchone.return_value = (0,)
+        with self.assertRaises(ValueError):
+            voltron.finish_sync("run1", "Wiz")
+        self.assertEqual(mock_cursor.execute.call_count, 2)
+        mock_connect.return_value.rollback.assert_called_once()
+        mock_connect.return_value.commit.assert_not_called()
+
+    def test_status_filter(self):
+        where, params = finding_filters(tool="Wiz", status="OPEN")
+        self.assertEqual(where, "toolName = ANY(%s) AND findingStatus = ANY(%s)")
+        self.assertEqual(params, [["Wiz"], ["OPEN"]])
+        where, params = finding_filters(scope=["org-1", "org-2"])
+        self.assertEqual(where, "syncScope = ANY(%s)")
+        self.assertEqual(params, [["org-1", "org-2"]])
+
+
+class TestVoltronPostgresRunTracker(unittest.TestCase):
+    def get_tracker(self, mock_connect, on_complete=None):
+        tracker = VoltronPostgresRunTracker(
+            host="localhost",
+            user="user",
+            password="password",
+            port="5432",
+            db="test_db",
+            on_complete=on_complete,
+        )
+        mock_cursor = MagicMock()
+        mock_connect.return_value.cursor.return_value = mock_cursor
+        return tracker, mock_cursor
+
+    @patch("src.voltronsecurity.voltron_postgres.psycopg2.connect")
+    def test_add_children(self, mock_connect):
+        tracker, mock_cursor = self.get_tracker(mock_connect)
+        mock_cursor.fetchone.return_value = (3,)
+        self.assertEqual(tracker.add_children("run1", 2), 3)
+        mock_cursor.execute.assert_called_once()
+        mock_connect.return_value.commit.assert_called()
+
+    @patch("src.voltronsecurity.voltron_postgres.psycopg2.connect")
+    def test_complete_child_finishes_run(self, mock_connect):
+        on_complete = MagicMock()
+        tracker, mock_cursor = self.get_tracker(mock_connect, on_complete)
+        mock_cursor.fetchone.return_value = (0,)
+        self.assertTrue(tracker.complete_child("run1"))
+        on_complete.assert_called_once_with("run1")
+
+    @patch("src.voltronsecurity.voltron_postgres.psycopg2.connect")
+    def test_complete_child_already_finished(self, mock_connect):
+        on_complete = MagicMock()
+        tracker, mock_cursor = self.get_tracker(mock_connect, on_complete)
+        mock_cursor.fetchone.return_value = None
+        self.assertFalse(tracker.complete_child("run1"))
+        on_complete.assert_not_called()
+
+    @patch("src.voltronsecurity.voltron_postgres.psycopg2.connect")
+    def test_failures(self, mock_connect):
+        tracker, mock_cursor = self.get_tracker(mock_connect)
+        tracker.record_failure("run1", "key1", "WizFindingsStage", "HTTPError: 500")
+        statement, params = mock_cursor.execute.call_args[0]
+        self.assertIn("ON CONFLICT (run_id, failureKey) DO UPDATE", statement)
+        self.assertEqual(params, ("run1", "key1", "WizFindingsStage", "HTTPError: 500"))
+        tracker.clear_failure("run1", "key1")
+        self.assertIn("DELETE FROM VOLTRON_RUN_FAILURES", mock_cursor.execute.call_args[0][0])
+        mock_cursor.fetchall.return_value = [("key2", "SnykProjectsStage", "timeout")]
+        self.assertEqual(
+            tracker.failures("run1"),
+            [{"key": "key2", "stage": "SnykProjectsStage", "message": "timeout"}],
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
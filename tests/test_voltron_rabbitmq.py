@@ -0,0 +1,240 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+import pika
+
+from src.voltronsecurity.voltron_rabbitmq import (
+    VoltronAsyncRabbitMQQueue,
+    VoltronRabbitMQQueue,
+)
+from src.voltronsecurity.voltron_retry import ATTEMPT_HEADER, ERROR_HEADER, VoltronRetryPolicy
+
+
+class FailingRabbitMQQueue(VoltronRabbitMQQueue):
+    def process_message(self, ch, method, properties, body):
+        return {"success": False, "message": "MockedFail", "data": {}}
+
+
+class SelfAckingRabbitMQQueue(VoltronRabbitMQQueue):
+    def process_message(self, ch, method, properties, body):
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+
+
+class TestVoltronRabbitMQRetry(unittest.TestCase):
+    def setUp(self):
+        self.policy = VoltronRetryPolicy(max_attempts=3, base_delay=1, multiplier=2)
+        self.channel = MagicMock()
+        self.method = MagicMock()
+        self.method.delivery_tag = 7
+
+    def test_declare_retry_queues(self):
+        handler = VoltronRabbitMQQueue("work", "localhost", {}, self.policy)
+        handler.declare_retry_queues(self.channel)
+        declared = [x.kwargs["queue"] for x in self.channel.queue_declare.call_args_list]
+        self.assertEqual(declared, ["work.retry.1000ms", "work.retry.2000ms", "work.dead-letter"])
+        args = self.channel.queue_declare.call_args_list[0].kwargs["arguments"]
+        self.assertEqual(args["x-message-ttl"], 1000)
+        self.assertEqual(args["x-dead-letter-routing-key"], "work")
+
+    def test_success_acks(self):
+        handler = VoltronRabbitMQQueue("work", "localhost", {}, self.policy)
+        handler._process_with_retry(
+            self.channel, self.method, pika.BasicProperties(), b"{}", queue="work"
+        )
+        self.channel.basic_ack.assert_called_once_with(delivery_tag=7)
+        self.channel.basic_publish.assert_not_called()
+
+    def test_failure_goes_to_retry_queue(self):
+        handler = FailingRabbitMQQueue("work", "localhost", {}, self.policy)
+        handler._process_with_retry(
+            self.channel, self.method, pika.BasicProperties(), b"{}", queue="work"
+        )
+        publish = self.channel.basic_publish.call_args.kwargs
+        self.assertEqual(publish["routing_key"], "work.retry.1000ms")
+        self.assertEqual(publish["properties"].headers[ATTEMPT_HEADER], 2)
+        self.channel.basic_ack.assert_called_once_with(delivery_tag=7)
+
+    def test_retry_keeps_message_properties(self):
+        handler = FailingRabbitMQQueue("work", "localhost", {}, self.policy)
+        properties = pika.BasicProperties(
+            headers={"tenant": "acme"},
+            delivery_mode=2,
+            correlation_id="corr",
+            message_id="msg1",
+            priority=5,
+            app_id="voltron",
+            content_type="application/json",
+        )
+        handler._process_with_retry(
+            self.channel, self.method, properties, b"{}", queue="work"
+        )
+        republished = self.channel.basic_publish.call_args.kwargs["properties"]
+        self.assertEqual(republished.delivery_mode, 2)
+        self.assertEqual(republished.correlation_id, "corr")
+        self.assertEqual(republished.message_id, "msg1")
+        self.assertEqual(republished.priority, 5)
+        self.assertEqual(republished.app_id, "voltron")
+        self.assertEqual(republished.headers, {"tenant": "acme", ATTEMPT_HEADER: 2})
+        # The received properties are left alone
+        self.assertEqual(properties.headers, {"tenant": "acme"})
+
+    def test_last_attempt_goes_to_dead_letter(self):
+        handler = FailingRabbitMQQueue("work", "localhost", {}, self.policy)
+        properties = pika.BasicProperties(headers={ATTEMPT_HEADER: 3})
+        handler._process_with_retry(
+            self.channel, self.method, properties, b"{}", queue="work"
+        )
+        publish = self.channel.basic_publish.call_args.kwargs
+        self.assertEqual(publish["routing_key"], "work.dead-letter")
+        self.assertEqual(publish["properties"].headers[ERROR_HEADER], "MockedFail")
+        self.channel.basic_ack.assert_called_once_with(delivery_tag=7)
+
+
+    def test_missing_response_is_rejected(self):
+        handler = SelfAckingRabbitMQQueue("work", "localhost", {}, self.policy)
+        with self.assertRaises(TypeError):
+            handler._process_with_retry(
+                self.channel, self.method, pika.BasicProperties(), b"{}", queue="work"
+            )
+        # Only the handler's own ack; nothing republished or acked twice
+        self.channel.basic_ack.assert_called_once_with(delivery_tag=7)
+        self.channel.basic_publish.assert_not_called()
+
+
+class FakeIncoming:
+    def __init__(self, body, headers=None):
+        self.body = body
+        self.headers = headers
+        self.content_type = "application/json"
+        self.delivery_mode = 2
+        self.correlation_id = "corr"
+        self.ack = AsyncMock()
+        self.reject = AsyncMock()
+
+
+class FakeQueueIterator:
+    def __init__(self, messages):
+        self.messages = list(messages)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return None
+
+    async def __anext__(self):
+        if not self.messages:
+            raise StopAsyncIteration
+        return self.messages.pop(0)
+
+
+class FailingAsyncRabbitMQQueue(VoltronAsyncRabbitMQQueue):
+    async def process_message(self, message):
+        return {"success": False, "message": "MockedFail", "data": {}}
+
+
+class TestVoltronAsyncRabbitMQQueue(unittest.TestCase):
+    def setUp(self):
+        self.sample_voltron_payload = {
+            "handlerName": "samplehandler",
+            "handlerConfig": {},
+            "handlerData": {},
+            "messageSource": "test_voltron_rabbitmq.py",
+            "startTime": 12345,
+        }
+        self.client = MagicMock()
+        self.channel = MagicMock()
+        self.channel.set_qos = AsyncMock()
+        self.channel.close = AsyncMock()
+        self.channel.default_exchange.publish = AsyncMock()
+        self.work_queue = MagicMock()
+        self.channel.declare_queue = AsyncMock(return_value=self.work_queue)
+        self.client.channel = AsyncMock(return_value=self.channel)
+
+    def set_incoming(self, messages):
+        self.work_queue.iterator.return_value = FakeQueueIterator(messages)
+
+    def test_get_url(self):
+        handler = VoltronAsyncRabbitMQQueue("work", "localhost", {"username": "u", "password": "p"})
+        self.assertEqual(handler.get_url(), "amqp://u:p@localhost/")
+        self.assertEqual(handler.get_url("amqp://other/"), "amqp://other/")
+
+    def test_handle_messages_acks(self):
+        incoming = [FakeIncoming(json.dumps(self.sample_voltron_payload).encode()) for _ in range(3)]
+        self.set_incoming(incoming)
+        handler = VoltronAsyncRabbitMQQueue("work", "localhost", max_concurrency=2)
+        results = asyncio.run(handler.handle_messages(self.client))
+        self.assertEqual(len(results), 3)
+        self.channel.set_qos.assert_called_once_with(prefetch_count=2)
+        for msg in incoming:
+            msg.ack.assert_called_once()
+
+    def test_handle_messages_max_count(self):
+        incoming = [FakeIncoming(json.dumps(self.sample_voltron_payload).encode()) for _ in range(3)]
+        self.set_incoming(incoming)
+        handler = VoltronAsyncRabbitMQQueue("work", "localhost")
+        results = asyncio.run(handler.handle_messages(self.client, max_message_count=1))
+        self.assertEqual(len(results), 1)
+
+    def test_failed_message_without_policy_is_requeued(self):
+        incoming = FakeIncoming(json.dumps(self.sample_voltron_payload).encode())
+        self.set_incoming([incoming])
+        handler = FailingAsyncRabbitMQQueue("work", "localhost")
+        asyncio.run(handler.handle_messages(self.client))
+        incoming.reject.assert_called_once_with(requeue=True)
+
+    def test_failed_message_with_policy_is_delayed(self):
+        incoming = FakeIncoming(json.dumps(self.sample_voltron_payload).encode())
+        self.set_incoming([incoming])
+        handler = FailingAsyncRabbitMQQueue(
+            "work", "localhost", retry_policy=VoltronRetryPolicy(max_attempts=2, base_delay=5)
+        )
+        asyncio.run(handler.handle_messages(self.client))
+        publish = self.channel.default_exchange.publish.call_args
+        self.assertEqual(publish.kwargs["routing_key"], "work.retry.5000ms")
+        self.assertEqual(publish.args[0].headers[ATTEMPT_HEADER], 2)
+        self.assertEqual(publish.args[0].delivery_mode, 2)
+        self.assertEqual(publish.args[0].correlation_id, "corr")
+        incoming.ack.assert_called_once()
+
+    def test_send_messages(self):
+        handler = VoltronAsyncRabbitMQQueue("work", "localhost")
+        resp = asyncio.run(
+            handler.send_messages([self.sample_voltron_payload] * 3, self.client)
+        )
+        self.assertTrue(resp["success"])
+        self.assertEqual(self.channel.default_exchange.publish.call_count, 3)
+        self.client.channel.assert_called_once_with(publisher_confirms=True)
+
+    def test_trace_context_travels_in_headers(self):
+        traceparent = "00-{}-{}-01".format("a" * 32, "b" * 16)
+        handler = VoltronAsyncRabbitMQQueue("work", "localhost")
+        asyncio.run(
+            handler.send_message(
+                dict(self.sample_voltron_payload, traceContext={"traceparent": traceparent}),
+                self.client,
+            )
+        )
+        sent = self.channel.default_exchange.publish.call_args.args[0]
+        self.assertEqual(sent.headers, {"traceparent": traceparent})
+        self.assertNotIn("traceContext", json.loads(sent.body))
+
+        received = []
+
+        class RecordingQueue(VoltronAsyncRabbitMQQueue):
+            async def process_message(self, message):
+                received.append(message)
+                return {"success": True, "message": "ok", "data": {}}
+
+        self.set_incoming([FakeIncoming(sent.body, sent.headers)])
+        asyncio.run(RecordingQueue("work", "localhost").handle_messages(self.client))
+        self.assertEqual(received[0]["traceContext"], {"traceparent": traceparent})
+
+    def test_send_message_failure(self):
+        self.channel.default_exchange.publish.side_effect = Exception("TestSendFailure")
+        handler = VoltronAsyncRabbitMQQueue("work", "localhost")
+        resp = asyncio.run(handler.send_message(self.sample_voltron_payload, self.client))
+        self.assertFalse(resp["success"])
+        self.assertEqual(resp["message"], "TestSendFailure")
@@ -0,0 +1,38 @@
+import threading
+import time
+import unittest
+
+from src.voltronsecurity.voltron_ratelimit import VoltronRateLimiter
+
+
+class TestVoltronRateLimiter(unittest.TestCase):
+    def test_burst_then_rate(self):
+        limiter = VoltronRateLimiter(rate=50, burst=5)
+        start = time.monotonic()
+        for _ in range(10):
+            limiter.acquire()
+        elapsed = time.monotonic() - start
+        # 5 free tokens, then 5 more at 50/s
+        self.assertGreaterEqual(elapsed, 0.09)
+        self.assertLess(elapsed, 0.5)
+
+    def test_shared_between_threads(self):
+        limiter = VoltronRateLimiter(rate=100, burst=1)
+        start = time.monotonic()
+        threads = [
+            threading.Thread(target=lambda: [limiter.acquire() for _ in range(5)])
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertGreaterEqual(time.monotonic() - start, 0.18)
+
+    def test_invalid_rate(self):
+        with self.assertRaises(ValueError):
+            VoltronRateLimiter(0)
+
+
+if __name__ == "__main__":
+    unittest.main()
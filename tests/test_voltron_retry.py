@@ -0,0 +1,33 @@
+import unittest
+
+from src.voltronsecurity.voltron_retry import (
+    ATTEMPT_HEADER,
+    VoltronRetryPolicy,
+    dead_letter_queue_name,
+    get_attempt,
+    retry_queue_name,
+)
+
+
+class TestVoltronRetryPolicy(unittest.TestCase):
+    def test_delays(self):
+        policy = VoltronRetryPolicy(max_attempts=5, base_delay=10, multiplier=3, max_delay=100)
+        self.assertEqual(policy.delays(), [10, 30, 90, 100])
+
+    def test_should_retry(self):
+        policy = VoltronRetryPolicy(max_attempts=3)
+        self.assertTrue(policy.should_retry(2))
+        self.assertFalse(policy.should_retry(3))
+
+    def test_invalid_max_attempts(self):
+        with self.assertRaises(ValueError):
+            VoltronRetryPolicy(max_attempts=0)
+
+    def test_queue_names(self):
+        self.assertEqual(retry_queue_name("work", 1.5), "work.retry.1500ms")
+        self.assertEqual(dead_letter_queue_name("work"), "work.dead-letter")
+
+    def test_get_attempt(self):
+        self.assertEqual(get_attempt(None), 1)
+        self.assertEqual(get_attempt({ATTEMPT_HEADER: 3}), 3)
+        self.assertEqual(get_attempt({ATTEMPT_HEADER.encode(): 2}), 2)
@@ -0,0 +1,127 @@
+import json
+import threading
+import unittest
+
+from src.voltronsecurity.voltron_severity import RULE_KEY, VoltronSeverityEngine
+from src.voltronsecurity.voltron_base import VoltronFinding
+
+
+RULES = [
+    {
+        "name": "rdp-exposed",
+        "when": {"toolName": "NetConns", "toolFindingJson.port": 3389},
+        "upgrade": "high",
+    },
+    {
+        "name": "secrets-in-code",
+        "when": {"toolName": "SnykCode", "toolFindingSummary": {"regex": "(?i)hardcoded"}},
+        "severity": "CRITICAL",
+    },
+    {"name": "quiet-tests", "when": {"resourceId": {"in": ["test-repo"]}}, "severity": "INFO"},
+]
+
+
+def get_finding(tool, severity, summary="", resource="repo", payload=None):
+    return VoltronFinding(
+        {
+            "toolName": tool,
+            "resourceType": "CodeRepo",
+            "resourceId": resource,
+            "toolFindingId": "id",
+            "toolFindingSummary": summary,
+            "toolFindingJson": json.dumps(json.dumps(payload or {})),
+            "toolFindingURL": "",
+            "toolFindingSeverity": severity,
+            "voltronSeverity": severity,
+            "extractDate": "",
+        }
+    )
+
+
+class TestVoltronSeverityEngine(unittest.TestCase):
+    def setUp(self):
+        self.engine = VoltronSeverityEngine(RULES)
+
+    def test_apply_batch(self):
+        findings = [
+            get_finding("NetConns", "low", payload={"port": 3389}),
+            get_finding("NetConns", "critical", payload={"port": 3389}),
+            get_finding("NetConns", "low", payload={"port": 22}),
+            get_finding("SnykCode", "medium", summary="Hardcoded Secret"),
+            get_finding("SnykCode", "high", resource="test-repo"),
+        ]
+        fired = self.engine.apply(findings)
+
+        # The upgrade leaves the critical finding alone, so it doesn't claim it
+        self.assertEqual(fired, ["rdp-exposed", None, None, "secrets-in-code", "quiet-tests"])
+        self.assertEqual(
+            [x.voltronSeverity for x in findings],
+            ["HIGH", "CRITICAL", "LOW", "CRITICAL", "INFORMATIONAL"],
+        )
+        self.assertEqual(findings[0].voltronSeverityRule, "rdp-exposed")
+        self.assertEqual(self.engine.report()["fired"]["rdp-exposed"], 1)
+        document = json.loads(json.loads(findings[0].toolFindingJson))
+        self.assertEqual(document, {"port": 3389, RULE_KEY: "rdp-exposed"})
+        self.assertNotIn(RULE_KEY, json.loads(json.loads(findings[2].toolFindingJson)))
+
+    def test_unmatched_keeps_tool_severity(self):
+        findings = [get_finding("Other", "NotSet"), get_finding("Other", "warning")]
+        self.assertEqual(self.engine.apply(findings), [None, None])
+        self.assertEqual([x.voltronSeverity for x in findings], ["NotSet", "MEDIUM"])
+
+    def test_upgrade_falls_through_to_later_rules(self):
+        engine = VoltronSeverityEngine(
+            [
+                {"name": "raise", "when": {"toolName": "SnykCode"}, "upgrade": "MEDIUM"},
+                {"name": "pin", "when": {"toolName": "SnykCode"}, "severity": "LOW"},
+            ]
+        )
+        findings = [get_finding("SnykCode", "low"), get_finding("SnykCode", "high")]
+        self.assertEqual(engine.apply(findings), ["raise", "pin"])
+        self.assertEqual([x.voltronSeverity for x in findings], ["MEDIUM", "LOW"])
+
+    def test_fired_counts_from_threads(self):
+        findings = [get_finding("SnykCode", "high", resource="test-repo") for _ in range(50)]
+        threads = [
+            threading.Thread(target=self.engine.apply, args=(list(findings),))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.engine.report()["fired"]["quiet-tests"], 400)
+
+    def test_first_match_wins(self):
+        engine = VoltronSeverityEngine(
+            [
+                {"name": "first", "when": {"toolName": "SnykCode"}, "severity": "LOW"},
+                {"name": "second", "when": {"toolName": "SnykCode"}, "severity": "HIGH"},
+            ]
+        )
+        findings = [get_finding("SnykCode", "medium").findingOutput()]
+        self.assertEqual(engine.apply(findings), ["first"])
+        self.assertEqual(findings[0]["voltronSeverity"], "LOW")
+
+    def test_apply_rows(self):
+        row = tuple(get_finding("SnykCode", "high", resource="test-repo").findingOutput().values())
+        rows, fired = self.engine.apply_rows([row])
+        self.assertEqual(fired, ["quiet-tests"])
+        self.assertEqual(rows[0][8], "INFORMATIONAL")
+        self.assertEqual(rows[0][:5], row[:5])
+        self.assertEqual(rows[0][6:8], row[6:8])
+        # get_finding encodes the payload twice and findingOutput once more
+        document = json.loads(json.loads(json.loads(rows[0][5])))
+        self.assertEqual(document[RULE_KEY], "quiet-tests")
+
+    def test_invalid_rules(self):
+        with self.assertRaises(ValueError):
+            VoltronSeverityEngine([{"name": "x", "severity": "SEVERE"}])
+        with self.assertRaises(ValueError):
+            VoltronSeverityEngine([{"name": "x", "severity": "LOW", "upgrade": "HIGH"}])
+        with self.assertRaises(ValueError):
+            VoltronSeverityEngine([{"name": "x", "when": {"port": {"between": 1}}, "severity": "LOW"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
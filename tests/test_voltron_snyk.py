@@ -10,6 +10,7 @@ from src.voltronsecurity.voltron_snyk import (
     snykOrg,
     snykFinding,
     SnykCodeCollector,
+    SnykCodeCrawler,
 )
 
 
@@ -112,6 +113,70 @@ class TestSnykProject(unittest.TestCase):
             project = snykProject({}, self.org_data)
 
 
+class TestSnykCodeCrawler(unittest.TestCase):
+    def setUp(self):
+        self.collector = MagicMock()
+        self.collector.orgs = ["org1", "org2"]
+        self.collector.orgData = {"org1": MagicMock(id="org1"), "org2": MagicMock(id="org2")}
+
+        def get_projects(org_id, as_dict=False):
+            if org_id == "org2":
+                raise Exception("TestOrgFailure")
+            projects = {}
+            for x in range(3):
+                project = MagicMock()
+                project.id = "{}-p{}".format(org_id, x)
+                project.name = "repo{}".format(x)
+                project.orgData = {"slug": org_id}
+                projects[project.id] = project
+            return projects
+
+        def get_all_code_issues(org, project):
+            return [
+                {
+                    "id": "{}-i{}".format(project.id, x),
+                    "attributes": {"severity": "high"},
+                    "links": {"self": "/issue"},
+                }
+                for x in range(2)
+            ]
+
+        self.collector.get_projects.side_effect = get_projects
+        self.collector.get_all_code_issues.side_effect = get_all_code_issues
+        self.collector.get_finding_data.return_value = {
+            "attributes": {
+                "title": "Test finding",
+                "primaryFilePath": "path/to/file",
+                "primaryRegion": "region",
+            }
+        }
+
+    def test_crawl(self):
+        crawler = SnykCodeCrawler(self.collector, 2, 2, 2, buffer_size=2)
+        findings = list(crawler.crawl())
+        self.assertEqual(len(findings), 6)
+        self.assertTrue(all(x.longTitle == "Test finding" for x in findings))
+        self.assertEqual(crawler.summary["org1"]["projects"], 3)
+        self.assertEqual(crawler.summary["org1"]["issues"], 6)
+        self.assertEqual(len(crawler.summary["org2"]["failures"]), 1)
+        self.collector.session.mount.assert_called_once()
+
+    def test_run_with_sink(self):
+        crawler = SnykCodeCrawler(self.collector, decorate=False)
+        sink = MagicMock()
+        summary = crawler.run(sink, orgs=["org1"])
+        self.assertEqual(sink.call_count, 6)
+        self.assertEqual(list(summary.keys()), ["org1"])
+        self.collector.get_finding_data.assert_not_called()
+
+    def test_crawl_stops_early(self):
+        crawler = SnykCodeCrawler(self.collector, 1, 1, 1, buffer_size=1)
+        crawl = crawler.crawl()
+        next(crawl)
+        crawl.close()
+        self.assertTrue(crawler._stop.is_set())
+
+
 class TestSnykCodeCollector(unittest.TestCase):
     def setUp(self) -> None:
         self.test_key = "abc123"
@@ -153,6 +218,46 @@ class TestSnykCodeCollector(unittest.TestCase):
     def test_scc_get_all_code_issues(self):
         pass
 
+    @patch("src.voltronsecurity.voltron_snyk.SnykCodeCollector.get_finding_data")
+    @patch("src.voltronsecurity.voltron_snyk.SnykCodeCollector.iter_code_issue_pages")
+    def test_scc_stream_code_issues(self, mock_pages, mock_finding_data):
+        handler = SnykCodeCollector(self.test_key, [], {})
+        project = MagicMock()
+        project.id = "p1"
+        project.name = "repo1"
+        project.orgData = {"slug": "org1"}
+        mock_pages.return_value = iter(
+            [
+                [
+                    {
+                        "id": "{}-{}".format(page, x),
+                        "attributes": {"severity": "high"},
+                        "links": {"self": "/issue"},
+                    }
+                    for x in range(3)
+                ]
+                for page in range(2)
+            ]
+        )
+        mock_finding_data.return_value = {
+            "attributes": {
+                "title": "Test finding",
+                "primaryFilePath": "path/to/file",
+                "primaryRegion": "region",
+            }
+        }
+        batches = []
+        stats = handler.stream_code_issues(
+            MagicMock(), project, batches.append, batch_size=4
+        )
+
+        findings = [x for batch in batches for x in batch]
+        self.assertEqual(len(findings), 6)
+        self.assertTrue(all(isinstance(x, VoltronSnykCodeFinding) for x in findings))
+        self.assertEqual(findings[0].resourceId, "repo1")
+        self.assertEqual(findings[0].toolFindingSummary, "Test finding")
+        self.assertEqual(stats["decorate"]["items"], 6)
+
     def test_scc_get_finding_data(self):
         pass
 
@@ -0,0 +1,185 @@
+import asyncio
+import json
+import queue
+import random
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from src.voltronsecurity.voltron_memory import VoltronMemoryQueue
+from src.voltronsecurity.voltron_soak import (
+    VoltronSoakHarness,
+    memory_sink,
+    percentile,
+    postgres_sink,
+    synthetic_message,
+)
+
+
+class TestVoltronSoak(unittest.TestCase):
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile(values, 100), 100)
+        self.assertIsNone(percentile([], 50))
+
+    def test_synthetic_message_reproducible(self):
+        first = synthetic_message(random.Random(1), "run", 0, 3, 32)
+        second = synthetic_message(random.Random(1), "run", 0, 3, 32)
+        self.assertEqual(first["handlerData"], second["handlerData"])
+        self.assertEqual(len(first["handlerData"]["findings"][0]["detail"]), 32)
+
+    def test_run_in_memory(self):
+        sink = memory_sink()
+        harness = VoltronSoakHarness(
+            VoltronMemoryQueue("soak"), sink, messages=50, findings_per_message=2, payload_bytes=16
+        )
+        report = asyncio.run(harness.run())
+
+        json.dumps(report)
+        self.assertTrue(report["results"]["complete"])
+        self.assertEqual(report["results"]["processed"], 50)
+        self.assertEqual(sink.rows, 100)
+        self.assertIsNotNone(report["results"]["latencySeconds"]["p99"])
+        self.assertEqual(report["config"]["sink"], "memory_sink")
+
+    def test_postgres_sink_uses_a_connection_per_write(self):
+        databases = []
+        in_use = set()
+        shared = []
+
+        def connect():
+            db = MagicMock()
+
+            def write_batch(table, rows, onConflict):
+                if db in in_use:
+                    shared.append(db)
+                in_use.add(db)
+                time.sleep(0.02)
+                in_use.discard(db)
+
+            db.write_batch.side_effect = write_batch
+            databases.append(db)
+            return db
+
+        sink = postgres_sink(connect, connections=3)
+        threads = [threading.Thread(target=sink, args=([("row",)],)) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(databases), 3)
+        self.assertEqual(shared, [])
+        self.assertEqual(sum(x.write_batch.call_count for x in databases), 6)
+        harness = VoltronSoakHarness(VoltronMemoryQueue("soak"), sink, notes=["test"])
+        self.assertEqual(harness.config()["sinkConnections"], 3)
+        self.assertEqual(harness.config()["notes"], ["test"])
+
+    def test_sink_failures_are_redelivered(self):
+        calls = []
+
+        def flaky_sink(rows):
+            calls.append(rows)
+            if len(calls) == 1:
+                raise Exception("TestSinkFailure")
+
+        harness = VoltronSoakHarness(
+            VoltronMemoryQueue("soak"), flaky_sink, messages=5, findings_per_message=1
+        )
+        report = asyncio.run(harness.run())
+        self.assertEqual(report["results"]["handlerFailures"], 1)
+        self.assertEqual(report["results"]["processed"], 5)
+
+    def test_run_shares_one_client_and_ids_change_per_run(self):
+        rows = []
+        message_queue = VoltronMemoryQueue("soak")
+        harness = VoltronSoakHarness(
+            message_queue, rows.extend, messages=5, findings_per_message=1, consumers=3
+        )
+        with patch.object(
+            message_queue, "get_client", wraps=message_queue.get_client
+        ) as get_client:
+            first = asyncio.run(harness.run())
+            second = asyncio.run(harness.run())
+        self.assertEqual(get_client.call_count, 2)
+        self.assertNotEqual(first["config"]["runId"], second["config"]["runId"])
+        ids = {x[3] for x in rows}
+        self.assertEqual(len(ids), 10)
+        self.assertTrue(all(x[3].startswith(first["config"]["runId"]) for x in rows[:5]))
+        self.assertTrue(all(x[3].startswith(second["config"]["runId"]) for x in rows[5:]))
+        # Same seed, same payloads
+        self.assertEqual(
+            sorted(json.loads(x[5])["detail"] for x in rows[:5]),
+            sorted(json.loads(x[5])["detail"] for x in rows[5:]),
+        )
+
+    def test_blocking_queue_runs_in_threads(self):
+        broker = queue.Queue()
+        acks = []
+        connections = []
+
+        class FakeChannel:
+            def queue_declare(self, queue, arguments):
+                pass
+
+            def basic_consume(self, queue, on_message_callback, auto_ack):
+                self.callback = on_message_callback
+
+            def basic_ack(self, delivery_tag):
+                acks.append(delivery_tag)
+
+        class FakeConnection:
+            def __init__(self):
+                self.channels = []
+                self.closed = False
+                connections.append(self)
+
+            def channel(self):
+                self.channels.append(FakeChannel())
+                return self.channels[-1]
+
+            def process_data_events(self, time_limit):
+                try:
+                    body = broker.get(timeout=time_limit)
+                except queue.Empty:
+                    return
+                channel = self.channels[-1]
+                channel.callback(channel, SimpleNamespace(delivery_tag=body), None, body)
+
+            def close(self):
+                self.closed = True
+
+        class FakeBlockingQueue:
+            queue_name = "soak"
+            retry_policy = None
+
+            def get_client(self):
+                return FakeConnection()
+
+            async def send_message(self, message, client=None):
+                broker.put(json.dumps(message))
+                return {"success": True, "message": "Sent message."}
+
+            def handle_messages(self, client=None, queue=None):
+                pass
+
+        sink = memory_sink()
+        harness = VoltronSoakHarness(
+            FakeBlockingQueue(), sink, messages=20, findings_per_message=2, consumers=3
+        )
+        report = asyncio.run(harness.run())
+        self.assertTrue(report["results"]["complete"])
+        self.assertEqual(report["config"]["consumerMode"], "threads")
+        self.assertEqual(report["results"]["processed"], 20)
+        self.assertEqual(sink.rows, 40)
+        self.assertEqual(len(acks), 20)
+        # One producer connection plus one per consumer thread, all closed
+        self.assertEqual(len(connections), 4)
+        self.assertTrue(all(x.closed for x in connections))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import asyncio
+import threading
+import unittest
+
+from src.voltronsecurity.voltron_stream import VoltronStreamPipeline, VoltronStreamStage
+
+
+class TestVoltronStreamPipeline(unittest.TestCase):
+    def test_stages_and_batches(self):
+        batches = []
+
+        async def double(x):
+            return x * 2
+
+        pipeline = VoltronStreamPipeline(
+            [
+                VoltronStreamStage("double", double, concurrency=3),
+                VoltronStreamStage("odd", lambda x: None if x % 4 else x),
+            ],
+            sink_batch_size=4,
+        )
+        stats = asyncio.run(pipeline.run(range(20), batches.append))
+
+        self.assertEqual(sorted(x for batch in batches for x in batch), list(range(0, 40, 4)))
+        self.assertTrue(all(len(x) <= 4 for x in batches))
+        self.assertEqual(stats["source"]["items"], 20)
+        self.assertEqual(stats["odd"]["dropped"], 10)
+        self.assertEqual(stats["sink"]["items"], 10)
+
+    def test_stage_failures_are_counted(self):
+        def fail_on_three(x):
+            if x == 3:
+                raise ValueError("bad item")
+            return x
+
+        sink = []
+        pipeline = VoltronStreamPipeline([VoltronStreamStage("check", fail_on_three)])
+        stats = asyncio.run(pipeline.run(range(5), sink.extend))
+        self.assertEqual(sorted(sink), [0, 1, 2, 4])
+        self.assertEqual(stats["check"]["failures"], 1)
+
+    def test_sink_failure_stops_pipeline(self):
+        def sink(batch):
+            raise RuntimeError("db down")
+
+        pipeline = VoltronStreamPipeline([VoltronStreamStage("noop", lambda x: x)])
+        with self.assertRaises(RuntimeError):
+            asyncio.run(pipeline.run(iter(range(1000)), sink))
+
+    def test_backpressure_bounds_source(self):
+        pulled = []
+        release = threading.Event()
+
+        def source():
+            for x in range(1000):
+                pulled.append(x)
+                yield x
+
+        def slow_sink(batch):
+            release.wait(5)
+
+        pipeline = VoltronStreamPipeline(
+            [VoltronStreamStage("noop", lambda x: x, queue_size=2)],
+            sink_batch_size=1,
+            sink_queue_size=2,
+        )
+
+        async def run():
+            task = asyncio.ensure_future(pipeline.run(source(), slow_sink))
+            await asyncio.sleep(0.2)
+            in_flight = len(pulled)
+            release.set()
+            await task
+            return in_flight
+
+        in_flight = asyncio.run(run())
+        # queues (2 + 2), one item per worker and the sink's batch
+        self.assertLess(in_flight, 10)
+        self.assertEqual(len(pulled), 1000)
+
+
+if __name__ == "__main__":
+    unittest.main()
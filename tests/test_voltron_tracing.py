@@ -0,0 +1,250 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock
+
+from src.voltronsecurity.voltron_memory import VoltronMemoryBroker, VoltronMemoryQueue
+from src.voltronsecurity.voltron_pipeline import (
+    VoltronPersistStage,
+    VoltronPipelineStage,
+    VoltronRunTracker,
+    start_run,
+)
+from src.voltronsecurity.voltron_tracing import (
+    TRACE_KEY,
+    VoltronFileSpanExporter,
+    VoltronMemorySpanExporter,
+    VoltronOTLPSpanExporter,
+    VoltronTracer,
+    extract,
+    format_traceparent,
+    parse_traceparent,
+    restore_context,
+    trace_headers,
+)
+from src.voltronsecurity.voltron_wiz import VoltronWizFinding
+
+
+def sample_wiz_issue(issue_id):
+    return {
+        "id": issue_id,
+        "control": {"name": "Public bucket"},
+        "createdAt": "2023-07-08T13:08:04.123456Z",
+        "severity": "HIGH",
+        "entitySnapshot": {"type": "BUCKET", "externalId": "bucket"},
+    }
+
+
+class TestTraceContext(unittest.TestCase):
+    def test_traceparent_round_trip(self):
+        value = format_traceparent("a" * 32, "b" * 16)
+        self.assertEqual(value, "00-{}-{}-01".format("a" * 32, "b" * 16))
+        self.assertEqual(parse_traceparent(value), ("a" * 32, "b" * 16))
+        self.assertIsNone(parse_traceparent("00-{}-{}-01".format("0" * 32, "b" * 16)))
+        self.assertIsNone(parse_traceparent("garbage"))
+        self.assertIsNone(extract({"handlerName": "x"}))
+
+    def test_headers_round_trip(self):
+        message = {TRACE_KEY: {"traceparent": format_traceparent("a" * 32, "b" * 16)}}
+        headers = trace_headers(message)
+        self.assertEqual(headers, {"traceparent": message[TRACE_KEY]["traceparent"]})
+        self.assertEqual(trace_headers({"handlerName": "x"}), {})
+        received = {k.encode(): v.encode() for k, v in headers.items()}
+        self.assertEqual(extract(restore_context({}, received)), ("a" * 32, "b" * 16))
+        self.assertNotIn(TRACE_KEY, restore_context({}, None))
+
+    def test_nested_spans_and_inject(self):
+        exporter = VoltronMemorySpanExporter()
+        tracer = VoltronTracer(exporter, batch_size=10)
+        message = {}
+        with tracer.span("outer") as outer:
+            with tracer.span("inner") as inner:
+                tracer.inject(message)
+        self.assertIsNone(outer.parent_id)
+        self.assertEqual(inner.parent_id, outer.span_id)
+        self.assertEqual(extract(message), (outer.trace_id, inner.span_id))
+
+        with tracer.span("remote", message=message) as remote:
+            pass
+        self.assertEqual(remote.trace_id, outer.trace_id)
+        self.assertEqual(remote.parent_id, inner.span_id)
+
+        self.assertEqual(exporter.documents, [])
+        tracer.flush()
+        self.assertEqual(
+            [x["name"] for x in exporter.spans()], ["inner", "outer", "remote"]
+        )
+
+    def test_error_status(self):
+        exporter = VoltronMemorySpanExporter()
+        tracer = VoltronTracer(exporter, batch_size=1)
+        with self.assertRaises(KeyError):
+            with tracer.span("broken"):
+                raise KeyError("missing")
+        tracer.flush()
+        span = exporter.spans()[0]
+        self.assertEqual(span["status"]["code"], 2)
+        self.assertIn("KeyError", span["status"]["message"])
+
+    def test_export_failure_is_logged(self):
+        exporter = MagicMock()
+        exporter.export.side_effect = ConnectionError("collector down")
+        tracer = VoltronTracer(exporter, batch_size=1)
+        with tracer.span("work"):
+            pass
+        tracer.flush()
+        exporter.export.assert_called_once()
+
+    def test_export_runs_off_the_calling_thread(self):
+        started = threading.Event()
+        release = threading.Event()
+        threads = []
+
+        class SlowExporter:
+            def export(self, spans, service_name):
+                threads.append(threading.current_thread())
+                started.set()
+                release.wait(5)
+
+        tracer = VoltronTracer(SlowExporter(), batch_size=1, max_pending=1)
+        with tracer.span("first"):
+            pass
+        self.assertTrue(started.wait(5))
+        # The first batch is stuck in the exporter, the second waits, the third is dropped;
+        # none of them block the caller
+        with tracer.span("second"):
+            pass
+        with tracer.span("third"):
+            pass
+        self.assertEqual(tracer.dropped, 1)
+        release.set()
+        tracer.close()
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(threading.current_thread(), threads)
+
+
+class TestSpanExporters(unittest.TestCase):
+    def test_file_exporter(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "spans.jsonl")
+            tracer = VoltronTracer(VoltronFileSpanExporter(path), service_name="test")
+            with tracer.span("one", attributes={"voltron.rows": 3}):
+                pass
+            with tracer.span("two"):
+                pass
+            tracer.flush()
+            with open(path, encoding="utf8") as infile:
+                lines = [json.loads(x) for x in infile]
+        self.assertEqual([x["name"] for x in lines], ["one", "two"])
+        self.assertEqual(lines[0]["attributes"], {"voltron.rows": 3})
+        self.assertEqual(lines[0]["service"], "test")
+        self.assertGreaterEqual(lines[0]["durationMs"], 0)
+
+    def test_otlp_exporter(self):
+        exporter = VoltronOTLPSpanExporter("http://localhost:4318/v1/traces")
+        exporter.session = MagicMock()
+        tracer = VoltronTracer(exporter, service_name="test")
+        with tracer.span("publish", attributes={"voltron.children": 2}, kind="producer"):
+            pass
+        tracer.flush()
+        args, kwargs = exporter.session.post.call_args
+        self.assertEqual(args[0], "http://localhost:4318/v1/traces")
+        document = json.loads(kwargs["data"])
+        resource = document["resourceSpans"][0]
+        self.assertEqual(
+            resource["resource"]["attributes"][0]["value"]["stringValue"], "test"
+        )
+        span = resource["scopeSpans"][0]["spans"][0]
+        self.assertEqual(span["kind"], 4)
+        self.assertEqual(
+            span["attributes"], [{"key": "voltron.children", "value": {"intValue": "2"}}]
+        )
+
+
+class TestPipelineTracing(unittest.TestCase):
+    def test_trace_follows_messages(self):
+        async def run():
+            exporter = VoltronMemorySpanExporter()
+            tracer = VoltronTracer(exporter)
+            tracker = VoltronRunTracker()
+            broker = VoltronMemoryBroker()
+            trigger_queue = VoltronMemoryQueue("trigger", broker)
+            findings_queue = VoltronMemoryQueue("findings", broker)
+            db = MagicMock()
+
+            run_id = await start_run(
+                tracker, trigger_queue, "inventory-wiz-findings", tracer=tracer
+            )
+            envelope = await broker.get_queue("trigger").get()
+            # The trace context travels in the transport headers, not the body
+            self.assertNotIn(TRACE_KEY, json.loads(envelope["body"]))
+            trigger = restore_context(json.loads(envelope["body"]), envelope["headers"])
+
+            stage = VoltronPipelineStage(
+                tracker, findings_queue, "persist-wiz-findings", tracer=tracer
+            )
+            stage.expand = lambda message: [
+                {"findings": [sample_wiz_issue("a")]},
+                {"findings": [sample_wiz_issue("b")]},
+            ]
+            await stage.process(trigger)
+
+            persist = VoltronPersistStage(
+                VoltronWizFinding, db, "VOLTRON_FINDINGS", tracker, tracer=tracer
+            )
+            findings_queue.process_message = persist.process
+            await findings_queue.handle_messages(max_message_count=2, max_wait_time=0.1)
+            tracer.flush()
+            return exporter.spans(), tracker.is_complete(run_id)
+
+        spans, complete = asyncio.run(run())
+        self.assertTrue(complete)
+        root = [x for x in spans if x["name"] == "start_run"][0]
+        self.assertNotIn("parentSpanId", root)
+        self.assertEqual({x["traceId"] for x in spans}, {root["traceId"]})
+        by_id = {x["spanId"]: x for x in spans}
+        names = {}
+        for x in spans:
+            names.setdefault(x["name"], []).append(x)
+        self.assertEqual(len(names["persist"]), 2)
+
+        publish = names["publish"][0]
+        self.assertEqual(by_id[publish["parentSpanId"]]["name"], "process_results")
+        stage_process = [x for x in names["process"] if x["parentSpanId"] == root["spanId"]]
+        self.assertEqual(len(stage_process), 1)
+        run_query = [
+            x for x in names["run_query"] if x["parentSpanId"] == stage_process[0]["spanId"]
+        ]
+        self.assertEqual(len(run_query), 1)
+        # Each persisted batch continues the trace from the publish span
+        for persist in names["persist"]:
+            persist_query = by_id[persist["parentSpanId"]]
+            consumer = by_id[persist_query["parentSpanId"]]
+            self.assertEqual(consumer["name"], "process")
+            self.assertEqual(consumer["parentSpanId"], publish["spanId"])
+
+    def test_untraced_messages_have_no_context(self):
+        async def run():
+            broker = VoltronMemoryBroker()
+            queue = VoltronMemoryQueue("plain", broker)
+            await queue.send_message(
+                {
+                    "handlerName": "x",
+                    "handlerConfig": {},
+                    "handlerData": {},
+                    "messageSource": "test",
+                    "startTime": 1,
+                }
+            )
+            return await broker.get_queue("plain").get()
+
+        envelope = asyncio.run(run())
+        self.assertNotIn(TRACE_KEY, json.loads(envelope["body"]))
+        self.assertEqual(envelope["headers"], {})
+
+
+if __name__ == "__main__":
+    unittest.main()
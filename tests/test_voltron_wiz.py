@@ -0,0 +1,142 @@
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+
+from src.voltronsecurity.voltron_wiz import (
+    ISSUE_PROFILES,
+    VoltronWizFinding,
+    WizBaseApi,
+    WizCollector,
+    WizMultiTenantCollector,
+)
+
+
+def sample_wiz_issue(issue_id="issue1"):
+    return {
+        "id": issue_id,
+        "control": {"id": "c1", "name": "Public bucket"},
+        "createdAt": "2023-07-08T13:08:04.123456Z",
+        "severity": "HIGH",
+        "entitySnapshot": {"type": "BUCKET", "externalId": "bucket"},
+    }
+
+
+class TestWizBaseApi(unittest.TestCase):
+    @patch("src.voltronsecurity.voltron_wiz.WizBaseApi.get_token", return_value="token")
+    def test_gen_client_compression(self, mock_token):
+        api = WizBaseApi()
+        client, session = api.gen_client("id", "secret")
+        self.assertEqual(client.transport.headers["Accept-Encoding"], "gzip, deflate")
+        self.assertEqual(client.transport.headers["Authorization"], "Bearer token")
+
+        client, session = api.gen_client("id", "secret", compress=False)
+        self.assertEqual(client.transport.headers["Accept-Encoding"], "identity")
+
+
+class TestWizCollector(unittest.TestCase):
+    def get_collector(self, **kwargs):
+        with patch(
+            "src.voltronsecurity.voltron_wiz.WizBaseApi.gen_client",
+            return_value=(MagicMock(), MagicMock()),
+        ):
+            return WizCollector("id", "secret", **kwargs)
+
+    def test_issue_profiles(self):
+        collector = self.get_collector(issue_profile="inventory")
+        query, name, variables = collector.issues_query("project1")
+        self.assertIs(query, collector.issue_document("inventory"))
+        self.assertEqual(variables["filterBy"]["project"], ["project1"])
+
+        full, _, _ = collector.issues_query("project1", profile="full")
+        self.assertIsNot(full, query)
+        self.assertEqual(len(collector._issue_queries), 2)
+
+    def test_custom_and_unknown_profiles(self):
+        collector = self.get_collector()
+        custom = "fragment IssueDetails on Issue { id severity }"
+        collector.issue_document(custom)
+        with self.assertRaises(ValueError):
+            collector.issue_document("everything")
+
+    def test_inventory_profile_covers_finding(self):
+        # Every field VoltronWizFinding reads has to be selected by the inventory profile
+        for field in ("id", "severity", "createdAt", "control { id name }", "externalId", "type"):
+            self.assertIn(field, ISSUE_PROFILES["inventory"])
+        finding = VoltronWizFinding(sample_wiz_issue())
+        self.assertEqual(json.loads(finding.toolFindingJson)["id"], "issue1")
+
+
+class TestWizMultiTenantCollector(unittest.TestCase):
+    def setUp(self):
+        self.tenants = [
+            {"name": "us", "client_id": "a", "client_secret": "a"},
+            {
+                "name": "eu",
+                "client_id": "b",
+                "client_secret": "b",
+                "wiz_url": "https://api.eu1.app.wiz.io",
+                "rate": 2,
+            },
+            {"name": "broken", "client_id": "c", "client_secret": "c"},
+        ]
+
+    def get_collector(self, tenant):
+        if tenant["name"] == "broken":
+            raise Exception("TestAuthFailure")
+        collector = MagicMock()
+        collector.get_projects.return_value = [{"id": "p1"}, {"id": "p2"}]
+        collector.iter_issue_pages.side_effect = lambda project_id: iter(
+            [[sample_wiz_issue("{}-{}-{}".format(tenant["name"], project_id, x)) for x in range(2)]]
+        )
+        return collector
+
+    def test_crawl_tags_tenants(self):
+        multi = WizMultiTenantCollector(self.tenants, buffer_size=2)
+        with patch.object(multi, "get_collector", side_effect=self.get_collector):
+            findings = list(multi.crawl())
+
+        self.assertEqual(len(findings), 8)
+        self.assertEqual({x.tenant for x in findings}, {"us", "eu"})
+        for finding in findings:
+            self.assertTrue(finding.toolFindingId.startswith(finding.tenant))
+            self.assertEqual(json.loads(finding.toolFindingJson)["voltronTenant"], finding.tenant)
+        self.assertEqual(multi.summary["eu"]["projects"], 2)
+        self.assertEqual(multi.summary["us"]["issues"], 4)
+        self.assertEqual(len(multi.summary["broken"]["failures"]), 1)
+
+    def test_failed_page_counts_as_failure(self):
+        def get_collector(tenant):
+            collector = self.get_collector(tenant)
+
+            def pages(project_id):
+                yield [sample_wiz_issue("{}-a".format(project_id))]
+                if project_id == "p2":
+                    raise Exception("401: Unauthorized")
+
+            collector.iter_issue_pages.side_effect = pages
+            return collector
+
+        multi = WizMultiTenantCollector(self.tenants[:1])
+        with patch.object(multi, "get_collector", side_effect=get_collector):
+            summary = multi.run(MagicMock())
+        self.assertEqual(summary["us"]["projects"], 1)
+        self.assertEqual(summary["us"]["issues"], 2)
+        self.assertEqual(len(summary["us"]["failures"]), 1)
+
+    @patch("src.voltronsecurity.voltron_wiz.WizBaseApi.gen_client", return_value=(MagicMock(), MagicMock()))
+    def test_isolated_collectors(self, mock_gen_client):
+        multi = WizMultiTenantCollector(self.tenants)
+        us = multi.get_collector(self.tenants[0])
+        eu = multi.get_collector(self.tenants[1])
+        self.assertIs(us, multi.get_collector(self.tenants[0]))
+        self.assertEqual(eu.wiz_api.base_url, "https://api.eu1.app.wiz.io")
+        self.assertEqual(eu.wiz_api.rate_limiter.rate, 2)
+        self.assertIsNot(us.wiz_api.rate_limiter, eu.wiz_api.rate_limiter)
+
+    def test_duplicate_names(self):
+        with self.assertRaises(ValueError):
+            WizMultiTenantCollector([self.tenants[0], self.tenants[0]])
+
+
+if __name__ == "__main__":
+    unittest.main()